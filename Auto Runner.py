@@ -1,18 +1,28 @@
 import config
+import argparse
 import requests
 import time
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from decimal import Decimal, ROUND_DOWN
 import os
 from pybit.unified_trading import HTTP
 import telebot
+from exchange_cache import TTL_POR_DEFECTO, cargar_cacheado, nombre_de_cache
 
 
 # ========== CONFIGURACIÓN ==========
-SYMBOL = input("➡️  ticker: ").strip().upper() + "USDT"
-API_BASE = "http://localhost:8000"
-AGRUPACION = float(input("➡️  agrupación: "))  # Agrupación para el ticker
+SYMBOL = None  # --ticker, AUTORUNNER_TICKER, config.ticker o se pide al iniciar (main)
+API_BASE = os.environ.get("ORDERBOOK_API_URL", "http://localhost:8000").rstrip("/")
+# Exchanges (se pueden apuntar al simulador local: simulator.py)
+BINANCE_REST_URL = os.environ.get("BINANCE_REST_URL", "https://fapi.binance.com").rstrip("/")
+BYBIT_REST_URL = os.environ.get("BYBIT_REST_URL")
+AGRUPACION = None  # Agrupación para el ticker (igual que SYMBOL: argumento, entorno, config o consola)
 CHECK_INTERVAL = 1.5 # segundos
+CHECK_INTERVAL_LOCAL = 0.1  # segundos, cuando el precio sale de la API local (/price)
+ESPERA_ORDER_BOOK_MAX = 60  # segundos a esperar al arrancar que la API local tenga el libro listo
+# Metadatos de instrumentos (tick size, qty step) cacheados en disco (AUTORUNNER_CACHE_TTL=0 lo desactiva)
+INSTRUMENTOS_CACHE_TTL = float(os.environ.get("AUTORUNNER_CACHE_TTL", TTL_POR_DEFECTO))
 
 # Trading
 MONTO_OPERACION = 25  # USDT por operación
@@ -29,6 +39,15 @@ chat_id = config.chat_id
 # Estado de posiciones
 tracking_posiciones = {}
 session = None
+instrumentos = {}  # symbol -> {"tickSize", "qtyStep"} (en memoria además del cache en disco)
+
+# Dependencias pesadas del modelo: se importan una sola vez al cargarlo (ver cargar_modelo_ml)
+pd = None
+np = None
+
+# Conexión persistente con la API local (el precio se consulta varias veces por segundo)
+sesion_api = requests.Session()
+precio_local = False  # Si el último precio salió de la API local
 
 # ========== FUNCIÓN TELEGRAM =========
 def enviar_telegram(mensaje):
@@ -47,13 +66,25 @@ def inicializar_bybit():
         api_key=config.api_key,
         api_secret=config.api_secret,
     )
+    if BYBIT_REST_URL:
+        session.endpoint = BYBIT_REST_URL.rstrip("/")
+
+def obtener_instrumento(symbol):
+    """Tick size y qty step del símbolo en Bybit (memoria, luego cache en disco, luego API)"""
+    instrumento = instrumentos.get(symbol)
+    if instrumento is None:
+        def descargar():
+            info = session.get_instruments_info(category="linear", symbol=symbol)["result"]["list"][0]
+            return {"tickSize": info["priceFilter"]["tickSize"], "qtyStep": info["lotSizeFilter"]["qtyStep"]}
+
+        nombre = nombre_de_cache(f"bybit_{symbol}", BYBIT_REST_URL or "https://api.bybit.com")
+        instrumento = instrumentos[symbol] = cargar_cacheado(nombre, descargar, INSTRUMENTOS_CACHE_TTL)
+    return instrumento
 
 def get_tick_size(symbol):
     """Obtiene el tick size del símbolo"""
     try:
-        info = session.get_instruments_info(category="linear", symbol=symbol)
-        tick_size = Decimal(info["result"]["list"][0]["priceFilter"]["tickSize"])
-        return tick_size
+        return Decimal(obtener_instrumento(symbol)["tickSize"])
     except Exception as e:
         print(f"❌ Error obteniendo tick size: {e}")
         return Decimal("0.01")  # Valor por defecto
@@ -86,8 +117,7 @@ def qty_step(symbol, monto_usdt):
         price = Decimal(ticker["result"]["list"][0]["lastPrice"])
         
         # Obtener qty step
-        info = session.get_instruments_info(category="linear", symbol=symbol)
-        qty_step_value = Decimal(info["result"]["list"][0]["lotSizeFilter"]["qtyStep"])
+        qty_step_value = Decimal(obtener_instrumento(symbol)["qtyStep"])
         
         # Calcular cantidad
         qty = Decimal(str(monto_usdt)) / price
@@ -113,10 +143,25 @@ def agrupar_precio(price):
     agrupado = (price_decimal / agrup_decimal).quantize(Decimal('1'), rounding=ROUND_DOWN) * agrup_decimal
     return float(agrupado)
 
+def obtener_precio_local():
+    """Último precio desde la API local (streams bookTicker/aggTrade) o None si no está disponible"""
+    try:
+        resp = sesion_api.get(f"{API_BASE}/price/{SYMBOL}", timeout=1)
+        if resp.status_code == 200:
+            return float(resp.json()["price"])
+    except:
+        pass
+    return None
+
 def obtener_precio_actual():
-    """Obtiene precio actual de Binance"""
+    """Obtiene precio actual de la API local y, si no está disponible, de Binance"""
+    global precio_local
+    precio = obtener_precio_local()
+    precio_local = precio is not None
+    if precio_local:
+        return precio
     try:
-        resp = requests.get(f"https://fapi.binance.com/fapi/v1/ticker/price?symbol={SYMBOL}", timeout=5)
+        resp = requests.get(f"{BINANCE_REST_URL}/fapi/v1/ticker/price?symbol={SYMBOL}", timeout=5)
         return float(resp.json()["price"])
     except:
         return None
@@ -131,6 +176,30 @@ def obtener_orderbook():
         pass
     return None
 
+def obtener_bloques(tick_size):
+    """Obtiene los top 10 bloques ya agregados por la API local (None si no está disponible)"""
+    try:
+        resp = requests.get(
+            f"{API_BASE}/orderbooks/{SYMBOL}/blocks",
+            params={"grouping": AGRUPACION, "top": 10},
+            timeout=5,
+        )
+        if resp.status_code != 200:
+            return None
+        data = resp.json()
+    except:
+        return None
+
+    # ✅ AJUSTAR AL TICK SIZE (igual que calcular_bloques)
+    bloques_long = [{'precio': adjust_price_to_tick(b['precio'], tick_size), 'volumen': b['volumen']} for b in data['long']]
+    bloques_short = [{'precio': adjust_price_to_tick(b['precio'], tick_size), 'volumen': b['volumen']} for b in data['short']]
+
+    # Ordenar por precio (LONG: mayor a menor, SHORT: menor a mayor)
+    bloques_long.sort(key=lambda x: x['precio'], reverse=True)
+    bloques_short.sort(key=lambda x: x['precio'])
+
+    return bloques_long, bloques_short
+
 def calcular_bloques(order_book, tick_size):
     """Calcula top 10 bloques con precio promedio ponderado ajustado al tick size"""
     bid_ranges = defaultdict(lambda: {'total_qty': 0, 'price_count': {}})
@@ -181,9 +250,13 @@ def calcular_bloques(order_book, tick_size):
 
 # ========== MACHINE LEARNING ==========
 def cargar_modelo_ml():
-    """Carga el modelo ML entrenado"""
+    """Carga el modelo ML entrenado y deja importados pandas/numpy para predecir_mejor_bloque"""
+    global pd, np
     try:
         import joblib
+        import numpy
+        import pandas
+        pd, np = pandas, numpy
         if os.path.exists('modelo_orderbook_bloques.pkl'):
             modelo = joblib.load('modelo_orderbook_bloques.pkl')
             scaler = joblib.load('scaler_orderbook.pkl')
@@ -202,9 +275,6 @@ def predecir_mejor_bloque(bloques, precio_actual, es_long, modelo, scaler, featu
         return None
     
     try:
-        import pandas as pd
-        import numpy as np
-        
         # Crear features para cada bloque
         datos = []
         for i, bloque in enumerate(bloques, 1):
@@ -278,7 +348,8 @@ def monitorear_precio(entrada_long, entrada_short):
     precio_anterior = obtener_precio_actual()
     
     while True:
-        time.sleep(CHECK_INTERVAL)
+        # Con el precio local el toque se detecta casi al instante sin costo de REST externo
+        time.sleep(CHECK_INTERVAL_LOCAL if precio_local else CHECK_INTERVAL)
         precio_actual = obtener_precio_actual()
         
         if precio_actual is None:
@@ -565,20 +636,64 @@ Precio actual: <b>${last_price}</b>
         time.sleep(10)
 
 # ========== MAIN ==========
+def configurar_ticker():
+    """Ticker y agrupación de --ticker/--agrupacion, AUTORUNNER_TICKER/AUTORUNNER_AGRUPACION o
+    `ticker`/`agrupacion` en config.py (en ese orden); lo que falte se pide por consola"""
+    global SYMBOL, AGRUPACION
+    parser = argparse.ArgumentParser(description="Bot ML + Bybit sobre la API local de order books")
+    parser.add_argument("--ticker", help="BTC, ETH... (o AUTORUNNER_TICKER)")
+    parser.add_argument("--agrupacion", type=float, help="agrupación de precios (o AUTORUNNER_AGRUPACION)")
+    args = parser.parse_args()
+
+    ticker = args.ticker or os.environ.get("AUTORUNNER_TICKER") or getattr(config, "ticker", None)
+    agrupacion = args.agrupacion or os.environ.get("AUTORUNNER_AGRUPACION") or getattr(config, "agrupacion", None)
+    if not ticker:
+        ticker = input("➡️  ticker: ")
+    if not agrupacion:
+        agrupacion = input("➡️  agrupación: ")
+
+    SYMBOL = ticker.strip().upper()
+    if not SYMBOL.endswith("USDT"):
+        SYMBOL += "USDT"
+    AGRUPACION = float(agrupacion)
+
+def esperar_order_book():
+    """Espera (poco) a que la API local tenga el libro listo: al arrancar los dos procesos juntos
+    el primer análisis sale en cuanto hay libro en vez de tras los reintentos de 10 s"""
+    inicio = time.time()
+    while time.time() - inicio < ESPERA_ORDER_BOOK_MAX:
+        try:
+            resp = sesion_api.get(f"{API_BASE}/symbols", timeout=1)
+            if SYMBOL in resp.json().get("initialized", []):
+                print(f"✅ Order book de {SYMBOL} listo ({time.time() - inicio:.1f}s)\n")
+                return True
+        except:
+            pass
+        time.sleep(0.2)
+    print(f"⚠️  El order book de {SYMBOL} no está listo tras {ESPERA_ORDER_BOOK_MAX}s, se sigue igual\n")
+    return False
+
 def main():
+    configurar_ticker()
+
     print("\n" + "="*50)
     print("🤖 BOT ML + BYBIT TRADING")
     print("="*50 + "\n")
-    
+
+    # El modelo (joblib, sklearn, pandas, numpy) se carga en paralelo con lo que espera red
+    carga_modelo = ThreadPoolExecutor(max_workers=1).submit(cargar_modelo_ml)
+
     # Inicializar Bybit
     inicializar_bybit()
     
     # ✅ OBTENER TICK SIZE DEL SÍMBOLO
     tick_size = get_tick_size(SYMBOL)
     print(f"📏 Tick size de {SYMBOL}: {tick_size}\n")
-    
+
+    esperar_order_book()
+
     # Cargar modelo ML
-    modelo, scaler, features = cargar_modelo_ml()
+    modelo, scaler, features = carga_modelo.result()
     
     if modelo is None:
         print("❌ No se puede iniciar sin modelo ML")
@@ -601,15 +716,19 @@ def main():
             
             print(f"💰 {SYMBOL}: ${precio_actual:,.4f}")
             
-            # Obtener order book
-            order_book = obtener_orderbook()
-            if not order_book:
-                print("❌ Sin order book")
-                time.sleep(10)
-                continue
-            
-            # ✅ CALCULAR BLOQUES CON TICK SIZE
-            bloques_long, bloques_short = calcular_bloques(order_book, tick_size)
+            # Bloques agregados en el servidor; si la API no los ofrece, calcularlos del libro completo
+            bloques = obtener_bloques(tick_size)
+            if bloques is None:
+                # Obtener order book
+                order_book = obtener_orderbook()
+                if not order_book:
+                    print("❌ Sin order book")
+                    time.sleep(10)
+                    continue
+
+                # ✅ CALCULAR BLOQUES CON TICK SIZE
+                bloques = calcular_bloques(order_book, tick_size)
+            bloques_long, bloques_short = bloques
             
             if len(bloques_long) < 10 or len(bloques_short) < 10:
                 print(f"⚠️  Bloques insuficientes (LONG: {len(bloques_long)}, SHORT: {len(bloques_short)})")
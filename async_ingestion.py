@@ -0,0 +1,103 @@
+import asyncio
+
+from ws_shards import ShardedStreamManager
+
+try:
+    import websockets
+except ImportError:  # Dependencia opcional, solo necesaria en modo async
+    websockets = None
+
+
+class AsyncShardedStreamManager(ShardedStreamManager):
+    """Variante asyncio del gestor de shards: cada conexión es una tarea del event loop.
+
+    Comparte el reparto de símbolos, las URLs combinadas y el rebalanceo con
+    ShardedStreamManager, pero lee los mensajes con `websockets` dentro del mismo
+    loop que la API, sin hilos por conexión. `on_message` se llama en el hilo del
+    loop, así que no debe bloquear.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.tasks = []
+
+    def start(self):
+        """Crea una tarea por shard en el loop actual y devuelve la lista de tareas"""
+        if websockets is None:
+            raise RuntimeError("El modo async requiere el paquete 'websockets' (pip install websockets)")
+
+        self._running = True
+        print(f"🚀 Iniciando {len(self.shards)} conexión(es) WebSocket async para "
+              f"{sum(len(s.symbols) for s in self.shards)} símbolos "
+              f"(máx. {self.symbols_por_conexion} símbolos por conexión)...", flush=True)
+        loop = asyncio.get_running_loop()
+        self.tasks = [loop.create_task(self._run_shard_async(shard)) for shard in self.shards]
+        return self.tasks
+
+    def stop(self):
+        self._running = False
+        for task in self.tasks:
+            task.cancel()
+
+    async def _run_shard_async(self, shard):
+        backoff = self.backoff_inicial
+        etiqueta = f"Shard #{shard.shard_id}"
+
+        while self._running:
+            with self.lock:
+                if not shard.symbols:
+                    self.shards.remove(shard)
+                    print(f"🧹 [{etiqueta}] Sin símbolos, cerrando", flush=True)
+                    return
+                symbols = list(shard.symbols)
+
+            shard.conexiones += 1
+            reconexion = shard.conexiones > 1
+            if reconexion:
+                print(f"🔄 [{etiqueta}] Reconectando {len(symbols)} símbolos (intento #{shard.conexiones})...", flush=True)
+            else:
+                print(f"🔌 [{etiqueta}] Conectando {len(symbols)} símbolos...", flush=True)
+
+            try:
+                async with websockets.connect(self.url_de(shard), max_queue=None) as ws:
+                    shard.ws = ws
+                    shard.connected = True
+                    backoff = self.backoff_inicial
+                    print(f"✅ [{etiqueta}] WebSocket conectado ({len(symbols)} símbolos)", flush=True)
+                    if reconexion and self.on_resubscribed:
+                        self.on_resubscribed(symbols)
+
+                    on_message = self.on_message
+                    async for mensaje in ws:
+                        on_message(ws, mensaje)
+                print(f"❌ [{etiqueta}] WebSocket desconectado", flush=True)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️ [{etiqueta}] Error WS: {e}", flush=True)
+
+            shard.connected = False
+            shard.ws = None
+            if not self._running:
+                return
+
+            # Solo se invalidan los símbolos de este shard
+            with self.lock:
+                caidos = list(shard.symbols)
+            if self.on_shard_down:
+                self.on_shard_down(caidos)
+
+            await self._rebalancear_async(shard)
+
+            print(f"⏳ [{etiqueta}] Esperando {backoff:.1f}s antes de reconectar...", flush=True)
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, self.backoff_maximo)
+
+    async def _rebalancear_async(self, shard_caido):
+        """Igual que _rebalancear pero enviando el SUBSCRIBE desde el loop"""
+        for destino, mover, request_id in self._planificar_migraciones(shard_caido):
+            try:
+                await destino.ws.send(self._mensaje_subscribe(mover, request_id))
+                self._migracion_ok(shard_caido, destino, mover)
+            except Exception as e:
+                self._migracion_fallida(shard_caido, destino, mover, e)
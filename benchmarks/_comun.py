@@ -0,0 +1,97 @@
+"""Utilidades compartidas por los benchmarks (carga de módulos y datos sintéticos)"""
+import json
+import os
+import random
+import sys
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if RAIZ not in sys.path:
+    sys.path.insert(0, RAIZ)
+
+from script_loader import cargar_order_book, cargar_script  # noqa: E402,F401 (los benchmarks los importan desde acá)
+
+
+def percentil(valores, p):
+    """Percentil p (0-100) de una lista de valores"""
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    indice = min(len(ordenados) - 1, max(0, round(p / 100 * (len(ordenados) - 1))))
+    return ordenados[indice]
+
+
+class GeneradorDepth:
+    """Genera snapshots y depth updates sintéticos de Binance Futures con U/u/pu correctos"""
+
+    def __init__(self, symbol, mid=50000.0, tick_size=0.1, niveles=1000, seed=None):
+        self.symbol = symbol
+        self.tick_size = tick_size
+        self.decimales = len(repr(tick_size).partition('.')[2]) if tick_size < 1 else 0
+        self.mid_tick = round(mid / tick_size)
+        self.niveles = niveles
+        self.random = random.Random(seed)
+        self.u = self.random.randint(10 ** 9, 2 * 10 ** 9)
+
+    def precio(self, tick):
+        return f"{tick * self.tick_size:.{self.decimales}f}"
+
+    def qty(self):
+        return f"{self.random.uniform(0.001, 50):.3f}"
+
+    def snapshot(self):
+        """Snapshot REST con `niveles` niveles por lado"""
+        # Como en Binance, el lastUpdateId cae dentro del rango [U, u] del siguiente evento
+        return {
+            "lastUpdateId": self.u + 1,
+            "E": int(time.time() * 1000),
+            "T": int(time.time() * 1000),
+            "bids": [[self.precio(self.mid_tick - i), self.qty()] for i in range(1, self.niveles + 1)],
+            "asks": [[self.precio(self.mid_tick + i), self.qty()] for i in range(1, self.niveles + 1)],
+        }
+
+    def evento(self, max_niveles=10):
+        """Siguiente depth update (payload 'data' del stream combinado)"""
+        rnd = self.random
+        b, a = [], []
+        for _ in range(rnd.randint(1, max_niveles)):
+            distancia = int(rnd.expovariate(1 / 30)) + 1
+            if rnd.random() < 0.02:
+                distancia = self.niveles + rnd.randint(1, 200)
+            qty = "0.000" if rnd.random() < 0.2 else self.qty()
+            if rnd.random() < 0.5:
+                b.append([self.precio(self.mid_tick - distancia), qty])
+            else:
+                a.append([self.precio(self.mid_tick + distancia), qty])
+        pu = self.u
+        self.u += rnd.randint(1, 20)
+        ahora = int(time.time() * 1000)
+        return {
+            "e": "depthUpdate", "E": ahora, "T": ahora, "s": self.symbol,
+            "U": pu + 1, "u": self.u, "pu": pu, "b": b, "a": a,
+        }
+
+    def mensaje(self, data=None):
+        """Mensaje crudo tal como llega por /stream?streams="""
+        data = data or self.evento()
+        return json.dumps({"stream": f"{self.symbol.lower()}@depth@100ms", "data": data})
+
+    def mensaje_book_ticker(self):
+        """Mensaje de <symbol>@bookTicker con el mejor nivel alrededor del mid"""
+        ahora = int(time.time() * 1000)
+        data = {
+            "e": "bookTicker", "u": self.u, "E": ahora, "T": ahora, "s": self.symbol,
+            "b": self.precio(self.mid_tick - 1), "B": self.qty(),
+            "a": self.precio(self.mid_tick + 1), "A": self.qty(),
+        }
+        return json.dumps({"stream": f"{self.symbol.lower()}@bookTicker", "data": data})
+
+
+def inicializar_libros(ob, generadores):
+    """Configura e inicializa los libros de `order book.py` con snapshots sintéticos"""
+    for gen in generadores:
+        ob.tick_sizes[gen.symbol] = str(gen.tick_size)
+    ob.configurar_simbolos([gen.symbol for gen in generadores])
+    for gen in generadores:
+        ob.cargar_snapshot(gen.symbol, gen.snapshot())
+        ob.process_buffer(gen.symbol)
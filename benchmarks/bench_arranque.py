@@ -0,0 +1,173 @@
+"""Benchmark: arranque en frío de `order book.py` (y de `Auto Runner.py` si sus dependencias están).
+
+Lanza los scripts como procesos nuevos contra el simulador local, con latencia REST
+para imitar un exchange remoto, y mide desde el lanzamiento hasta el primer libro
+listo y hasta todos los libros listos (/health). Tres formas de arrancar:
+  antes           símbolos por stdin (el camino interactivo) y sin cache de exchangeInfo
+  cache frío      --simbolos, cache de exchangeInfo vacío (se descarga y se guarda)
+  cache caliente  --simbolos, exchangeInfo desde el cache en disco
+
+`Auto Runner.py` se mide hasta su primera señal (predicción LONG/SHORT) si se puede
+importar (pybit, telebot, joblib, pandas...) y se omite si no.
+
+Uso:
+    python benchmarks/bench_arranque.py [--simbolos 50] [--latencia-ms 150] [--repeticiones 3]
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+from _comun import RAIZ, cargar_script
+from bench_simulador import esperar, puerto_libre
+
+
+def medir_order_book(simbolos, entorno, stdin=None, argumentos=(), timeout=60):
+    """(s hasta el primer libro listo, s hasta todos) desde el lanzamiento del proceso"""
+    puerto = puerto_libre()
+    inicio = time.perf_counter()
+    proceso = subprocess.Popen(
+        [sys.executable, os.path.join(RAIZ, "order book.py"), "--puerto", str(puerto), *argumentos],
+        stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env=entorno, text=True,
+    )
+    if stdin is not None:
+        proceso.stdin.write(stdin)
+    proceso.stdin.close()
+
+    primero = []
+
+    def inicializados():
+        try:
+            cantidad = requests.get(f"http://127.0.0.1:{puerto}/health", timeout=1).json()["initialized"]
+        except (requests.RequestException, ValueError, KeyError):
+            return 0
+        if cantidad and not primero:
+            primero.append(time.perf_counter() - inicio)
+        return cantidad
+
+    try:
+        listo = esperar(lambda: inicializados() == len(simbolos), timeout, paso=0.02)
+        assert listo is not None, "el order book no terminó de inicializar"
+        return primero[0], time.perf_counter() - inicio, puerto
+    finally:
+        proceso.terminate()
+        proceso.wait(10)
+
+
+def medir_auto_runner(entorno, timeout=120):
+    """s desde el lanzamiento hasta la primera señal, o None si no llegó"""
+    inicio = time.perf_counter()
+    proceso = subprocess.Popen(
+        [sys.executable, "-u", os.path.join(RAIZ, "Auto Runner.py"), "--ticker", "BTC", "--agrupacion", "10"],
+        stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env=entorno, text=True,
+        cwd=RAIZ,
+    )
+    senal = []
+
+    def leer():
+        for linea in proceso.stdout:
+            if "🟢 LONG" in linea or "🔴 SHORT" in linea or "❌ ML no pudo" in linea:
+                senal.append(time.perf_counter() - inicio)
+                return
+
+    lector = threading.Thread(target=leer, daemon=True)
+    lector.start()
+    lector.join(timeout)
+    proceso.terminate()
+    proceso.wait(10)
+    return senal[0] if senal else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--simbolos', type=int, default=50)
+    parser.add_argument('--latencia-ms', type=float, default=150, help='latencia REST del simulador')
+    parser.add_argument('--repeticiones', type=int, default=3)
+    args = parser.parse_args()
+
+    puerto_sim = puerto_libre()
+    url = f"127.0.0.1:{puerto_sim}"
+    simulador = subprocess.Popen(
+        [sys.executable, os.path.join(RAIZ, "simulator.py"), "--simbolos", str(args.simbolos),
+         "--puerto", str(puerto_sim), "--latencia-rest-ms", str(args.latencia_ms), "--peso-maximo", "1000000"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    cache = tempfile.mkdtemp(prefix="obcache_")
+    try:
+        def simulador_listo():
+            try:
+                return requests.get(f"http://{url}/sim/estado", timeout=1).ok
+            except requests.RequestException:
+                return False
+
+        assert esperar(simulador_listo, 30) is not None, "el simulador no arrancó"
+        nombres = [s['symbol'] for s in requests.get(f"http://{url}/fapi/v1/exchangeInfo", timeout=10).json()['symbols']]
+        entorno = {**os.environ, "BINANCE_REST_URL": f"http://{url}", "BINANCE_WS_URL": f"ws://{url}",
+                   "BYBIT_REST_URL": f"http://{url}", "ORDERBOOK_CACHE_DIR": cache,
+                   "ORDERBOOK_SNAPSHOT_LIMIT": "100"}
+        entorno.pop("ORDERBOOK_SIMBOLOS", None)
+
+        modos = {
+            "antes (stdin, sin cache)": dict(stdin=",".join(nombres) + "\ns\n",
+                                             entorno={**entorno, "ORDERBOOK_CACHE_TTL": "0"}),
+            "cache frío (--simbolos)": dict(argumentos=("--simbolos", ",".join(nombres)), limpiar=True),
+            "cache caliente (--simbolos)": dict(argumentos=("--simbolos", ",".join(nombres))),
+        }
+        resultados = {}
+        for nombre, modo in modos.items():
+            tiempos = []
+            for _ in range(args.repeticiones):
+                if modo.get("limpiar"):
+                    shutil.rmtree(cache, ignore_errors=True)
+                primero, todos, _ = medir_order_book(nombres, modo.get("entorno", entorno), modo.get("stdin"),
+                                                     modo.get("argumentos", ()))
+                tiempos.append((primero, todos))
+            resultados[nombre] = min(tiempos, key=lambda t: t[1])
+
+        # Auto Runner contra un order book ya corriendo (solo si se puede importar)
+        try:
+            cargar_script('Auto Runner.py', 'auto_runner')
+            omitido = None
+        except Exception as e:
+            omitido = f"{e.__class__.__name__}: {e}"
+        senal = None
+        if omitido is None:
+            puerto_ob = puerto_libre()
+            order_book = subprocess.Popen(
+                [sys.executable, os.path.join(RAIZ, "order book.py"), "--puerto", str(puerto_ob), "--simbolos", "BTC"],
+                stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env=entorno,
+            )
+            try:
+                senal = medir_auto_runner({**entorno, "ORDERBOOK_API_URL": f"http://127.0.0.1:{puerto_ob}"})
+            finally:
+                order_book.terminate()
+                order_book.wait(10)
+    finally:
+        simulador.terminate()
+        simulador.wait(10)
+        shutil.rmtree(cache, ignore_errors=True)
+
+    print("=" * 72)
+    print(f"🚦 Arranque en frío de order book.py: {args.simbolos} símbolos, REST a {args.latencia_ms:g} ms "
+          f"(mejor de {args.repeticiones})")
+    print("=" * 72)
+    print(f"{'modo':<30}{'primer libro':>16}{'todos':>12}")
+    for nombre, (primero, todos) in resultados.items():
+        print(f"{nombre:<30}{primero:>15.2f}s{todos:>11.2f}s")
+    if omitido is not None:
+        print(f"Auto Runner.py: omitido ({omitido})")
+    elif senal is None:
+        print("Auto Runner.py: sin señal dentro del tiempo límite")
+    else:
+        print(f"Auto Runner.py: primera señal a los {senal:.2f}s del lanzamiento")
+    print("=" * 72)
+
+
+if __name__ == "__main__":
+    main()
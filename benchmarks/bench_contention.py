@@ -0,0 +1,118 @@
+"""Benchmark de contención: muchos símbolos actualizándose a la vez + lectores de la API.
+
+Ejecuta el mismo escenario dos veces sobre las funciones reales de `order book.py`:
+  1. con un único lock compartido por todos los libros (comportamiento anterior)
+  2. con un lock por símbolo
+
+Escenario: varios hilos escritores llaman a on_message_combined para N símbolos, un
+hilo recarga periódicamente el snapshot del símbolo "caliente" (como en un resync) y
+varios lectores piden get_orderbook del símbolo caliente con un libro grande.
+
+Uso:
+    python benchmarks/bench_contention.py [--simbolos 100] [--escritores 4] [--lectores 4] [--segundos 5]
+"""
+import argparse
+import threading
+import time
+
+from _comun import GeneradorDepth, cargar_order_book, inicializar_libros, percentil
+
+
+def ejecutar(ob, args, lock_global):
+    generadores = [GeneradorDepth(f"SIM{i}USDT", niveles=200, seed=i) for i in range(args.simbolos)]
+    # El símbolo caliente tiene un libro grande, como BTCUSDT
+    generadores[0] = GeneradorDepth("HOTUSDT", niveles=args.niveles_caliente, seed=999)
+    inicializar_libros(ob, generadores)
+
+    if lock_global:
+        compartido = threading.Lock()
+        for book in ob.order_books.values():
+            book['lock'] = compartido
+
+    # Mensajes pregenerados por escritor (cada escritor es dueño de sus símbolos para respetar pu/u)
+    grupos = [generadores[i::args.escritores] for i in range(args.escritores)]
+    mensajes = [[gen.mensaje() for _ in range(args.mensajes) for gen in grupo] for grupo in grupos]
+
+    detener = threading.Event()
+    lat_escritura = [[] for _ in grupos]
+    lat_lectura = [[] for _ in range(args.lectores)]
+
+    def escritor(idx):
+        registro = lat_escritura[idx]
+        for mensaje in mensajes[idx]:
+            if detener.is_set():
+                break
+            inicio = time.perf_counter()
+            ob.on_message_combined(None, mensaje)
+            registro.append(time.perf_counter() - inicio)
+
+    def lector(idx):
+        registro = lat_lectura[idx]
+        while not detener.is_set():
+            inicio = time.perf_counter()
+            ob.construir_orderbook("HOTUSDT")
+            registro.append(time.perf_counter() - inicio)
+
+    def resync_caliente():
+        snap = generadores[0].snapshot()
+        while not detener.is_set():
+            ob.cargar_snapshot("HOTUSDT", snap)
+            time.sleep(0.05)
+
+    hilos = [threading.Thread(target=escritor, args=(i,)) for i in range(len(grupos))]
+    hilos += [threading.Thread(target=lector, args=(i,), daemon=True) for i in range(args.lectores)]
+    hilos.append(threading.Thread(target=resync_caliente, daemon=True))
+
+    inicio = time.perf_counter()
+    for hilo in hilos:
+        hilo.start()
+    temporizador = threading.Timer(args.segundos, detener.set)
+    temporizador.start()
+    for hilo in hilos[:len(grupos)]:
+        hilo.join()
+    duracion = time.perf_counter() - inicio
+    detener.set()
+    temporizador.cancel()
+    for hilo in hilos[len(grupos):]:
+        hilo.join()
+
+    escrituras = [x for registro in lat_escritura for x in registro]
+    lecturas = [x for registro in lat_lectura for x in registro]
+    return {
+        'mensajes_s': len(escrituras) / duracion,
+        'apply_p50_us': percentil(escrituras, 50) * 1e6,
+        'apply_p99_us': percentil(escrituras, 99) * 1e6,
+        'lecturas_s': len(lecturas) / duracion,
+        'lectura_p50_ms': percentil(lecturas, 50) * 1e3,
+        'lectura_p99_ms': percentil(lecturas, 99) * 1e3,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--simbolos', type=int, default=100)
+    parser.add_argument('--escritores', type=int, default=4)
+    parser.add_argument('--lectores', type=int, default=4)
+    parser.add_argument('--mensajes', type=int, default=200, help='mensajes por símbolo')
+    parser.add_argument('--niveles-caliente', type=int, default=2000, help='niveles por lado del símbolo caliente')
+    parser.add_argument('--segundos', type=float, default=10, help='duración máxima de cada escenario')
+    args = parser.parse_args()
+
+    ob = cargar_order_book()
+
+    print("=" * 80)
+    print(f"📊 Benchmark de contención: {args.simbolos} símbolos, {args.escritores} escritores, {args.lectores} lectores")
+    print("=" * 80)
+    resultados = {}
+    for nombre, lock_global in (("lock global", True), ("lock por símbolo", False)):
+        r = ejecutar(ob, args, lock_global)
+        resultados[nombre] = r
+        print(f"\n🔷 {nombre}")
+        print(f"   Mensajes/s: {r['mensajes_s']:,.0f} | apply p50 {r['apply_p50_us']:.1f} µs | p99 {r['apply_p99_us']:.1f} µs")
+        print(f"   Lecturas/s: {r['lecturas_s']:,.0f} | lectura p50 {r['lectura_p50_ms']:.2f} ms | p99 {r['lectura_p99_ms']:.2f} ms")
+    print("=" * 80)
+    return resultados
+
+
+if __name__ == "__main__":
+    main()
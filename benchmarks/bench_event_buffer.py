@@ -0,0 +1,87 @@
+"""Benchmark: buffer de eventos previo al snapshot (lista con re-filtrado vs EventBuffer).
+
+Simula una ráfaga de depth updates mientras el snapshot no llega. La versión anterior
+re-filtraba la lista completa en cada evento (O(n) por evento) y, con eventos
+consecutivos, descartaba toda la cadena previa: solo quedaba el último evento y el
+snapshot casi nunca podía enlazarse. EventBuffer agrega en O(1), conserva la cadena
+completa y se mantiene acotado en cantidad y antigüedad.
+
+Uso:
+    python benchmarks/bench_event_buffer.py [--eventos 5000] [--max-eventos 5000]
+"""
+import argparse
+import time
+
+from _comun import GeneradorDepth
+from event_buffer import EventBuffer
+
+
+def buffer_lista(eventos):
+    """Comportamiento anterior de on_message_combined"""
+    buffer = []
+    for data in eventos:
+        buffer = [e for e in buffer if not (e['u'] < data['U'])]
+        buffer.append(data)
+    return buffer
+
+
+def buffer_acotado(eventos, max_eventos, max_edad):
+    buffer = EventBuffer(max_eventos, max_edad)
+    for data in eventos:
+        buffer.append(data)
+    return buffer
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--eventos', type=int, default=5000, help='eventos en la ráfaga')
+    parser.add_argument('--max-eventos', type=int, default=5000, help='límite del EventBuffer')
+    parser.add_argument('--max-edad', type=float, default=60.0, help='antigüedad máxima (s)')
+    args = parser.parse_args()
+
+    gen = GeneradorDepth("BTCUSDT", seed=1)
+    gen.snapshot()
+    eventos = [gen.evento() for _ in range(args.eventos)]
+
+    inicio = time.perf_counter()
+    lista = buffer_lista(eventos)
+    t_lista = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    acotado = buffer_acotado(eventos, args.max_eventos, args.max_edad)
+    t_acotado = time.perf_counter() - inicio
+
+    # El EventBuffer nunca supera su límite
+    assert len(acotado) <= args.max_eventos
+    # La lista anterior descartaba todo evento con u < U del nuevo, es decir, toda la cadena
+    # previa; EventBuffer conserva la cadena completa (pu == u anterior) que pide process_buffer
+    if not acotado.desbordes:
+        assert len(acotado) == len(eventos)
+        previos = list(acotado)
+        assert all(b['pu'] == a['u'] for a, b in zip(previos, previos[1:]))
+
+    # Paso 4 del protocolo: descartar u < lastUpdateId desde un punto medio de la ráfaga
+    corte = eventos[len(eventos) // 2]['u']
+    acotado.descartar_hasta(corte)
+    primero = acotado.primero()
+    assert primero is None or primero['u'] >= corte
+
+    # Eventos viejos salen por antigüedad
+    viejo = EventBuffer(args.max_eventos, max_edad=1.0)
+    viejo.append(eventos[0], ahora=0.0)
+    viejo.append(eventos[1], ahora=5.0)
+    assert len(viejo) == 1 and viejo.primero() is eventos[1]
+
+    print("=" * 72)
+    print(f"🧺 Buffer previo al snapshot ({args.eventos:,} eventos, límite {args.max_eventos:,})")
+    print("=" * 72)
+    print(f"{'Lista (re-filtrado)':<24}{t_lista * 1e3:>10.1f} ms{t_lista / args.eventos * 1e6:>12.2f} µs/evento")
+    print(f"{'EventBuffer':<24}{t_acotado * 1e3:>10.1f} ms{t_acotado / args.eventos * 1e6:>12.2f} µs/evento")
+    print("-" * 72)
+    print(f"Eventos conservados: lista {len(lista):,}, EventBuffer {len(acotado):,} tras descartar "
+          f"u < {corte} (desbordes: {acotado.desbordes})")
+    print("=" * 72)
+
+
+if __name__ == "__main__":
+    main()
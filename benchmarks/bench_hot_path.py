@@ -0,0 +1,170 @@
+"""Benchmark del hot path de ingesta: decodificar el mensaje y aplicar sus niveles.
+
+Compara el camino anterior (json.loads del mensaje completo, split/upper del stream
+y `update` con float(qty) nivel por nivel) con el actual (depth_decoder con
+msgspec/orjson si están instalados, símbolo cacheado y `BookSide.apply` en bloque),
+por componente y de punta a punta a través de on_message_combined.
+
+Los mensajes son sintéticos o, con --archivo, mensajes crudos grabados (uno por
+línea, tal como llegan por /stream?streams=) o un directorio de depth_recorder.py
+(se usan el primer snapshot de cada símbolo y los mensajes que lo siguen).
+
+Uso:
+    python benchmarks/bench_hot_path.py [--mensajes 20000] [--niveles-evento 40] [--archivo grabacion.txt]
+"""
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import time
+
+from _comun import GeneradorDepth, cargar_order_book, percentil
+from depth_decoder import DECODIFICADOR, decodificar_mensaje, simbolo_de_stream
+from depth_recorder import leer_grabacion
+from orderbook_structure import BookSide
+
+
+def decodificar_anterior(message):
+    parsed = json.loads(message)
+    if 'stream' not in parsed:
+        return None, None
+    return parsed['stream'].split('@')[0].upper(), parsed['data']
+
+
+def decodificar_actual(message):
+    stream, data = decodificar_mensaje(message)
+    return simbolo_de_stream(stream), data
+
+
+def aplicar_anterior(lado, niveles):
+    for precio, qty in niveles:
+        lado.update(precio, qty)
+        float(qty)  # la versión anterior convertía de nuevo para los agregadores
+
+
+def aplicar_actual(lado, niveles):
+    lado.apply(niveles)
+
+
+def cargar_mensajes(args):
+    if args.archivo and os.path.isdir(args.archivo):
+        mensajes, snapshots = [], {}
+        for _, tipo, symbol, payload in leer_grabacion(args.archivo):
+            if tipo == "snapshot":
+                snapshots.setdefault(symbol, json.loads(payload))
+            elif symbol in snapshots:
+                mensajes.append(payload)
+        return mensajes, snapshots
+    if args.archivo:
+        with open(args.archivo, encoding='utf-8') as f:
+            mensajes = [linea.rstrip('\n') for linea in f if linea.strip()]
+        snapshots = {}
+        return mensajes, snapshots
+    gen = GeneradorDepth("BTCUSDT", niveles=1000, seed=3)
+    snapshots = {"BTCUSDT": gen.snapshot()}
+    return [gen.mensaje(gen.evento(args.niveles_evento)) for _ in range(args.mensajes)], snapshots
+
+
+def medir_componentes(mensajes, snapshots, decodificar, aplicar, repeticiones=3):
+    """Mejor de `repeticiones` corridas de decode y de apply, con el GC apagado mientras se mide"""
+    t_decode = t_apply = float('inf')
+    gc.disable()
+    try:
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            for mensaje in mensajes:
+                decodificar(mensaje)
+            t_decode = min(t_decode, time.perf_counter() - inicio)
+
+            decodificados = [decodificar(m) for m in mensajes]
+            lados = {}
+            for symbol, snap in snapshots.items():
+                lados[symbol] = (BookSide(True, 10.0), BookSide(False, 10.0))
+                lados[symbol][0].load(snap['bids'])
+                lados[symbol][1].load(snap['asks'])
+            inicio = time.perf_counter()
+            for symbol, data in decodificados:
+                if data is None or 'b' not in data:
+                    continue
+                if symbol not in lados:
+                    lados[symbol] = (BookSide(True), BookSide(False))
+                bids, asks = lados[symbol]
+                aplicar(bids, data['b'])
+                aplicar(asks, data['a'])
+            t_apply = min(t_apply, time.perf_counter() - inicio)
+    finally:
+        gc.enable()
+    return t_decode, t_apply, lados
+
+
+def medir_punta_a_punta(ob, mensajes, snapshots):
+    """Pasa los mensajes por on_message_combined con los libros ya inicializados"""
+    symbols = sorted(snapshots) or sorted({decodificar_anterior(m)[0] for m in mensajes} - {None})
+    with contextlib.redirect_stdout(io.StringIO()):
+        ob.configurar_simbolos(symbols)
+        for symbol in symbols:
+            if symbol in snapshots:
+                ob.cargar_snapshot(symbol, snapshots[symbol])
+            ob.process_buffer(symbol)
+    latencias = []
+    on_message = ob.on_message_combined
+    inicio = time.perf_counter()
+    for mensaje in mensajes:
+        t0 = time.perf_counter()
+        on_message(None, mensaje)
+        latencias.append(time.perf_counter() - t0)
+    return time.perf_counter() - inicio, latencias
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mensajes', type=int, default=20000)
+    parser.add_argument('--niveles-evento', type=int, default=40, help='máximo de niveles por depth update')
+    parser.add_argument('--archivo', help='mensajes crudos grabados (uno por línea) o directorio de grabación')
+    args = parser.parse_args()
+
+    mensajes, snapshots = cargar_mensajes(args)
+    n = len(mensajes)
+    ob = cargar_order_book()
+
+    # Camino anterior de punta a punta: mismo on_message_combined con el decode y el apply viejos
+    decodificar_original, apply_original = ob.decodificar_mensaje, BookSide.apply
+    ob.decodificar_mensaje = lambda m: (lambda p: (p.get('stream'), p.get('data')))(json.loads(m))
+    BookSide.apply = lambda self, niveles, cambios=None: aplicar_anterior(self, niveles)
+    try:
+        t_total_antes, lat_antes = medir_punta_a_punta(ob, mensajes, snapshots)
+    finally:
+        ob.decodificar_mensaje, BookSide.apply = decodificar_original, apply_original
+    t_total_ahora, lat_ahora = medir_punta_a_punta(ob, mensajes, snapshots)
+
+    t_dec_antes, t_app_antes, lados_antes = medir_componentes(mensajes, snapshots, decodificar_anterior, aplicar_anterior)
+    t_dec_ahora, t_app_ahora, lados_ahora = medir_componentes(mensajes, snapshots, decodificar_actual, aplicar_actual)
+
+    # Ambos caminos dejan exactamente el mismo libro
+    for symbol, (bids, asks) in lados_antes.items():
+        assert bids.as_dict() == lados_ahora[symbol][0].as_dict()
+        assert asks.as_dict() == lados_ahora[symbol][1].as_dict()
+        assert bids.ticks == lados_ahora[symbol][0].ticks and asks.ticks == lados_ahora[symbol][1].ticks
+
+    def fila(nombre, antes, ahora):
+        print(f"{nombre:<24}{antes / n * 1e6:>12.2f} µs{ahora / n * 1e6:>12.2f} µs{antes / ahora:>10.1f}x")
+
+    print("=" * 72)
+    print(f"🔥 Hot path de ingesta: {n:,} mensajes "
+          f"({'grabados' if args.archivo else f'sintéticos, ≤{args.niveles_evento} niveles'}), decoder: {DECODIFICADOR}")
+    print("=" * 72)
+    print(f"{'por mensaje':<24}{'antes':>15}{'ahora':>15}{'mejora':>11}")
+    fila("decode", t_dec_antes, t_dec_ahora)
+    fila("apply", t_app_antes, t_app_ahora)
+    fila("on_message_combined", t_total_antes, t_total_ahora)
+    print("-" * 72)
+    print(f"Mensajes/s: antes {n / t_total_antes:,.0f} | ahora {n / t_total_ahora:,.0f}")
+    print(f"Latencia p50/p99: antes {percentil(lat_antes, 50) * 1e6:.1f}/{percentil(lat_antes, 99) * 1e6:.1f} µs "
+          f"| ahora {percentil(lat_ahora, 50) * 1e6:.1f}/{percentil(lat_ahora, 99) * 1e6:.1f} µs")
+    print("=" * 72)
+
+
+if __name__ == "__main__":
+    main()
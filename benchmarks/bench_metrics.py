@@ -0,0 +1,100 @@
+"""Benchmark: costo de las métricas de /metrics en el hot path y del scrape.
+
+Pasa los mismos mensajes por on_message_combined con las métricas del símbolo
+desactivadas y activadas (mejor de varias corridas alternadas, GC apagado) y mide cuánto
+tarda armar /metrics con muchos símbolos.
+
+Uso:
+    python benchmarks/bench_metrics.py [--mensajes 20000] [--simbolos-scrape 500]
+"""
+import argparse
+import contextlib
+import gc
+import io
+import time
+
+from _comun import GeneradorDepth, cargar_order_book, inicializar_libros
+from metrics import MetricasSimbolo
+
+
+def medir(ob, generadores, mensajes, repeticiones=7):
+    """Mejor tiempo por mensaje (sin métricas, con métricas), alternando corridas"""
+    mejor = {False: float('inf'), True: float('inf')}
+    for _ in range(repeticiones):
+        for activadas in (False, True):
+            with contextlib.redirect_stdout(io.StringIO()):
+                inicializar_libros(ob, generadores)
+            for book in ob.order_books.values():
+                book['metricas'] = MetricasSimbolo() if activadas else None
+            on_message = ob.on_message_combined
+            gc.disable()
+            try:
+                inicio = time.perf_counter()
+                for mensaje in mensajes:
+                    on_message(None, mensaje)
+                mejor[activadas] = min(mejor[activadas], time.perf_counter() - inicio)
+            finally:
+                gc.enable()
+    return mejor[False] / len(mensajes), mejor[True] / len(mensajes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mensajes', type=int, default=20000)
+    parser.add_argument('--simbolos-scrape', type=int, default=500)
+    args = parser.parse_args()
+
+    ob = cargar_order_book()
+    gen = GeneradorDepth("BTCUSDT", niveles=1000, seed=5)
+    snapshot = gen.snapshot()
+    mensajes = [gen.mensaje(gen.evento(20)) for _ in range(args.mensajes)]
+
+    class Fijo:
+        """Siempre el mismo snapshot, para que cada corrida parta del mismo libro"""
+        symbol, tick_size = gen.symbol, gen.tick_size
+
+        def snapshot(self):
+            return snapshot
+
+    sin, con = medir(ob, [Fijo()], mensajes)
+    book = ob.order_books[gen.symbol]
+    assert book['initialized'] and book['metricas'].mensajes == len(mensajes)
+    assert book['metricas'].procesamiento.total == len(mensajes) // ob.METRICAS_MUESTREO
+
+    # Costo aislado de lo que agrega el muestreo (más estable que la diferencia de punta a punta)
+    metricas = MetricasSimbolo()
+    evento_ms = int(time.time() * 1000)
+    n = 200000
+    inicio = time.perf_counter()
+    for _ in range(n):
+        time.perf_counter()
+        time.perf_counter()
+        metricas.registrar(evento_ms, 1.2e-5, 0.0)
+    t_muestra = (time.perf_counter() - inicio) / n
+
+    # Scrape con muchos símbolos y todos los histogramas con datos
+    generadores = [GeneradorDepth(f"MET{i}USDT", niveles=50, seed=i) for i in range(args.simbolos_scrape)]
+    with contextlib.redirect_stdout(io.StringIO()):
+        inicializar_libros(ob, generadores)
+    for generador in generadores:
+        for _ in range(5):
+            ob.on_message_combined(None, generador.mensaje())
+    inicio = time.perf_counter()
+    texto = ob.construir_metricas()
+    t_scrape = time.perf_counter() - inicio
+
+    print("=" * 72)
+    print(f"📈 Métricas en el hot path: {len(mensajes):,} mensajes de ≤20 niveles")
+    print("=" * 72)
+    print(f"on_message_combined sin métricas: {sin * 1e6:.2f} µs/mensaje")
+    print(f"on_message_combined con métricas (muestreo 1/{ob.METRICAS_MUESTREO}): {con * 1e6:.2f} µs/mensaje "
+          f"(+{(con - sin) * 1e6:.2f} µs, {(con - sin) / sin:+.1%})")
+    print(f"Mensaje muestreado: +{t_muestra * 1e9:.0f} ns (relojes + histogramas) -> "
+          f"~{t_muestra / ob.METRICAS_MUESTREO * 1e9:.0f} ns por mensaje en promedio")
+    print(f"/metrics con {args.simbolos_scrape} símbolos: {t_scrape * 1000:.0f} ms, "
+          f"{len(texto.splitlines()):,} líneas, {len(texto) / 1e6:.1f} MB")
+    print("=" * 72)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""Benchmark: OrderedDict con claves string (estructura anterior) vs BookSide por ticks.
+
+Uso:
+    python benchmarks/bench_orderbook_structure.py [--niveles 2000] [--eventos 20000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from collections import OrderedDict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from orderbook_structure import BookSide  # noqa: E402
+
+TICK = 0.1
+ESCALA = 10.0
+
+
+def precio_str(tick):
+    return f"{tick / ESCALA:.1f}"
+
+
+def generar_snapshot(niveles, mid_tick):
+    bids = [[precio_str(mid_tick - i), f"{random.uniform(0.001, 50):.3f}"] for i in range(1, niveles + 1)]
+    asks = [[precio_str(mid_tick + i), f"{random.uniform(0.001, 50):.3f}"] for i in range(1, niveles + 1)]
+    return bids, asks
+
+
+def generar_eventos(n, niveles, mid_tick):
+    """Diffs realistas: la mayoría cerca del top, ~20% eliminaciones, algunos niveles nuevos lejanos"""
+    eventos = []
+    for _ in range(n):
+        b, a = [], []
+        for _ in range(random.randint(1, 10)):
+            distancia = int(random.expovariate(1 / 30)) + 1
+            if random.random() < 0.02:
+                distancia = niveles + random.randint(1, 200)
+            qty = "0.000" if random.random() < 0.2 else f"{random.uniform(0.001, 50):.3f}"
+            if random.random() < 0.5:
+                b.append([precio_str(mid_tick - distancia), qty])
+            else:
+                a.append([precio_str(mid_tick + distancia), qty])
+        eventos.append({'b': b, 'a': a})
+    return eventos
+
+
+# ----- Ruta anterior (OrderedDict con claves string) -----
+def aplicar_ordereddict(book, data):
+    for price, qty in data['b']:
+        if float(qty) == 0:
+            book['bids'].pop(price, None)
+        else:
+            book['bids'][price] = qty
+    for price, qty in data['a']:
+        if float(qty) == 0:
+            book['asks'].pop(price, None)
+        else:
+            book['asks'][price] = qty
+
+
+def best_ordereddict(book):
+    return max(book['bids'], key=float), min(book['asks'], key=float)
+
+
+def top_ordereddict(book, n):
+    bids = sorted(book['bids'].items(), key=lambda x: float(x[0]), reverse=True)[:n]
+    asks = sorted(book['asks'].items(), key=lambda x: float(x[0]))[:n]
+    return bids, asks
+
+
+def rango_ordereddict(book, precio_min, precio_max):
+    bids = sorted(((p, q) for p, q in book['bids'].items() if precio_min <= float(p) <= precio_max),
+                  key=lambda x: float(x[0]), reverse=True)
+    asks = sorted(((p, q) for p, q in book['asks'].items() if precio_min <= float(p) <= precio_max),
+                  key=lambda x: float(x[0]))
+    return bids, asks
+
+
+# ----- Ruta nueva (BookSide) -----
+def aplicar_bookside(book, data):
+    bids = book['bids']
+    for price, qty in data['b']:
+        bids.update(price, qty)
+    asks = book['asks']
+    for price, qty in data['a']:
+        asks.update(price, qty)
+
+
+def best_bookside(book):
+    return book['bids'].best(), book['asks'].best()
+
+
+def top_bookside(book, n):
+    return book['bids'].top(n), book['asks'].top(n)
+
+
+def rango_bookside(book, precio_min, precio_max):
+    return book['bids'].range(precio_min, precio_max), book['asks'].range(precio_min, precio_max)
+
+
+def medir(nombre, funcion, repeticiones):
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        funcion()
+    total = time.perf_counter() - inicio
+    print(f"   {nombre:<32} {total / repeticiones * 1e6:>12.2f} µs/op")
+    return total / repeticiones
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--niveles', type=int, default=2000, help='niveles por lado en el snapshot')
+    parser.add_argument('--eventos', type=int, default=20000, help='depth updates a aplicar')
+    parser.add_argument('--consultas', type=int, default=200, help='repeticiones de cada consulta')
+    args = parser.parse_args()
+
+    random.seed(42)
+    mid_tick = 500000
+    snap_bids, snap_asks = generar_snapshot(args.niveles, mid_tick)
+    eventos = generar_eventos(args.eventos, args.niveles, mid_tick)
+
+    libro_od = {'bids': OrderedDict(snap_bids), 'asks': OrderedDict(snap_asks)}
+    libro_bs = {'bids': BookSide(True, ESCALA), 'asks': BookSide(False, ESCALA)}
+    libro_bs['bids'].load(snap_bids)
+    libro_bs['asks'].load(snap_asks)
+
+    print("=" * 70)
+    print(f"📊 Benchmark estructura del order book ({args.niveles} niveles/lado, {args.eventos} eventos)")
+    print("=" * 70)
+
+    resultados = {}
+    for nombre, aplicar, best, top, rango, libro in (
+        ('OrderedDict', aplicar_ordereddict, best_ordereddict, top_ordereddict, rango_ordereddict, libro_od),
+        ('BookSide', aplicar_bookside, best_bookside, top_bookside, rango_bookside, libro_bs),
+    ):
+        print(f"\n🔷 {nombre}")
+        inicio = time.perf_counter()
+        for data in eventos:
+            aplicar(libro, data)
+        total = time.perf_counter() - inicio
+        print(f"   {'apply_order_book_update':<32} {total / len(eventos) * 1e6:>12.2f} µs/evento")
+        resultados[nombre] = {
+            'apply': total / len(eventos),
+            'best': medir('best bid/ask', lambda: best(libro), args.consultas),
+            'top': medir('top 20', lambda: top(libro, 20), args.consultas),
+            'rango': medir('rango ±0.1%', lambda: rango(libro, mid_tick / ESCALA * 0.999, mid_tick / ESCALA * 1.001),
+                           args.consultas),
+        }
+
+    # Ambas estructuras deben terminar con el mismo contenido
+    assert dict(libro_od['bids']) == libro_bs['bids'].as_dict()
+    assert dict(libro_od['asks']) == libro_bs['asks'].as_dict()
+
+    print("\n" + "-" * 70)
+    for clave in ('apply', 'best', 'top', 'rango'):
+        mejora = resultados['OrderedDict'][clave] / resultados['BookSide'][clave]
+        print(f"   {clave:<10} BookSide es {mejora:,.1f}x vs OrderedDict")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
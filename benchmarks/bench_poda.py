@@ -0,0 +1,214 @@
+"""Benchmark: libros sin límite contra libros con poda de niveles lejanos del mid.
+
+Simula una corrida larga en la que el mid oscila `--deriva` % hacia arriba y hacia
+abajo. Sin poda, los niveles que quedan lejos y nunca reciben un qty 0 se acumulan;
+con poda (máximo de niveles por lado o banda alrededor del mid) el libro queda
+acotado. Las variantes reciben los mismos mensajes en paralelo (un símbolo por
+variante) por on_message_combined, y se compara:
+  niveles y memoria finales (memoria_libro: lados y bloques, y aparte el historial de /diff), costo de copiar el libro completo
+  (/orderbooks sin depth) y de reagrupar todos los niveles en bloques (lo que hace
+  calcular_bloques), µs por mensaje, niveles podados y resyncs por zona podada;
+  que todo lo que está dentro de la cobertura (lo que el libro da por completo) sea
+  igual a la variante sin poda, y cuántas veces el top (--top niveles) difiere porque
+  el precio pasó la cobertura de un snapshot de resync (ahí el libro se completa con
+  los diffs, como al arrancar);
+  que los bloques mantenidos incrementalmente coincidan con reagrupar el libro;
+  que un cliente que sigue /diff termine con el mismo libro que el servidor.
+
+Los resyncs se resuelven con un snapshot (limit=1000) del libro sin poda (el "exchange").
+
+Uso:
+    python benchmarks/bench_poda.py [--mensajes 100000] [--deriva 4] [--max-niveles 2000] [--banda-pct 1]
+"""
+import argparse
+import contextlib
+import io
+import json
+import math
+import time
+from bisect import bisect_left, bisect_right
+
+from _comun import GeneradorDepth, cargar_order_book, inicializar_libros, percentil
+from orderbook_blocks import BlockAggregator
+
+AGRUPACION = 10  # USDT por bloque (100 ticks de 0.1)
+
+
+def snapshot_de(lado_bids, lado_asks, last_u, limite=1000):
+    """Snapshot REST (limit=1000) de un libro; el lastUpdateId cae en el próximo evento"""
+    return {"lastUpdateId": last_u + 1, "bids": [list(n) for n in lado_bids.top(limite)],
+            "asks": [list(n) for n in lado_asks.top(limite)]}
+
+
+def cierres_cruzados(gen, bids, asks):
+    """Qty 0 para los niveles que el mid dejó del lado equivocado (el exchange los borraría)"""
+    b = [[bids.niveles[t][0], "0"] for t in bids.ticks[bisect_left(bids.ticks, gen.mid_tick):]]
+    a = [[asks.niveles[t][0], "0"] for t in asks.ticks[:bisect_right(asks.ticks, gen.mid_tick)]]
+    return b, a
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mensajes', type=int, default=100000)
+    parser.add_argument('--deriva', type=float, default=4, help='amplitud de la oscilación del mid en %%')
+    parser.add_argument('--ciclos', type=float, default=2)
+    parser.add_argument('--max-niveles', type=int, default=2000)
+    parser.add_argument('--banda-pct', type=float, default=1)
+    parser.add_argument('--top', type=int, default=100, help='niveles del top a comparar con el libro sin poda')
+    parser.add_argument('--cada', type=int, default=5000, help='mensajes entre verificaciones del top')
+    args = parser.parse_args()
+
+    ob = cargar_order_book()
+    variantes = {
+        "SINPODAUSDT": ("sin poda", None),
+        "NIVELESUSDT": (f"máx. {args.max_niveles} niveles", (args.max_niveles, None)),
+        "BANDAUSDT": (f"banda {args.banda_pct:g}%", (None, args.banda_pct / 100)),
+    }
+    referencia = "SINPODAUSDT"
+    gen = GeneradorDepth(referencia, tick_size=0.1, niveles=1000, seed=11)
+    generadores = [GeneradorDepth(symbol, tick_size=0.1, niveles=1000, seed=11) for symbol in variantes]
+    with contextlib.redirect_stdout(io.StringIO()):
+        inicializar_libros(ob, generadores)
+    gen.u = generadores[0].u + 1  # Mismo lastUpdateId que los snapshots iniciales
+    for symbol, (_, poda) in variantes.items():
+        ob.order_books[symbol]['poda'] = poda
+        ob.construir_bloques(symbol, AGRUPACION)  # Agregador mantenido incrementalmente
+
+    pendientes = []
+    resync_anterior, ob.resync_externo = ob.resync_externo, pendientes.append
+    clientes = {symbol: None for symbol in variantes}  # (last_u, bids, asks) de un cliente de /diff
+    tiempos = {symbol: [] for symbol in variantes}
+    diferencias_cobertura = {symbol: 0 for symbol in variantes}
+    diferencias_top = {symbol: 0 for symbol in variantes}
+    base = gen.mid_tick
+    salida = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(salida):
+            for i in range(1, args.mensajes + 1):
+                gen.mid_tick = round(base * (1 + args.deriva / 100 * math.sin(2 * math.pi * args.ciclos * i / args.mensajes)))
+                data = gen.evento()
+                ref = ob.order_books[referencia]
+                cierre_b, cierre_a = cierres_cruzados(gen, ref['bids'], ref['asks'])
+                data['b'] = cierre_b + data['b']
+                data['a'] = cierre_a + data['a']
+                for symbol in variantes:
+                    mensaje = json.dumps({"stream": f"{symbol.lower()}@depth@100ms", "data": {**data, "s": symbol}})
+                    t = time.perf_counter()
+                    ob.on_message_combined(None, mensaje)
+                    tiempos[symbol].append(time.perf_counter() - t)
+
+                # Resyncs por zona podada: el "exchange" responde con el libro sin poda
+                while pendientes:
+                    symbol = pendientes.pop()
+                    ob.cargar_snapshot(symbol, snapshot_de(ref['bids'], ref['asks'], ref['last_u']))
+                    ob.process_buffer(symbol)
+
+                if i % 100 == 0:
+                    for symbol in variantes:
+                        seguir_diff(ob, symbol, clientes)
+                if i % args.cada == 0:
+                    for symbol in variantes:
+                        diferencias_cobertura[symbol] += not misma_cobertura(ob, symbol, referencia)
+                        diferencias_top[symbol] += not mismo_top(ob, symbol, referencia, args.top)
+    finally:
+        ob.resync_externo = resync_anterior
+
+    print("=" * 107)
+    print(f"✂️  Poda de niveles: {args.mensajes} mensajes, mid oscilando ±{args.deriva:g}% ({args.ciclos:g} ciclos)")
+    print("=" * 107)
+    print(f"{'variante':<20}{'niveles':>9}{'memoria':>11}{'historial':>11}{'copia':>10}{'bloques':>10}{'µs/msg':>9}"
+          f"{'p99 µs':>9}{'podados':>10}{'resyncs':>9}{'top ≠':>7}")
+    fallas = []
+    for symbol, (nombre, _) in variantes.items():
+        book = ob.order_books[symbol]
+        niveles = len(book['bids']) + len(book['asks'])
+        memoria = ob.memoria_libro(book)
+        historial = memoria.pop("history")
+        copia = medir(lambda: ob.construir_orderbook(symbol))
+        bloques = medir(lambda: BlockAggregator(AGRUPACION, book['bids'].escala, 100).reconstruir(book['bids'], book['asks']))
+        print(f"{nombre:<20}{niveles:>9}{sum(memoria.values()) / 1024 / 1024:>9.1f}MB{historial / 1024 / 1024:>9.1f}MB{copia:>8.2f}ms{bloques:>8.2f}ms"
+              f"{sum(tiempos[symbol]) / len(tiempos[symbol]) * 1e6:>9.1f}{percentil(tiempos[symbol], 99) * 1e6:>9.1f}"
+              f"{sum(book['niveles_podados']):>10}{book['resyncs_poda']:>9}{diferencias_top[symbol]:>7}")
+
+        if diferencias_cobertura[symbol] or not misma_cobertura(ob, symbol, referencia):
+            fallas.append(f"{nombre}: niveles dentro de la cobertura distintos del libro sin poda "
+                          f"({diferencias_cobertura[symbol]} verificaciones)")
+        agregador = next(iter(book['agregadores'].values()))
+        esperado = BlockAggregator(AGRUPACION, book['bids'].escala, 100).reconstruir(book['bids'], book['asks'])
+        if not mismos_bloques(agregador, esperado):
+            fallas.append(f"{nombre}: bloques incrementales distintos de reagrupar el libro")
+        seguir_diff(ob, symbol, clientes)
+        _, bids_cliente, asks_cliente = clientes[symbol]
+        if bids_cliente != book['bids'].as_dict() or asks_cliente != book['asks'].as_dict():
+            fallas.append(f"{nombre}: el cliente de /diff no coincide con el libro")
+    print("=" * 107)
+    print(f"top ≠: verificaciones (cada {args.cada} mensajes) con el top {args.top} distinto del libro sin poda")
+    print("\n".join(f"❌ {falla}" for falla in fallas) or
+          "✅ Cobertura, bloques y clientes de /diff coinciden en todas las variantes")
+    return 1 if fallas else 0
+
+
+def medir(funcion, repeticiones=20):
+    """Mejor tiempo en ms"""
+    mejor = float("inf")
+    for _ in range(repeticiones):
+        t = time.perf_counter()
+        funcion()
+        mejor = min(mejor, time.perf_counter() - t)
+    return mejor * 1000
+
+
+def mismo_top(ob, symbol, referencia, n):
+    book, ref = ob.order_books[symbol], ob.order_books[referencia]
+    return book['bids'].top(n) == ref['bids'].top(n) and book['asks'].top(n) == ref['asks'].top(n)
+
+
+def misma_cobertura(ob, symbol, referencia):
+    """Los niveles entre el top y la cobertura (lo que el libro da por completo) son los del libro sin poda"""
+    book, ref = ob.order_books[symbol], ob.order_books[referencia]
+    cobertura_bids, cobertura_asks = book['cobertura']
+    bids_max = max(book['bids'].ticks[-1], ref['bids'].ticks[-1])
+    asks_min = min(book['asks'].ticks[0], ref['asks'].ticks[0])
+    return (book['bids'].levels(tick_min=cobertura_bids, tick_max=bids_max)
+            == ref['bids'].levels(tick_min=cobertura_bids, tick_max=bids_max)
+            and book['asks'].levels(tick_min=asks_min, tick_max=cobertura_asks)
+            == ref['asks'].levels(tick_min=asks_min, tick_max=cobertura_asks))
+
+
+def mismos_bloques(a, b):
+    for lado_a, lado_b in ((a.bids, b.bids), (a.asks, b.asks)):
+        if lado_a.keys() != lado_b.keys():
+            return False
+        for clave, bucket in lado_a.items():
+            if abs(bucket[0] - lado_b[clave][0]) > 1e-6 * max(1.0, bucket[0]) or bucket[2] != lado_b[clave][2]:
+                return False
+    return True
+
+
+def seguir_diff(ob, symbol, clientes):
+    """Un cliente que se mantiene al día con /orderbooks/{symbol}/diff"""
+    cliente = clientes[symbol]
+    if cliente is None:
+        status, payload = ob.construir_orderbook(symbol)
+        if status == 200:
+            clientes[symbol] = (payload['last_u'], dict(payload['bids']), dict(payload['asks']))
+        return
+    since, bids, asks = cliente
+    status, payload = ob.construir_diff(symbol, since)
+    if status != 200:
+        return
+    if payload['type'] == "snapshot":
+        clientes[symbol] = (payload['last_u'], dict(payload['bids']), dict(payload['asks']))
+        return
+    for lado, cambios in ((bids, payload['bids']), (asks, payload['asks'])):
+        for precio, qty in cambios.items():
+            if float(qty) == 0:
+                lado.pop(precio, None)
+            else:
+                lado[precio] = qty
+    # El orden de los diccionarios no importa para comparar
+    clientes[symbol] = (payload['last_u'], bids, asks)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
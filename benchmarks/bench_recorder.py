@@ -0,0 +1,106 @@
+"""Benchmark: costo de grabar en el hot path y lectura de la grabación.
+
+Pasa los mismos mensajes por on_message_combined sin grabar y grabando con
+DepthRecorder (segmentos chicos para forzar rotaciones), y comprueba que la
+grabación devuelve exactamente lo recibido y que la búsqueda por tiempo del índice
+solo abre los segmentos necesarios.
+
+Uso:
+    python benchmarks/bench_recorder.py [--mensajes 20000] [--simbolos 5]
+"""
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import time
+
+from _comun import GeneradorDepth, cargar_order_book, percentil
+from depth_recorder import DepthRecorder, leer_grabacion, segmentos_de
+
+
+def pasar_mensajes(ob, mensajes):
+    latencias = []
+    on_message = ob.on_message_combined
+    for mensaje in mensajes:
+        inicio = time.perf_counter()
+        on_message(None, mensaje)
+        latencias.append(time.perf_counter() - inicio)
+    return latencias
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mensajes', type=int, default=20000)
+    parser.add_argument('--simbolos', type=int, default=5)
+    args = parser.parse_args()
+
+    ob = cargar_order_book()
+    generadores = [GeneradorDepth(f"REC{i}USDT", niveles=500, seed=i) for i in range(args.simbolos)]
+    snapshots = {}
+
+    def preparar():
+        with contextlib.redirect_stdout(io.StringIO()):
+            for gen in generadores:
+                ob.tick_sizes[gen.symbol] = str(gen.tick_size)
+            ob.configurar_simbolos([gen.symbol for gen in generadores])
+            for gen in generadores:
+                ob.cargar_snapshot(gen.symbol, snapshots[gen.symbol])
+                ob.process_buffer(gen.symbol)
+
+    for gen in generadores:
+        snapshots[gen.symbol] = gen.snapshot()
+    mensajes = [generadores[i % len(generadores)].mensaje(generadores[i % len(generadores)].evento(20))
+                for i in range(args.mensajes)]
+
+    # Sin grabar
+    ob.recorder = None
+    preparar()
+    lat_sin = pasar_mensajes(ob, mensajes)
+
+    # Grabando, con segmentos de ~64 KB para que haya varias rotaciones
+    directorio = tempfile.mkdtemp(prefix="obrec_")
+    recorder = DepthRecorder(directorio, max_bytes=64 * 1024).start()
+    ob.recorder = recorder
+    preparar()
+    inicio_grabacion = time.time()
+    lat_con = pasar_mensajes(ob, mensajes)
+    t_cierre = time.perf_counter()
+    recorder.cerrar()
+    t_cierre = time.perf_counter() - t_cierre
+    ob.recorder = None
+
+    registros = list(leer_grabacion(directorio))
+    depth = [payload for _, tipo, _, payload in registros if tipo == "depth"]
+    assert depth == mensajes, "la grabación no coincide con lo recibido"
+    assert sum(1 for r in registros if r[1] == "snapshot") == len(generadores)
+    assert recorder.descartados == 0
+
+    # Búsqueda por tiempo: la segunda mitad solo debe abrir los segmentos que la cubren
+    mitad = registros[len(registros) // 2][0]
+    segmentos_total = segmentos_de(directorio)
+    segmentos_mitad = segmentos_de(directorio, desde=mitad)
+    segunda_mitad = list(leer_grabacion(directorio, desde=mitad))
+    assert segunda_mitad[0][0] >= mitad and len(segunda_mitad) == sum(1 for r in registros if r[0] >= mitad)
+    tamano = sum(len(r[3]) for r in registros)
+    comprimido = sum(os.path.getsize(ruta) for ruta in segmentos_total)
+    shutil.rmtree(directorio)
+
+    print("=" * 72)
+    print(f"🎙️ Grabación de {len(mensajes):,} mensajes de {len(generadores)} símbolos")
+    print("=" * 72)
+    print(f"on_message_combined sin grabar: p50 {percentil(lat_sin, 50) * 1e6:.1f} µs | "
+          f"p99 {percentil(lat_sin, 99) * 1e6:.1f} µs")
+    print(f"on_message_combined grabando:   p50 {percentil(lat_con, 50) * 1e6:.1f} µs | "
+          f"p99 {percentil(lat_con, 99) * 1e6:.1f} µs")
+    print(f"Vaciado de la cola al cerrar: {t_cierre * 1000:.0f} ms | "
+          f"{len(registros) / max(time.time() - inicio_grabacion, 1e-9):,.0f} registros/s de punta a punta")
+    print(f"Segmentos: {len(segmentos_total)} | {tamano / 1e6:.1f} MB crudos -> {comprimido / 1e6:.2f} MB "
+          f"({tamano / comprimido:.1f}x)")
+    print(f"Búsqueda desde la mitad: abre {len(segmentos_mitad)}/{len(segmentos_total)} segmentos")
+    print("=" * 72)
+
+
+if __name__ == "__main__":
+    main()
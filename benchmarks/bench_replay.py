@@ -0,0 +1,149 @@
+"""Benchmark: replay de una grabación sintética por la lógica real de ingesta.
+
+Graba con DepthRecorder un stream de varios símbolos con la forma de una sesión en
+vivo: eventos antes del primer snapshot (que llega con retraso, como el REST), un
+evento perdido por símbolo que obliga a un resync con un snapshot posterior, un
+snapshot intermedio con el libro ya inicializado y un snapshot final exacto.
+
+Un modelo de referencia (dicts precio -> qty) aplica todos los eventos, incluido el
+perdido, y genera esos snapshots con el contenido correcto, así que el replay
+tiene que detectar exactamente un hueco por símbolo y dejar libros que coinciden
+con todos los snapshots. Después mide el replay a velocidad máxima y acelerada, y
+con un rango de tiempo.
+
+Uso:
+    python benchmarks/bench_replay.py [--mensajes 50000] [--simbolos 5] [--intervalo-ms 1]
+"""
+import argparse
+import contextlib
+import io
+import shutil
+import tempfile
+
+from _comun import GeneradorDepth, cargar_order_book
+from depth_recorder import DepthRecorder
+from replay import Replay
+
+
+class Referencia:
+    """Libro de referencia mínimo: aplica eventos y genera snapshots con lastUpdateId"""
+
+    def __init__(self, gen):
+        self.gen = gen
+        snap = gen.snapshot()
+        self.bids = {p: q for p, q in snap['bids']}
+        self.asks = {p: q for p, q in snap['asks']}
+
+    def evento(self):
+        data = self.gen.evento(20)
+        for lado, niveles in ((self.bids, data['b']), (self.asks, data['a'])):
+            for precio, qty in niveles:
+                if float(qty) == 0:
+                    lado.pop(precio, None)
+                else:
+                    lado[precio] = qty
+        return data
+
+    def snapshot(self, last_update_id):
+        niveles = self.gen.niveles
+        bids = sorted(self.bids.items(), key=lambda nivel: -float(nivel[0]))[:niveles]
+        asks = sorted(self.asks.items(), key=lambda nivel: float(nivel[0]))[:niveles]
+        return {"lastUpdateId": last_update_id, "bids": [list(n) for n in bids], "asks": [list(n) for n in asks]}
+
+
+def grabar(directorio, args):
+    """Graba la sesión sintética. Devuelve (ts inicial, ts final, snapshots finales)"""
+    referencias = [Referencia(GeneradorDepth(f"RPL{i}USDT", niveles=500, seed=i)) for i in range(args.simbolos)]
+    por_simbolo = args.mensajes // args.simbolos
+    recorder = DepthRecorder(directorio, max_bytes=256 * 1024).start()
+    ts0 = ts = 1_700_000_000.0
+    paso = args.intervalo_ms / 1000
+    demorados = []  # (índice en que se graba, symbol, snapshot): el REST llega unos eventos después
+
+    for i in range(por_simbolo):
+        for ref in referencias:
+            gen = ref.gen
+            if i in (3, por_simbolo // 2 + 2, por_simbolo * 4 // 5):
+                # Contenido antes del próximo evento, con lastUpdateId dentro de su [U, u] (como Binance)
+                demorados.append((i + 3, gen.symbol, ref.snapshot(gen.u + 1)))
+            data = ref.evento()
+            if i == por_simbolo // 2:
+                continue  # evento perdido: hueco de secuencia
+            ts += paso
+            recorder.registrar_depth(gen.symbol, gen.mensaje(data), ts)
+        for pendiente in [d for d in demorados if d[0] == i]:
+            recorder.registrar_snapshot(pendiente[1], pendiente[2], ts)
+            demorados.remove(pendiente)
+
+    recorder.cerrar()
+    finales = {ref.gen.symbol: ref.snapshot(ref.gen.u) for ref in referencias}
+    return ts0, ts, finales
+
+
+def replay(ob, directorio, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        ob.configurar_simbolos([])
+        corrida = Replay(ob, directorio, **kwargs)
+        resultado = corrida.ejecutar()
+    return corrida, resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mensajes', type=int, default=50000)
+    parser.add_argument('--simbolos', type=int, default=5)
+    parser.add_argument('--intervalo-ms', type=float, default=1, help='separación entre mensajes grabados')
+    args = parser.parse_args()
+
+    directorio = tempfile.mkdtemp(prefix="obreplay_")
+    try:
+        ts0, ts_fin, finales = grabar(directorio, args)
+        ob = cargar_order_book()
+
+        # Velocidad máxima, todo el rango
+        corrida, resultado = replay(ob, directorio)
+        corrida.verificar_final(finales)
+        estados = [v['status'] for _, v in corrida.verificaciones]
+        for symbol, datos in resultado['symbols'].items():
+            assert datos['gaps'] == 1, f"{symbol}: se esperaba 1 hueco, hubo {datos['gaps']}"
+            assert datos['snapshots_loaded'] == 2 and datos['snapshots_failed'] == 0, (symbol, datos)
+            assert datos['initialized'] and datos['checks_pending'] == 0, (symbol, datos)
+        assert estados == ["ok"] * (2 * args.simbolos), estados
+        assert all(v['compared'] > 0 for _, v in corrida.verificaciones)
+        # El snapshot final es exacto (last_u == lastUpdateId): no se excluye ningún precio
+        assert all(v['excluded'] == 0 for _, v in corrida.verificaciones[-args.simbolos:])
+
+        # Una corrupción del libro tiene que aparecer en la verificación
+        symbol = next(iter(finales))
+        lado = ob.order_books[symbol]['bids']
+        lado.update(lado.best()[0], "123.456")
+        assert ob.comparar_con_snapshot(symbol, finales[symbol])['status'] == "divergente"
+
+        # Rango de tiempo a velocidad acelerada: arranca sin snapshot, atraviesa el evento perdido
+        # con el libro todavía en el buffer y se inicializa con el snapshot del resync
+        duracion = ts_fin - ts0
+        desde, hasta = ts0 + duracion * 0.3, ts0 + duracion * 0.7
+        factor = max(1.0, (hasta - desde) / 2)  # ~2 s de reloj, por debajo del máximo de mensajes/s
+        _, acelerado = replay(ob, directorio, desde=desde, hasta=hasta, velocidad=factor)
+        esperado = (hasta - desde) / factor
+        assert acelerado['gaps'] == 0 and acelerado['messages'] > 0
+        for symbol, datos in acelerado['symbols'].items():
+            assert datos['initialized'] and datos['snapshots_loaded'] == 1, (symbol, datos)
+        assert esperado * 0.9 <= acelerado['seconds'] <= esperado + 0.5, (acelerado['seconds'], esperado)
+    finally:
+        shutil.rmtree(directorio)
+
+    print("=" * 72)
+    print(f"⏪ Replay de {resultado['messages']:,} mensajes de {args.simbolos} símbolos "
+          f"({resultado['snapshots']} snapshots grabados)")
+    print("=" * 72)
+    print(f"Velocidad máxima: {resultado['seconds']:.2f}s | {resultado['messages_per_second']:,} mensajes/s "
+          f"({resultado['recorded_seconds']:.1f}s grabados)")
+    print(f"Huecos detectados: {resultado['gaps']} (1 por símbolo) | verificaciones: {len(estados)} ok")
+    print(f"Rango {acelerado['recorded_seconds']:.1f}s a x{factor:.0f}: {acelerado['seconds']:.2f}s "
+          f"(esperado {esperado:.2f}s), {acelerado['messages']:,} mensajes")
+    print("=" * 72)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""Benchmark: tiempo hasta tener un libro consistente tras un hueco de secuencia.
+
+Corre la máquina de resync real de `order book.py` (hilos, SnapshotScheduler y
+process_buffer) contra un servidor HTTP local que sirve snapshots coherentes con
+el stream sintético. Un hilo alimenta on_message_combined cada `--intervalo-ms`
+(depth@100ms) y cada tanto se pierde un evento para provocar un hueco; en algunos
+huecos se disparan más resyncs del mismo símbolo para comprobar que se deduplican.
+
+El camino anterior dormía 1 s + 3 s fijos antes de pedir el snapshot.
+
+Uso:
+    python benchmarks/bench_resync.py [--huecos 10] [--intervalo-ms 100] [--latencia-ms 50]
+"""
+import argparse
+import contextlib
+import io
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from _comun import GeneradorDepth, cargar_order_book, percentil
+from snapshot_scheduler import SnapshotScheduler
+
+SYMBOL = "BTCUSDT"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--huecos', type=int, default=10)
+    parser.add_argument('--intervalo-ms', type=float, default=100, help='cada cuánto llega un depth update')
+    parser.add_argument('--latencia-ms', type=float, default=50, help='latencia del snapshot REST')
+    args = parser.parse_args()
+
+    ob = cargar_order_book()
+    gen = GeneradorDepth(SYMBOL, niveles=1000, seed=7)
+    lock_gen = threading.Lock()
+
+    class ServidorSnapshot(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            time.sleep(args.latencia_ms / 1000)
+            with lock_gen:
+                cuerpo = json.dumps(gen.snapshot()).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(cuerpo)))
+            self.end_headers()
+            self.wfile.write(cuerpo)
+
+        def log_message(self, *args):
+            pass
+
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), ServidorSnapshot)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    ob.snapshot_scheduler = SnapshotScheduler(url_base=f"http://127.0.0.1:{servidor.server_address[1]}")
+    ob.tick_sizes[SYMBOL] = str(gen.tick_size)
+    with contextlib.redirect_stdout(io.StringIO()):
+        ob.configurar_simbolos([SYMBOL])
+
+    detener = threading.Event()
+    perder = [0]  # eventos a descartar antes del próximo envío
+
+    def alimentar():
+        while not detener.is_set():
+            with lock_gen:
+                while perder[0]:
+                    gen.evento()
+                    perder[0] -= 1
+                mensaje = gen.mensaje()
+            ob.on_message_combined(None, mensaje)
+            time.sleep(args.intervalo_ms / 1000)
+
+    def esperar_consistente(timeout=30):
+        limite = time.monotonic() + timeout
+        while time.monotonic() < limite:
+            book = ob.order_books[SYMBOL]
+            if book['initialized'] and book['resync'] == "inactivo":
+                return True
+            time.sleep(0.005)
+        return False
+
+    salida = io.StringIO()
+    with contextlib.redirect_stdout(salida):
+        threading.Thread(target=alimentar, daemon=True).start()
+        inicio = time.perf_counter()
+        ob.programar_inicializacion(SYMBOL)
+        assert esperar_consistente()
+        t_arranque = time.perf_counter() - inicio
+
+        duplicados = 0
+        for i in range(args.huecos):
+            time.sleep(0.5)
+            perder[0] = 1
+            # Esperar a que on_message_combined detecte el hueco
+            while ob.order_books[SYMBOL]['initialized']:
+                time.sleep(0.001)
+            if i % 3 == 0:
+                # Otros disparadores (p. ej. una resuscripción) mientras el resync está en curso
+                ob.programar_resync(SYMBOL)
+                ob.programar_inicializacion(SYMBOL)
+                duplicados += 2
+            assert esperar_consistente(), f"el hueco {i + 1} no se resincronizó"
+        detener.set()
+
+    stats = ob.estadisticas_resync()
+    duraciones = list(ob.resync_duraciones)[1:]  # sin el arranque
+    assert stats["failed"] == 0
+    assert stats["completed"] == args.huecos + 1
+    assert stats["deduplicated"] >= duplicados
+
+    print("=" * 72)
+    print(f"🔁 Resync tras hueco ({args.huecos} huecos, evento cada {args.intervalo_ms:.0f} ms, "
+          f"snapshot {args.latencia_ms:.0f} ms)")
+    print("=" * 72)
+    print(f"Arranque en frío hasta libro consistente: {t_arranque * 1000:.0f} ms")
+    print(f"Resync p50 {percentil(duraciones, 50) * 1000:.0f} ms | p99 {percentil(duraciones, 99) * 1000:.0f} ms "
+          f"| máx {max(duraciones) * 1000:.0f} ms")
+    print(f"Resyncs completados: {stats['completed']} | pedidos deduplicados: {stats['deduplicated']} "
+          f"| reintentos: {salida.getvalue().count('Reintentando')}")
+    print("Camino anterior: ≥ 4000 ms solo en esperas fijas (1 s + 3 s) por resync")
+    print("=" * 72)
+    servidor.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Benchmark: lectura de libros desde memoria compartida (orderbook_shm) por otros procesos.
+
+Un hilo escritor publica versiones sin pausa (el peor caso para el seqlock) y
+varios procesos lectores leen en bucle. Cada versión k tiene valores derivados de
+k, así que cualquier lectura mezclada entre dos versiones se detecta. Como
+referencia se mide lo que le cuesta a un cliente HTTP solo decodificar el mismo
+top-N en JSON (sin contar la red ni el servidor).
+
+Uso:
+    python benchmarks/bench_shm.py [--niveles 20] [--lectores 2] [--segundos 3]
+"""
+import argparse
+import json
+import multiprocessing
+import tempfile
+import threading
+import time
+
+from _comun import percentil
+from orderbook_shm import SharedBookReader, SharedBookWriter
+
+SYMBOL = "BENCHUSDT"
+
+
+def version(k, niveles):
+    """Contenido de la versión k: todos los valores se pueden verificar a partir de k"""
+    bids = ([k + 0.5 - i for i in range(niveles)], [k * 2.0 + i for i in range(niveles)])
+    asks = ([k + 1.5 + i for i in range(niveles)], [k * 3.0 + i for i in range(niveles)])
+    return bids, asks
+
+
+def lector(directorio, niveles, segundos, resultados):
+    lector = SharedBookReader(SYMBOL, directorio)
+    latencias = []
+    errores = 0
+    fin = time.monotonic() + segundos
+    while time.monotonic() < fin:
+        inicio = time.perf_counter()
+        libro = lector.leer()
+        latencias.append(time.perf_counter() - inicio)
+        k = libro["last_u"]
+        if k and (libro["bids"][0][-1] != k + 0.5 - (niveles - 1) or libro["asks"][1][0] != k * 3.0
+                  or len(libro["bids"][0]) != niveles):
+            errores += 1
+    resultados.put((len(latencias), percentil(latencias, 50), percentil(latencias, 99), errores, lector.reintentos))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--niveles', type=int, default=20)
+    parser.add_argument('--lectores', type=int, default=2)
+    parser.add_argument('--segundos', type=float, default=3)
+    args = parser.parse_args()
+
+    directorio = tempfile.mkdtemp(prefix="obshm_")
+    escritor = SharedBookWriter(SYMBOL, args.niveles, directorio)
+    escritor.publicar(1, *version(1, args.niveles))
+
+    detener = threading.Event()
+    publicadas = [0]
+
+    def escribir():
+        k = 1
+        while not detener.is_set():
+            k += 1
+            escritor.publicar(k, *version(k, args.niveles))
+        publicadas[0] = k
+
+    resultados = multiprocessing.Queue()
+    procesos = [multiprocessing.Process(target=lector, args=(directorio, args.niveles, args.segundos, resultados))
+                for _ in range(args.lectores)]
+    hilo = threading.Thread(target=escribir, daemon=True)
+    hilo.start()
+    for proceso in procesos:
+        proceso.start()
+    por_lector = [resultados.get() for _ in procesos]
+    for proceso in procesos:
+        proceso.join()
+    detener.set()
+    hilo.join()
+    escritor.cerrar(borrar=True)
+
+    # Referencia: decodificar el mismo top-N como lo devuelve /orderbooks?depth=N
+    bids, asks = version(123456, args.niveles)
+    cuerpo = json.dumps({"bids": {str(p): str(q) for p, q in zip(*bids)},
+                         "asks": {str(p): str(q) for p, q in zip(*asks)}, "last_u": 123456})
+    inicio = time.perf_counter()
+    for _ in range(20000):
+        data = json.loads(cuerpo)
+        [(float(p), float(q)) for p, q in data["bids"].items()]
+        [(float(p), float(q)) for p, q in data["asks"].items()]
+    t_json = (time.perf_counter() - inicio) / 20000
+
+    errores = sum(r[3] for r in por_lector)
+    print("=" * 72)
+    print(f"🧠 Memoria compartida: top {args.niveles} niveles, {args.lectores} proceso(s) lector(es), "
+          f"{args.segundos:.0f}s")
+    print("=" * 72)
+    print(f"Versiones publicadas por el escritor: {publicadas[0]:,} ({publicadas[0] / args.segundos:,.0f}/s)")
+    for i, (lecturas, p50, p99, err, reintentos) in enumerate(por_lector, 1):
+        print(f"Lector {i}: {lecturas:,} lecturas | p50 {p50 * 1e6:.2f} µs | p99 {p99 * 1e6:.2f} µs "
+              f"| reintentos seqlock {reintentos:,} | inconsistentes {err}")
+    print("-" * 72)
+    print(f"Referencia: solo decodificar el mismo top {args.niveles} en JSON cuesta {t_json * 1e6:.2f} µs "
+          f"(más HTTP y el lock del libro en el servidor)")
+    print("=" * 72)
+    assert errores == 0, "se leyeron versiones mezcladas"
+
+
+if __name__ == "__main__":
+    main()
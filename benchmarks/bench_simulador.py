@@ -0,0 +1,149 @@
+"""Benchmark: ingesta real de `order book.py` contra el simulador local con cientos de símbolos.
+
+Levanta `simulator.py` en un subproceso y apunta el order book a él con
+BINANCE_REST_URL/BINANCE_WS_URL: validación por exchangeInfo, WebSockets por shards,
+snapshots por el SnapshotScheduler y resyncs reales. Mide el tiempo hasta tener todos
+los libros inicializados, el throughput sostenido con huecos inyectados y el tiempo
+de recuperación tras cortar todas las conexiones.
+
+El límite de peso del simulador y del scheduler se sube (`--peso-maximo`) para medir
+el pipeline y no el presupuesto de Binance; con 2400 el arranque queda limitado por el peso.
+
+Uso:
+    python benchmarks/bench_simulador.py [--simbolos 500] [--tasa 10] [--duracion 20] [--prob-hueco 0.0005]
+"""
+import argparse
+import contextlib
+import io
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import requests
+
+from _comun import RAIZ, cargar_order_book
+from snapshot_scheduler import SnapshotScheduler
+
+
+def puerto_libre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def esperar(condicion, timeout, paso=0.1):
+    """Espera hasta que `condicion()` sea verdadera. Devuelve los segundos o None si venció"""
+    inicio = time.perf_counter()
+    while time.perf_counter() - inicio < timeout:
+        if condicion():
+            return time.perf_counter() - inicio
+        time.sleep(paso)
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--simbolos', type=int, default=500)
+    parser.add_argument('--tasa', type=float, default=10, help='depth updates por segundo y símbolo')
+    parser.add_argument('--duracion', type=float, default=20, help='segundos de ingesta sostenida')
+    parser.add_argument('--prob-hueco', type=float, default=0.0005)
+    parser.add_argument('--limit', type=int, default=100, help='profundidad de los snapshots')
+    parser.add_argument('--peso-maximo', type=int, default=1_000_000)
+    parser.add_argument('--timeout', type=float, default=120)
+    args = parser.parse_args()
+
+    puerto = puerto_libre()
+    url = f"127.0.0.1:{puerto}"
+    simulador = subprocess.Popen(
+        [sys.executable, os.path.join(RAIZ, "simulator.py"), "--simbolos", str(args.simbolos),
+         "--tasa", str(args.tasa), "--niveles", str(max(args.limit, 200)), "--puerto", str(puerto),
+         "--prob-hueco", str(args.prob_hueco), "--peso-maximo", str(args.peso_maximo)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        def simulador_listo():
+            try:
+                return requests.get(f"http://{url}/sim/estado", timeout=1).ok
+            except requests.RequestException:
+                return False
+
+        assert esperar(simulador_listo, 30) is not None, "el simulador no arrancó"
+
+        # Las URLs se leen al importar el módulo
+        os.environ["BINANCE_REST_URL"] = f"http://{url}"
+        os.environ["BINANCE_WS_URL"] = f"ws://{url}"
+        ob = cargar_order_book()
+        ob.snapshot_scheduler = SnapshotScheduler(url_base=f"http://{url}", peso_maximo=args.peso_maximo,
+                                                  limite_por_defecto=args.limit)
+        nombres = requests.get(f"http://{url}/fapi/v1/exchangeInfo", timeout=10).json()['symbols']
+        with contextlib.redirect_stdout(io.StringIO()):
+            validados, invalidos = ob.validar_simbolos_binance([s['symbol'] for s in nombres])
+            assert len(validados) == args.simbolos and not invalidos
+            ob.configurar_simbolos(validados)
+
+        def inicializados():
+            return sum(1 for book in ob.order_books.values() if book['initialized'])
+
+        def mensajes():
+            return sum(book['metricas'].mensajes for book in ob.order_books.values() if book['metricas'])
+
+        # Arranque en frío: conexiones + snapshots de todos los símbolos
+        salida = io.StringIO()
+        with contextlib.redirect_stdout(salida):
+            inicio = time.perf_counter()
+            ob.start_websockets()
+            for symbol in ob.coins:
+                ob.programar_inicializacion(symbol)
+            t_arranque = esperar(lambda: inicializados() == args.simbolos, args.timeout)
+        assert t_arranque is not None, f"solo {inicializados()}/{args.simbolos} libros tras {args.timeout}s"
+        t_arranque = time.perf_counter() - inicio
+
+        # Ingesta sostenida con huecos inyectados
+        with contextlib.redirect_stdout(salida):
+            def huecos_detectados():
+                return sum(book['metricas'].huecos for book in ob.order_books.values() if book['metricas'])
+
+            def huecos_inyectados():
+                return requests.get(f"http://{url}/sim/estado", timeout=5).json()['stats']['huecos']
+
+            resync_antes = ob.estadisticas_resync()['completed']
+            huecos_antes, inyectados_antes = huecos_detectados(), huecos_inyectados()
+            mensajes_antes = mensajes()
+            time.sleep(args.duracion)
+            recibidos = mensajes() - mensajes_antes
+            resync = ob.estadisticas_resync()
+            detectados = huecos_detectados() - huecos_antes
+            inyectados = huecos_inyectados() - inyectados_antes
+            esperados = args.simbolos * args.tasa * args.duracion
+
+            # Todas las conexiones se cortan: reconexión y reinicialización de todos los libros
+            requests.post(f"http://{url}/sim/desconectar", timeout=5)
+            inicio = time.perf_counter()
+            esperar(lambda: inicializados() < args.simbolos, 5, paso=0.01)
+            t_recuperacion = esperar(lambda: inicializados() == args.simbolos, args.timeout)
+            if t_recuperacion is not None:
+                t_recuperacion = time.perf_counter() - inicio
+            ob.ws_manager.stop()
+        assert t_recuperacion is not None, f"solo {inicializados()}/{args.simbolos} libros tras la desconexión"
+        assert resync['failed'] == 0, resync
+    finally:
+        simulador.terminate()
+        simulador.wait(10)
+
+    print("=" * 72)
+    print(f"🧪 order book contra el simulador: {args.simbolos} símbolos a {args.tasa:g} updates/s "
+          f"({len(ob.ws_manager.shards)} conexiones)")
+    print("=" * 72)
+    print(f"Arranque en frío (todos los libros inicializados): {t_arranque:.2f}s")
+    print(f"Ingesta sostenida: {recibidos / args.duracion:,.0f} mensajes/s "
+          f"({recibidos / esperados:.1%} de los {esperados / args.duracion:,.0f}/s generados)")
+    print(f"Huecos: {inyectados} inyectados, {detectados} detectados | "
+          f"resyncs: {resync['completed'] - resync_antes} (p50 {resync['p50_ms']} ms, p99 {resync['p99_ms']} ms)")
+    print(f"Recuperación tras cortar todas las conexiones: {t_recuperacion:.2f}s")
+    print("=" * 72)
+
+
+if __name__ == "__main__":
+    main()
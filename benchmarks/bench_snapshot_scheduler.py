@@ -0,0 +1,146 @@
+"""Benchmark: arranque en frío de snapshots (hilo + conexión nueva por símbolo con
+escalonado fijo vs SnapshotScheduler con pool keep-alive y presupuesto de peso).
+
+Levanta un servidor HTTP local que imita /fapi/v1/depth (latencia configurable,
+header X-MBX-USED-WEIGHT-1M y un 429 opcional) para no depender de Binance.
+
+Uso:
+    python benchmarks/bench_snapshot_scheduler.py [--simbolos 80] [--latencia-ms 80] [--trabajadores 8] [--limit 1000]
+
+Con el límite de 2400 de peso por minuto de Binance, 1000 niveles (peso 20) alcanzan
+para ~95 snapshots por minuto con el margen por defecto; para cientos de símbolos en
+segundos hay que bajar la profundidad (ORDERBOOK_SNAPSHOT_LIMIT o por símbolo).
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import requests
+
+from _comun import GeneradorDepth
+from snapshot_scheduler import SnapshotScheduler, peso_depth
+
+
+class ServidorDepth(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    latencia = 0.08
+    rechazar_primero = False
+    lock = threading.Lock()
+    peso = 0
+    conexiones = set()
+
+    def do_GET(self):
+        consulta = parse_qs(urlparse(self.path).query)
+        symbol = consulta["symbol"][0]
+        limit = int(consulta.get("limit", ["1000"])[0])
+        time.sleep(self.latencia)
+        with ServidorDepth.lock:
+            ServidorDepth.conexiones.add(self.client_address)
+            rechazar = ServidorDepth.rechazar_primero
+            ServidorDepth.rechazar_primero = False
+            ServidorDepth.peso += peso_depth(limit)
+            peso = ServidorDepth.peso
+        if rechazar:
+            self._responder(429, b'{"code":-1003}', {"Retry-After": "1", "X-MBX-USED-WEIGHT-1M": str(peso)})
+            return
+        gen = GeneradorDepth(symbol, niveles=limit, seed=hash(symbol) & 0xffff)
+        cuerpo = json.dumps(gen.snapshot()).encode()
+        self._responder(200, cuerpo, {"X-MBX-USED-WEIGHT-1M": str(peso)})
+
+    def _responder(self, status, cuerpo, headers):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        for clave, valor in headers.items():
+            self.send_header(clave, valor)
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def log_message(self, *args):
+        pass
+
+
+def arranque_anterior(url_base, simbolos, escalonado):
+    """Lo que hacía main(): un hilo y un requests.get nuevo por símbolo, cada `escalonado` segundos"""
+    hilos = []
+    for symbol in simbolos:
+        hilo = threading.Thread(
+            target=lambda s=symbol: requests.get(f"{url_base}/fapi/v1/depth?symbol={s}&limit=1000").json(),
+            daemon=True,
+        )
+        hilo.start()
+        hilos.append(hilo)
+        time.sleep(escalonado)
+    for hilo in hilos:
+        hilo.join()
+
+
+def arranque_planificado(scheduler, simbolos, leidos):
+    futuros = {symbol: scheduler.solicitar(symbol) for symbol in simbolos}
+    # Símbolos leídos por la API mientras esperan: deben adelantarse en la cola
+    for symbol in leidos:
+        scheduler.marcar_lectura(symbol)
+    terminados = {}
+    for symbol, futuro in futuros.items():
+        futuro.add_done_callback(lambda f, s=symbol: terminados.setdefault(s, time.perf_counter()))
+    for futuro in futuros.values():
+        assert futuro.result()["lastUpdateId"] > 0
+    return terminados
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--simbolos', type=int, default=80)
+    parser.add_argument('--latencia-ms', type=float, default=80)
+    parser.add_argument('--trabajadores', type=int, default=8)
+    parser.add_argument('--limit', type=int, default=1000, help='profundidad de los snapshots planificados')
+    parser.add_argument('--escalonado', type=float, default=0.2, help='espera entre símbolos del arranque anterior (s)')
+    args = parser.parse_args()
+
+    ServidorDepth.latencia = args.latencia_ms / 1000
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), ServidorDepth)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    url_base = f"http://127.0.0.1:{servidor.server_address[1]}"
+    simbolos = [f"SYM{i:04d}USDT" for i in range(args.simbolos)]
+    leidos = simbolos[-5:]
+
+    inicio = time.perf_counter()
+    arranque_anterior(url_base, simbolos, args.escalonado)
+    t_anterior = time.perf_counter() - inicio
+    conexiones_anterior = len(ServidorDepth.conexiones)
+
+    # Nueva ventana de peso para la segunda fase
+    ServidorDepth.peso = 0
+    ServidorDepth.conexiones = set()
+    ServidorDepth.rechazar_primero = True
+    scheduler = SnapshotScheduler(url_base=url_base, trabajadores=args.trabajadores, limite_por_defecto=args.limit)
+    inicio = time.perf_counter()
+    terminados = arranque_planificado(scheduler, simbolos, leidos)
+    t_planificado = time.perf_counter() - inicio
+    stats = scheduler.estadisticas()
+    conexiones_planificado = len(ServidorDepth.conexiones)
+
+    # Los símbolos leídos terminan antes que la mediana del resto
+    orden = sorted(terminados, key=terminados.get)
+    posiciones = [orden.index(s) for s in leidos]
+    assert max(posiciones) < len(orden) // 2
+    assert stats["rate_limited"] == 1 and stats["completed"] == len(simbolos)
+
+    print("=" * 72)
+    print(f"📸 Arranque en frío: {args.simbolos} snapshots (latencia {args.latencia_ms:.0f} ms)")
+    print("=" * 72)
+    print(f"{'Anterior (hilo + escalonado)':<32}{t_anterior:>8.2f} s{conexiones_anterior:>8} conexiones")
+    print(f"{'SnapshotScheduler':<32}{t_planificado:>8.2f} s{conexiones_planificado:>8} conexiones")
+    print("-" * 72)
+    print(f"Planificador: {t_anterior / t_planificado:.1f}x más rápido (incluye un 429 con Retry-After de 1s), "
+          f"peso usado {stats['weight_used_1m']}/{stats['weight_budget_1m']}")
+    print(f"Símbolos leídos por la API terminaron en las posiciones {posiciones} de {len(orden)}")
+    print("=" * 72)
+    servidor.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+"""Benchmark: verificación de consistencia en segundo plano contra snapshots REST.
+
+Corre el verificador real de `order book.py` (hilo, SnapshotScheduler con
+PRIORIDAD_VERIFICACION, comparar_con_snapshot y resync) contra un servidor HTTP
+local que hace de exchange: mantiene el libro "verdadero" de cada símbolo y sirve
+/fapi/v1/depth con su estado actual y el header X-MBX-USED-WEIGHT-1M. Los libros
+locales reciben los mismos eventos `--retraso` mensajes después (latencia del
+WebSocket), así los snapshots llegan adelantados y hay que alinearlos.
+
+Cada tanto se pierde en un libro local un qty 0 de un nivel cercano al top (el
+libro conserva un nivel que el exchange ya borró): la secuencia U/u/pu sigue
+intacta, solo la verificación lo puede ver. Se mide:
+  desvíos detectados, curados solos antes de verificarse (otro update pisó el
+  nivel) y falsos positivos;
+  tiempo desde el desvío hasta el resync;
+  lock tomado por comparar_con_snapshot (copia de los dos lados) contra lo que
+  tarda la comparación completa, que corre sin el lock;
+  que con el peso usado por otros procesos en el límite de las verificaciones
+  (la mitad del presupuesto) estas se omitan y los resyncs no esperen.
+
+Uso:
+    python benchmarks/bench_verificacion.py [--simbolos 4] [--duracion 20] [--intervalo 0.25] [--niveles 5000]
+"""
+import argparse
+import contextlib
+import io
+import json
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from _comun import GeneradorDepth, cargar_order_book, inicializar_libros, percentil
+from orderbook_structure import BookSide
+from snapshot_scheduler import SnapshotScheduler, peso_depth
+
+
+class Exchange:
+    """Libros verdaderos por símbolo y peso REST usado (el bench corre dentro de un minuto)"""
+
+    def __init__(self, generadores, peso_externo=0):
+        self.lock = threading.Lock()
+        self.libros = {}
+        for gen in generadores:
+            snap = gen.snapshot()
+            bids = BookSide(es_bid=True, escala=1 / gen.tick_size)
+            asks = BookSide(es_bid=False, escala=1 / gen.tick_size)
+            bids.load(snap['bids'])
+            asks.load(snap['asks'])
+            self.libros[gen.symbol] = [bids, asks, gen.u]  # Contenido previo al próximo evento
+        self.peso = 0
+        self.peso_externo = peso_externo  # Peso que usan otros procesos de la misma IP
+
+    def aplicar(self, symbol, data):
+        with self.lock:
+            bids, asks, _ = libro = self.libros[symbol]
+            bids.apply(data['b'])
+            asks.apply(data['a'])
+            libro[2] = data['u']
+
+    def snapshot(self, symbol, limit):
+        with self.lock:
+            bids, asks, u = self.libros[symbol]
+            self.peso += peso_depth(limit)
+            # lastUpdateId: el último update incluido en el snapshot
+            return {"lastUpdateId": u, "bids": [list(n) for n in bids.top(limit)],
+                    "asks": [list(n) for n in asks.top(limit)]}, self.peso + self.peso_externo
+
+
+def servir(exchange):
+    class ServidorDepth(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            consulta = parse_qs(urlparse(self.path).query)
+            snap, peso = exchange.snapshot(consulta["symbol"][0], int(consulta.get("limit", ["1000"])[0]))
+            cuerpo = json.dumps(snap).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(cuerpo)))
+            self.send_header("X-MBX-USED-WEIGHT-1M", str(peso))
+            self.end_headers()
+            self.wfile.write(cuerpo)
+
+        def log_message(self, *args):
+            pass
+
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), ServidorDepth)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--simbolos', type=int, default=4)
+    parser.add_argument('--duracion', type=float, default=20, help='segundos de ingesta con desvíos')
+    parser.add_argument('--intervalo', type=float, default=0.25, help='segundos entre verificaciones')
+    parser.add_argument('--intervalo-ms', type=float, default=20, help='cada cuánto llega un depth update')
+    parser.add_argument('--retraso', type=int, default=5, help='mensajes de atraso del WebSocket')
+    parser.add_argument('--desvio-cada', type=float, default=1.0, help='segundos entre desvíos inyectados')
+    parser.add_argument('--niveles', type=int, default=5000, help='niveles por lado del libro inicial')
+    args = parser.parse_args()
+
+    ob = cargar_order_book()
+    simbolos = [f"LIB{i}USDT" for i in range(1, args.simbolos + 1)]
+    generadores = {symbol: GeneradorDepth(symbol, niveles=args.niveles, seed=i) for i, symbol in enumerate(simbolos)}
+    exchange = Exchange([GeneradorDepth(symbol, niveles=args.niveles, seed=i) for i, symbol in enumerate(simbolos)])
+    servidor = servir(exchange)
+    url = f"http://127.0.0.1:{servidor.server_address[1]}"
+    ob.snapshot_scheduler = SnapshotScheduler(url_base=url, trabajadores=2, fraccion_verificacion=0.5)
+    ob.VERIFICACION_INTERVALO = args.intervalo
+    with contextlib.redirect_stdout(io.StringIO()):
+        inicializar_libros(ob, generadores.values())
+
+    lock_gen = threading.Lock()
+    detener = threading.Event()
+    colas = {symbol: deque() for symbol in simbolos}
+    desvios = {symbol: {} for symbol in simbolos}  # symbol -> {precio: momento del desvío} sin detectar
+    perdidos = {symbol: set() for symbol in simbolos}  # Todos los precios desviados (para los falsos positivos)
+    inyectar = set()  # Símbolos a los que perderles un qty 0 en el próximo mensaje
+    cuenta = {"inyectados": 0, "detectados": 0, "curados": 0, "falsos": 0}
+    latencias = []
+
+    # Resultados del verificador: una divergencia tiene que explicarse con los desvíos vigentes
+    registros = []
+    registrar = ob.registrar_verificacion
+
+    def registrar_verificacion(symbol, resultado, reintento=False):
+        if resultado['status'] == "divergente":
+            with lock_gen:
+                vigentes = desvios[symbol]
+                # Un desvío puede curarse entre la comparación y este registro: cuenta igual
+                if all(e['side'] == "bids" and e['price'] in perdidos[symbol] for e in resultado['examples']):
+                    # El resync corrige todos los desvíos del libro
+                    ahora = time.monotonic()
+                    latencias.extend(ahora - t for t in vigentes.values())
+                    cuenta['detectados'] += len(vigentes)
+                    vigentes.clear()
+                else:
+                    cuenta['falsos'] += 1
+                    print(f"falso positivo en {symbol}: {resultado['examples'][:3]}")
+        registros.append((symbol, resultado))
+        return registrar(symbol, resultado, reintento)
+
+    ob.registrar_verificacion = registrar_verificacion
+
+    def alimentar():
+        while not detener.is_set():
+            with lock_gen:
+                for symbol, gen in generadores.items():
+                    data = gen.evento()
+                    exchange.aplicar(symbol, data)
+                    colas[symbol].append(data)
+                    while len(colas[symbol]) > args.retraso:
+                        local = colas[symbol].popleft()
+                        book = ob.order_books[symbol]
+                        # Un desvío se cura solo si un update posterior vuelve a tocar el precio
+                        for precio, _ in local['b']:
+                            if desvios[symbol].pop(precio, None) is not None:
+                                cuenta['curados'] += 1
+                        if symbol in inyectar and book['initialized']:
+                            perdido = perder_cero(book, local)
+                            if perdido is not None:
+                                inyectar.discard(symbol)
+                                desvios[symbol][perdido] = time.monotonic()
+                                perdidos[symbol].add(perdido)
+                                cuenta['inyectados'] += 1
+                        ob.on_message_combined(None, gen.mensaje(local))
+            time.sleep(args.intervalo_ms / 1000)
+
+    salida = io.StringIO()
+    with contextlib.redirect_stdout(salida):
+        threading.Thread(target=alimentar, daemon=True).start()
+        ob.iniciar_verificacion()
+        inicio = time.monotonic()
+        proximo = inicio + args.desvio_cada
+        turno = 0
+        while time.monotonic() - inicio < args.duracion:
+            if time.monotonic() >= proximo:
+                with lock_gen:
+                    inyectar.add(simbolos[turno % len(simbolos)])
+                turno += 1
+                proximo += args.desvio_cada
+            time.sleep(0.01)
+
+        # Presupuesto: otros procesos de la IP usan la parte de las verificaciones
+        verificaciones_antes = len(registros)
+        exchange.peso = 0
+        exchange.peso_externo = ob.snapshot_scheduler.presupuesto_verificacion
+        time.sleep(max(2.0, args.intervalo * 8))  # La primera verificación trae el peso en el header
+        omitidas_presupuesto = sum(1 for _, r in registros[verificaciones_antes:] if r.get('reason') == "presupuesto")
+        book = ob.order_books[simbolos[0]]
+        with book['lock']:
+            book['initialized'] = False
+            book['first_event_after_snapshot'] = True
+            book['buffer'].reset()
+        t_resync = time.monotonic()
+        ob.programar_resync(simbolos[0])
+        while not (book['initialized'] and book['resync'] == "inactivo") and time.monotonic() - t_resync < 10:
+            time.sleep(0.005)
+        t_resync = time.monotonic() - t_resync
+        exchange.peso_externo = 0
+        detener.set()
+        time.sleep(0.2)
+        with lock_gen:
+            for symbol, cola in colas.items():
+                while cola:
+                    ob.on_message_combined(None, generadores[symbol].mensaje(cola.popleft()))
+
+    pendientes = sum(len(d) for d in desvios.values())
+    estados = {}
+    for _, resultado in registros:
+        estados[resultado['status']] = estados.get(resultado['status'], 0) + 1
+    locks = [r['lock_ms'] for _, r in registros if 'lock_ms' in r]
+
+    # Comparación completa (parseo del snapshot, copia con lock y comparación) con el feed detenido
+    symbol = simbolos[-1]
+    snap, _ = exchange.snapshot(symbol, 1000)
+    mejor = float("inf")
+    for _ in range(20):
+        t = time.perf_counter()
+        resultado = ob.comparar_con_snapshot(symbol, snap)
+        mejor = min(mejor, time.perf_counter() - t)
+    niveles = len(ob.order_books[symbol]['bids']) + len(ob.order_books[symbol]['asks'])
+
+    print("=" * 78)
+    print(f"🔎 Verificación en segundo plano: {args.simbolos} símbolos, {args.duracion:g}s, "
+          f"una verificación cada {args.intervalo:g}s")
+    print("=" * 78)
+    print(f"Verificaciones: {', '.join(f'{k} {v}' for k, v in sorted(estados.items()))}")
+    print(f"Desvíos inyectados (qty 0 perdido): {cuenta['inyectados']} | detectados y resincronizados: "
+          f"{cuenta['detectados']} | curados solos: {cuenta['curados']} | sin detectar al final: {pendientes}")
+    if latencias:
+        print(f"Desvío -> resync: p50 {percentil(latencias, 50) * 1000:.0f} ms | máx {max(latencias) * 1000:.0f} ms")
+    print(f"Falsos positivos: {cuenta['falsos']}")
+    if locks:
+        print(f"Lock de comparar_con_snapshot: p50 {percentil(locks, 50):.3f} ms | p99 {percentil(locks, 99):.3f} ms "
+              f"| máx {max(locks):.3f} ms")
+    print(f"Comparación completa ({niveles} niveles en el libro, {resultado['compared']} comparados): "
+          f"{mejor * 1000:.2f} ms, {resultado['lock_ms']:.3f} ms con el lock")
+    print(f"Peso de otros procesos en el límite de las verificaciones: {omitidas_presupuesto} verificaciones "
+          f"omitidas, resync en {t_resync * 1000:.0f} ms")
+    print("=" * 78)
+    for linea in salida.getvalue().splitlines():
+        if linea.startswith("falso positivo"):
+            print(linea)
+    servidor.shutdown()
+
+    fallas = []
+    if cuenta['falsos']:
+        fallas.append(f"{cuenta['falsos']} falsos positivos")
+    if not cuenta['detectados']:
+        fallas.append("no se detectó ningún desvío")
+    if not omitidas_presupuesto:
+        fallas.append("las verificaciones no respetaron el presupuesto")
+    if not ob.order_books[simbolos[0]]['initialized'] or t_resync >= 10:
+        fallas.append("el resync no terminó con el presupuesto ocupado")
+    print("\n".join(f"❌ {falla}" for falla in fallas) or "✅ Desvíos detectados sin falsos positivos")
+    return 1 if fallas else 0
+
+
+def perder_cero(book, data):
+    """Quita de `data` un qty 0 de bids cuyo precio está en el libro local: el libro se queda con
+    un nivel que el exchange ya borró. Devuelve el precio o None"""
+    for i, (precio, qty) in enumerate(data['b']):
+        if float(qty) == 0 and book['bids'].to_tick(precio) in book['bids'].niveles:
+            del data['b'][i]
+            return precio
+    return None
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,74 @@
+"""Benchmark: JSON (precio -> qty como strings) vs formato binario columnar de orderbook_wire.
+
+Mide el costo de codificar en el servidor y de decodificar en el cliente hasta tener
+precios y cantidades numéricos (lo que necesita calcular_bloques).
+
+Uso:
+    python benchmarks/bench_wire_format.py [--niveles 1000] [--repeticiones 200]
+"""
+import argparse
+import json
+import time
+
+from _comun import GeneradorDepth
+from orderbook_structure import BookSide
+from orderbook_wire import codificar_binario, decodificar_binario
+
+
+def medir(funcion, repeticiones):
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        resultado = funcion()
+    return (time.perf_counter() - inicio) / repeticiones, resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--niveles', type=int, default=1000, help='niveles por lado')
+    parser.add_argument('--repeticiones', type=int, default=200)
+    args = parser.parse_args()
+
+    gen = GeneradorDepth("BTCUSDT", niveles=args.niveles, seed=1)
+    snap = gen.snapshot()
+    bids, asks = BookSide(True, 10.0), BookSide(False, 10.0)
+    bids.load(snap['bids'])
+    asks.load(snap['asks'])
+    meta = {"symbol": "BTCUSDT", "lastUpdateId": snap['lastUpdateId'], "last_u": snap['lastUpdateId']}
+
+    def encode_json():
+        payload = dict(meta, bids=bids.as_dict(), asks=asks.as_dict())
+        return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    def encode_bin():
+        return codificar_binario(meta, bids.level_arrays(), asks.level_arrays())
+
+    def decode_json(body):
+        # Lo que hace el cliente hoy: json.loads + float() por cada precio y cantidad
+        data = json.loads(body)
+        return ([float(p) for p in data['bids']], [float(q) for q in data['bids'].values()],
+                [float(p) for p in data['asks']], [float(q) for q in data['asks'].values()])
+
+    t_enc_json, body_json = medir(encode_json, args.repeticiones)
+    t_enc_bin, body_bin = medir(encode_bin, args.repeticiones)
+    t_dec_json, _ = medir(lambda: decode_json(body_json), args.repeticiones)
+    t_dec_bin, (header, columnas) = medir(lambda: decodificar_binario(body_bin), args.repeticiones)
+
+    # Verificar que el binario conserva el libro
+    assert header["n_bids"] == len(bids) and header["n_asks"] == len(asks)
+    assert abs(columnas["bid_price"][0] - float(bids.best()[0])) < 1e-9
+
+    tipo = type(columnas["bid_price"]).__module__
+    print("=" * 72)
+    print(f"📦 Formato de respuesta ({args.niveles} niveles/lado, arrays cliente: {tipo})")
+    print("=" * 72)
+    print(f"{'':<10}{'tamaño':>12}{'encode':>16}{'decode':>16}")
+    print(f"{'JSON':<10}{len(body_json):>10,} B{t_enc_json * 1e6:>13.1f} µs{t_dec_json * 1e6:>13.1f} µs")
+    print(f"{'Binario':<10}{len(body_bin):>10,} B{t_enc_bin * 1e6:>13.1f} µs{t_dec_bin * 1e6:>13.1f} µs")
+    print("-" * 72)
+    print(f"Binario: {len(body_json) / len(body_bin):.1f}x más chico, encode {t_enc_json / t_enc_bin:.1f}x, "
+          f"decode {t_dec_json / t_dec_bin:.1f}x más rápido")
+    print("=" * 72)
+
+
+if __name__ == "__main__":
+    main()
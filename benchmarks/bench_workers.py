@@ -0,0 +1,153 @@
+"""Benchmark: `order book.py` en un proceso contra el modo multiproceso (--workers N).
+
+Levanta el simulador local y, para cada cantidad de workers, `order book.py` como
+proceso nuevo con todos los símbolos. Cuando todos los libros están listos mide
+durante `--duracion` segundos:
+  msg/s           mensajes de depth aplicados (suma de orderbook_messages_total de /metrics)
+  CPU µs/msg      CPU de todos los procesos del order book (frontal + workers) por mensaje
+  /orderbooks     latencia p50/p99 de GET /orderbooks/{symbol}?depth=20 (en modo workers
+                  pasa por el proceso frontal y el socket Unix)
+
+El simulador es un solo proceso: si no llega a generar `simbolos * tasa` mensajes por
+segundo, el techo es él y no el order book (se muestra la tasa pedida para comparar).
+Con un solo núcleo los workers no pueden escalar; el costo por mensaje igual sirve
+para ver cuánto agrega el modo multiproceso.
+
+Uso:
+    python benchmarks/bench_workers.py [--simbolos 200] [--tasa 20] [--workers 1,2,4] [--duracion 15]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+import requests
+
+from _comun import RAIZ
+from bench_simulador import esperar, puerto_libre
+
+
+def cpu_de(pids):
+    """Segundos de CPU (user + system) de los procesos, o None si no hay /proc"""
+    total = 0
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/stat") as archivo:
+                campos = archivo.read().rsplit(")", 1)[1].split()
+        except OSError:
+            return None
+        total += int(campos[11]) + int(campos[12])
+    return total / os.sysconf("SC_CLK_TCK")
+
+
+def mensajes_totales(url):
+    texto = requests.get(f"{url}/metrics", timeout=10).text
+    return sum(float(linea.rsplit(" ", 1)[1]) for linea in texto.splitlines()
+               if linea.startswith("orderbook_messages_total{"))
+
+
+def percentil(valores, p):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p))]
+
+
+def medir(workers, nombres, entorno, duracion, pedidos, timeout):
+    puerto = puerto_libre()
+    url = f"http://127.0.0.1:{puerto}"
+    proceso = subprocess.Popen(
+        [sys.executable, os.path.join(RAIZ, "order book.py"), "--puerto", str(puerto),
+         "--simbolos", ",".join(nombres), "--workers", str(workers)],
+        stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env=entorno,
+    )
+    try:
+        def listos():
+            try:
+                return requests.get(f"{url}/health", timeout=2).json()["initialized"] == len(nombres)
+            except (requests.RequestException, ValueError, KeyError):
+                return False
+
+        arranque = esperar(listos, timeout, paso=0.1)
+        assert arranque is not None, f"con {workers} worker(s) los libros no terminaron de inicializar"
+        salud = requests.get(f"{url}/health", timeout=10).json()
+        pids = [proceso.pid] + [w["pid"] for w in salud.get("workers", ())]
+
+        mensajes_inicio, cpu_inicio, inicio = mensajes_totales(url), cpu_de(pids), time.perf_counter()
+        time.sleep(duracion)
+        mensajes = mensajes_totales(url) - mensajes_inicio
+        segundos = time.perf_counter() - inicio
+        cpu_fin = cpu_de(pids)
+        cpu = None if cpu_inicio is None or cpu_fin is None else cpu_fin - cpu_inicio
+
+        sesion = requests.Session()
+        latencias = []
+        for i in range(pedidos):
+            t = time.perf_counter()
+            sesion.get(f"{url}/orderbooks/{nombres[i % len(nombres)]}?depth=20", timeout=10).raise_for_status()
+            latencias.append((time.perf_counter() - t) * 1000)
+
+        return {
+            "arranque_s": arranque,
+            "msg_s": mensajes / segundos,
+            "cpu_us_msg": cpu / mensajes * 1e6 if cpu is not None and mensajes else None,
+            "p50_ms": percentil(latencias, 0.5),
+            "p99_ms": percentil(latencias, 0.99),
+        }
+    finally:
+        proceso.terminate()
+        proceso.wait(30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--simbolos', type=int, default=200)
+    parser.add_argument('--tasa', type=float, default=20, help='depth updates por segundo y símbolo')
+    parser.add_argument('--workers', default=f"1,{max(2, os.cpu_count() or 1)}",
+                        help='cantidades de workers a comparar, separadas por comas')
+    parser.add_argument('--duracion', type=float, default=15, help='segundos de ingesta medidos')
+    parser.add_argument('--pedidos', type=int, default=500, help='GET /orderbooks para la latencia')
+    parser.add_argument('--timeout', type=float, default=120)
+    args = parser.parse_args()
+    cantidades = [int(n) for n in args.workers.split(",")]
+
+    puerto_sim = puerto_libre()
+    url_sim = f"127.0.0.1:{puerto_sim}"
+    simulador = subprocess.Popen(
+        [sys.executable, os.path.join(RAIZ, "simulator.py"), "--simbolos", str(args.simbolos),
+         "--tasa", str(args.tasa), "--puerto", str(puerto_sim), "--peso-maximo", "1000000"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        def simulador_listo():
+            try:
+                return requests.get(f"http://{url_sim}/sim/estado", timeout=1).ok
+            except requests.RequestException:
+                return False
+
+        assert esperar(simulador_listo, 30) is not None, "el simulador no arrancó"
+        nombres = [s['symbol'] for s in requests.get(f"http://{url_sim}/fapi/v1/exchangeInfo", timeout=10).json()['symbols']]
+        entorno = {**os.environ, "BINANCE_REST_URL": f"http://{url_sim}", "BINANCE_WS_URL": f"ws://{url_sim}",
+                   "ORDERBOOK_SNAPSHOT_LIMIT": "100"}
+        for clave in ("ORDERBOOK_SIMBOLOS", "ORDERBOOK_WORKERS", "ORDERBOOK_GRABACION_DIR"):
+            entorno.pop(clave, None)
+
+        resultados = {n: medir(n, nombres, entorno, args.duracion, args.pedidos, args.timeout) for n in cantidades}
+    finally:
+        simulador.terminate()
+        simulador.wait(10)
+
+    print("=" * 78)
+    print(f"🧩 order book.py por cantidad de workers: {args.simbolos} símbolos × {args.tasa:g} msg/s "
+          f"= {args.simbolos * args.tasa:,.0f} msg/s pedidos, {os.cpu_count()} CPU")
+    print("=" * 78)
+    print(f"{'workers':<10}{'arranque':>10}{'msg/s':>11}{'CPU µs/msg':>13}{'p50 ms':>10}{'p99 ms':>10}")
+    for n, r in resultados.items():
+        cpu = f"{r['cpu_us_msg']:.1f}" if r['cpu_us_msg'] is not None else "-"
+        print(f"{n:<10}{r['arranque_s']:>9.2f}s{r['msg_s']:>11,.0f}{cpu:>13}{r['p50_ms']:>10.2f}{r['p99_ms']:>10.2f}")
+    if (os.cpu_count() or 1) < 2:
+        print("⚠️ Un solo CPU: los workers comparten el núcleo con el simulador y no pueden escalar")
+    print("=" * 78)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,339 @@
+"""Suite de benchmarks con resultados en JSON para comparar corridas.
+
+Tres partes:
+  ingesta     mensajes/s y latencia p50/p99 de on_message_combined según la cantidad
+              de símbolos, con datos sintéticos o con una grabación (--grabacion).
+  api         requests/s y latencia de /orderbooks/{symbol}, /price, /health y /symbols con
+              muchos clientes concurrentes contra un uvicorn local. Los clientes son
+              procesos aparte (no comparten el GIL con el servidor) y un hilo sigue
+              aplicando depth updates mientras tanto.
+  estrategia  calcular_bloques y predecir_mejor_bloque de `Auto Runner.py` sobre
+              libros de tamaños reales (se omite si faltan sus dependencias o el modelo).
+
+Las métricas terminan en _s (por segundo: más es mejor) o en _us/_ms (latencia:
+menos es mejor). Con --comparar se marcan las que empeoraron más que --tolerancia
+respecto de otra corrida y el proceso termina con código 1.
+
+Uso:
+    python benchmarks/suite.py [--partes ingesta,api,estrategia] [--salida resultados.json]
+                               [--comparar base.json] [--tolerancia 0.15] [--grabacion DIR] [--rapido]
+"""
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import socket
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+from _comun import RAIZ, GeneradorDepth, cargar_order_book, cargar_script, inicializar_libros, percentil
+from depth_decoder import DECODIFICADOR
+from depth_recorder import leer_grabacion
+
+PARTES = ("ingesta", "api", "estrategia")
+SIMBOLOS_INGESTA = (1, 10, 100)
+NIVELES_ESTRATEGIA = (1000, 5000)
+
+
+def resumir(latencias, duracion, cantidad=None):
+    """Throughput y percentiles de una lista de latencias en segundos"""
+    cantidad = len(latencias) if cantidad is None else cantidad
+    return {
+        "por_s": round(cantidad / duracion, 1) if duracion else None,
+        "p50_us": round(percentil(latencias, 50) * 1e6, 2),
+        "p99_us": round(percentil(latencias, 99) * 1e6, 2),
+    }
+
+
+# ===== INGESTA =====
+def medir_ingesta(ob, mensajes):
+    on_message = ob.on_message_combined
+    latencias = []
+    inicio = time.perf_counter()
+    for mensaje in mensajes:
+        t0 = time.perf_counter()
+        on_message(None, mensaje)
+        latencias.append(time.perf_counter() - t0)
+    resumen = resumir(latencias, time.perf_counter() - inicio)
+    return {"mensajes_s": resumen["por_s"], "apply_p50_us": resumen["p50_us"], "apply_p99_us": resumen["p99_us"],
+            "mensajes": len(mensajes)}
+
+
+def bench_ingesta(ob, args):
+    resultados = {}
+    if args.grabacion:
+        # Primer snapshot de cada símbolo y los mensajes que lo siguen
+        mensajes, snapshots = [], {}
+        for _, tipo, symbol, payload in leer_grabacion(args.grabacion):
+            if tipo == "snapshot":
+                snapshots.setdefault(symbol, json.loads(payload))
+            elif symbol in snapshots:
+                mensajes.append(payload)
+        with contextlib.redirect_stdout(io.StringIO()):
+            ob.configurar_simbolos(sorted(snapshots))
+            for symbol, snap in snapshots.items():
+                ob.cargar_snapshot(symbol, snap)
+                ob.process_buffer(symbol)
+        resultados[f"grabacion_{len(snapshots)}_simbolos"] = medir_ingesta(ob, mensajes)
+        return resultados
+
+    total = 5000 if args.rapido else 30000
+    for cantidad in SIMBOLOS_INGESTA:
+        generadores = [GeneradorDepth(f"ING{i}USDT", niveles=1000, seed=i) for i in range(cantidad)]
+        with contextlib.redirect_stdout(io.StringIO()):
+            inicializar_libros(ob, generadores)
+        mensajes = [generadores[i % cantidad].mensaje(generadores[i % cantidad].evento(20)) for i in range(total)]
+        resultados[f"{cantidad}_simbolos"] = medir_ingesta(ob, mensajes)
+    return resultados
+
+
+# ===== API =====
+def puerto_libre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def cliente_api(url, segundos, resultados):
+    """Proceso cliente: pide `url` en bucle con una conexión keep-alive"""
+    import requests
+    sesion = requests.Session()
+    latencias = []
+    errores = 0
+    fin = time.monotonic() + segundos
+    while time.monotonic() < fin:
+        t0 = time.perf_counter()
+        try:
+            respuesta = sesion.get(url, timeout=10)
+            respuesta.content
+            if respuesta.status_code != 200:
+                errores += 1
+        except Exception:
+            errores += 1
+        latencias.append(time.perf_counter() - t0)
+    resultados.put((latencias, errores))
+
+
+def bench_api(ob, args):
+    import uvicorn
+
+    simbolos = 20
+    generadores = [GeneradorDepth(f"API{i}USDT", niveles=1000, seed=i) for i in range(simbolos)]
+    with contextlib.redirect_stdout(io.StringIO()):
+        inicializar_libros(ob, generadores)
+
+    puerto = puerto_libre()
+    servidor = uvicorn.Server(uvicorn.Config(ob.app, host="127.0.0.1", port=puerto, log_level="warning"))
+    threading.Thread(target=servidor.run, daemon=True).start()
+    while not servidor.started:
+        time.sleep(0.05)
+
+    # Los libros siguen cambiando durante las mediciones, como en vivo
+    detener = threading.Event()
+
+    def alimentar():
+        while not detener.is_set():
+            for gen in generadores:
+                ob.on_message_combined(None, gen.mensaje(gen.evento(20)))
+                ob.on_message_combined(None, gen.mensaje_book_ticker())
+            time.sleep(0.01)
+
+    threading.Thread(target=alimentar, daemon=True).start()
+
+    segundos = 1.5 if args.rapido else 5
+    endpoints = {
+        "orderbook": "/orderbooks/API0USDT",
+        "orderbook_depth20": "/orderbooks/API0USDT?depth=20",
+        "price": "/price/API0USDT",
+        "health": "/health",
+        "symbols": "/symbols",
+    }
+    resultados = {}
+    try:
+        for nombre, ruta in endpoints.items():
+            cola = multiprocessing.Queue()
+            procesos = [multiprocessing.Process(target=cliente_api,
+                                                args=(f"http://127.0.0.1:{puerto}{ruta}", segundos, cola))
+                        for _ in range(args.clientes)]
+            for proceso in procesos:
+                proceso.start()
+            por_cliente = [cola.get() for _ in procesos]
+            for proceso in procesos:
+                proceso.join()
+            latencias = [x for lat, _ in por_cliente for x in lat]
+            resumen = resumir(latencias, segundos)
+            resultados[nombre] = {
+                "requests_s": resumen["por_s"],
+                "p50_ms": round(resumen["p50_us"] / 1000, 3),
+                "p99_ms": round(resumen["p99_us"] / 1000, 3),
+                "errores": sum(err for _, err in por_cliente),
+                "clientes": args.clientes,
+            }
+    finally:
+        detener.set()
+        servidor.should_exit = True
+    return resultados
+
+
+# ===== ESTRATEGIA =====
+def bench_estrategia(args):
+    try:
+        runner = cargar_script('Auto Runner.py', 'auto_runner')
+    except Exception as e:
+        return None, f"Auto Runner.py no se pudo importar ({e.__class__.__name__}: {e})"
+
+    runner.AGRUPACION = 10.0
+    repeticiones = 5 if args.rapido else 20
+    anterior = os.getcwd()
+    os.chdir(RAIZ)  # El modelo se carga con rutas relativas a la raíz del repo
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            modelo, scaler, features = runner.cargar_modelo_ml()
+    finally:
+        os.chdir(anterior)
+
+    resultados = {}
+    for niveles in NIVELES_ESTRATEGIA:
+        gen = GeneradorDepth("BTCUSDT", niveles=niveles, seed=niveles)
+        snap = gen.snapshot()
+        # Mismo formato que devuelve /orderbooks/{symbol}
+        order_book = {"bids": dict(snap['bids']), "asks": dict(snap['asks'])}
+        precio_actual = gen.mid_tick * gen.tick_size
+
+        latencias = []
+        for _ in range(repeticiones):
+            t0 = time.perf_counter()
+            bloques_long, bloques_short = runner.calcular_bloques(order_book, gen.tick_size)
+            latencias.append(time.perf_counter() - t0)
+        fila = {"calcular_bloques_ms": round(percentil(latencias, 50) * 1e3, 3)}
+
+        if modelo is not None:
+            latencias = []
+            for _ in range(repeticiones):
+                t0 = time.perf_counter()
+                runner.predecir_mejor_bloque(bloques_long, precio_actual, True, modelo, scaler, features)
+                runner.predecir_mejor_bloque(bloques_short, precio_actual, False, modelo, scaler, features)
+                latencias.append(time.perf_counter() - t0)
+            fila["predecir_mejor_bloque_ms"] = round(percentil(latencias, 50) * 1e3, 3)
+        resultados[f"{niveles}_niveles"] = fila
+    return resultados, None if modelo is not None else "sin modelo ML: solo calcular_bloques"
+
+
+# ===== COMPARACIÓN =====
+def aplanar(resultados, prefijo=""):
+    """{"ingesta": {"1_simbolos": {"mensajes_s": x}}} -> {"ingesta.1_simbolos.mensajes_s": x}"""
+    plano = {}
+    for clave, valor in resultados.items():
+        nombre = f"{prefijo}{clave}"
+        if isinstance(valor, dict):
+            plano.update(aplanar(valor, nombre + "."))
+        elif isinstance(valor, (int, float)) and not isinstance(valor, bool):
+            plano[nombre] = valor
+    return plano
+
+
+def sentido(metrica):
+    """+1 si más es mejor, -1 si menos es mejor, None si no es una métrica de rendimiento"""
+    if metrica.endswith("_s"):
+        return 1
+    if metrica.endswith(("_us", "_ms")):
+        return -1
+    return None
+
+
+def comparar(actual, base, tolerancia):
+    """Lista de (métrica, base, actual, cambio relativo, empeoró) para las métricas comunes"""
+    filas = []
+    plano_actual, plano_base = aplanar(actual), aplanar(base)
+    for metrica in sorted(plano_actual.keys() & plano_base.keys()):
+        direccion = sentido(metrica)
+        anterior, ahora = plano_base[metrica], plano_actual[metrica]
+        if direccion is None or not anterior:
+            continue
+        cambio = (ahora - anterior) / anterior
+        filas.append((metrica, anterior, ahora, cambio, cambio * direccion < -tolerancia))
+    return filas
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--partes', default=",".join(PARTES), help='partes a correr, separadas por coma')
+    parser.add_argument('--salida', help='archivo JSON donde guardar los resultados')
+    parser.add_argument('--comparar', help='resultados JSON de una corrida anterior')
+    parser.add_argument('--tolerancia', type=float, default=0.15, help='empeoramiento relativo tolerado')
+    parser.add_argument('--grabacion', help='directorio de depth_recorder para la parte de ingesta')
+    parser.add_argument('--clientes', type=int, default=8, help='procesos cliente concurrentes para la API')
+    parser.add_argument('--rapido', action='store_true', help='menos mensajes y mediciones más cortas')
+    args = parser.parse_args()
+
+    partes = [p.strip() for p in args.partes.split(",") if p.strip()]
+    for parte in partes:
+        if parte not in PARTES:
+            parser.error(f"parte desconocida: {parte}")
+
+    ob = cargar_order_book()
+    resultados, omitidos = {}, {}
+    if "ingesta" in partes:
+        print("⏱️ Ingesta...", flush=True)
+        resultados["ingesta"] = bench_ingesta(ob, args)
+    if "api" in partes:
+        print("⏱️ API...", flush=True)
+        resultados["api"] = bench_api(ob, args)
+    if "estrategia" in partes:
+        print("⏱️ Estrategia...", flush=True)
+        estrategia, motivo = bench_estrategia(args)
+        if estrategia is not None:
+            resultados["estrategia"] = estrategia
+        if motivo:
+            omitidos["estrategia"] = motivo
+
+    corrida = {
+        "fecha": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "cpus": os.cpu_count(),
+        "json_decoder": DECODIFICADOR,
+        "rapido": args.rapido,
+        "resultados": resultados,
+        "omitidos": omitidos,
+    }
+
+    print("=" * 80)
+    print(f"📊 Suite de benchmarks ({corrida['fecha']}, Python {corrida['python']}, decoder {DECODIFICADOR})")
+    print("=" * 80)
+    for metrica, valor in aplanar(resultados).items():
+        print(f"{metrica:<58}{valor:>20,.2f}")
+    for parte, motivo in omitidos.items():
+        print(f"⚠️ {parte}: {motivo}")
+
+    regresiones = []
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as archivo:
+            base = json.load(archivo)
+        filas = comparar(resultados, base.get("resultados", {}), args.tolerancia)
+        print("-" * 80)
+        print(f"Comparación con {args.comparar} ({base.get('fecha')}), tolerancia {args.tolerancia:.0%}")
+        for metrica, anterior, ahora, cambio, empeoro in filas:
+            icono = "❌" if empeoro else "  "
+            print(f"{icono} {metrica:<52}{anterior:>11,.2f} -> {ahora:>11,.2f} ({cambio:+.1%})")
+            if empeoro:
+                regresiones.append(metrica)
+        corrida["comparacion"] = {"base": args.comparar, "tolerancia": args.tolerancia, "regresiones": regresiones}
+    print("=" * 80)
+
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as archivo:
+            json.dump(corrida, archivo, indent=2, ensure_ascii=False)
+        print(f"💾 Resultados guardados en {args.salida}")
+    if regresiones:
+        print(f"❌ {len(regresiones)} métrica(s) empeoraron más de {args.tolerancia:.0%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
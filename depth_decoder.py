@@ -0,0 +1,63 @@
+"""Decodificación de los mensajes del stream combinado de Binance (`/stream?streams=`).
+
+Elige el decodificador JSON más rápido disponible: msgspec, orjson o, como último
+recurso, json de la biblioteca estándar. Decodificar a un tipo con solo los campos
+del depth update (U/u/pu/b/a) resultó más lento que el decode genérico de msgspec:
+casi todo el costo está en las listas [precio, qty], que el libro usa igual.
+
+`decodificar_mensaje` devuelve siempre (stream, data) con `data` como dict, así el
+resto del código no depende de qué librería esté instalada.
+"""
+import json
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if msgspec is not None:
+    DECODIFICADOR = "msgspec"
+    _loads = msgspec.json.Decoder().decode
+elif orjson is not None:
+    DECODIFICADOR = "orjson"
+    _loads = orjson.loads
+else:
+    DECODIFICADOR = "json"
+    _loads = json.loads
+
+
+def decodificar_mensaje(message):
+    """(stream, data) de un mensaje combinado, o (None, None) si no es de un stream"""
+    parsed = _loads(message)
+    if type(parsed) is not dict:
+        return None, None
+    # Respuestas a SUBSCRIBE ({"result": null, "id": 1}) no traen stream
+    return parsed.get('stream'), parsed.get('data')
+
+
+_simbolos = {}
+
+
+def simbolo_de_stream(stream):
+    """"btcusdt@depth@100ms" -> "BTCUSDT" (cacheado: hay pocos streams y llegan miles de mensajes)"""
+    symbol = _simbolos.get(stream)
+    if symbol is None:
+        symbol = _simbolos[stream] = stream.split('@')[0].upper()
+    return symbol
+
+
+_streams = {}
+
+
+def clasificar_stream(stream):
+    """"btcusdt@depth@100ms" -> ("BTCUSDT", "depth"), "btcusdt@bookTicker" -> ("BTCUSDT", "bookTicker")"""
+    clasificado = _streams.get(stream)
+    if clasificado is None:
+        partes = stream.split('@')
+        clasificado = _streams[stream] = (partes[0].upper(), partes[1] if len(partes) > 1 else "")
+    return clasificado
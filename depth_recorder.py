@@ -0,0 +1,228 @@
+"""Grabación de los mensajes crudos de depth y de los snapshots REST.
+
+Formato: segmentos gzip append-only (`depth_<inicio_ms>.rec.gz`) con una línea por
+registro, separada por tabs:
+
+    <timestamp de recepción>\t<tipo: depth|snapshot>\t<SYMBOL>\t<payload JSON crudo>
+
+Cada segmento se cierra al superar `max_bytes` comprimidos o `max_segundos`, y
+entonces se agrega una línea a `indice.jsonl` con su rango de tiempo, cantidad de
+registros y símbolos; `leer_grabacion` usa ese índice para saltar directamente a
+los segmentos de un rango de tiempo.
+
+El hot path solo agrega el registro a una cola acotada (`deque.append`, sin locks
+ni notificaciones): el hilo escritor la vacía en lotes, comprime y escribe. Si la
+cola se llena se descartan registros (y se cuentan) en vez de frenar la ingesta.
+"""
+import glob
+import gzip
+import json
+import os
+import threading
+import time
+from collections import deque
+
+PREFIJO_SEGMENTO = "depth_"
+EXTENSION_SEGMENTO = ".rec.gz"
+ARCHIVO_INDICE = "indice.jsonl"
+
+# Máximo de registros que el escritor junta en una sola escritura
+MAX_LOTE = 2000
+
+
+class DepthRecorder:
+    """Graba mensajes de depth y snapshots en segmentos comprimidos desde un hilo de fondo"""
+
+    def __init__(self, directorio, max_bytes=64 * 1024 * 1024, max_segundos=300, max_cola=100000,
+                 nivel_compresion=6, intervalo_flush=1.0, intervalo_sondeo=0.01):
+        self.directorio = directorio
+        self.max_bytes = max_bytes
+        self.max_segundos = max_segundos
+        self.nivel_compresion = nivel_compresion
+        self.intervalo_flush = intervalo_flush
+        self.intervalo_sondeo = intervalo_sondeo
+        self.max_cola = max_cola
+        self.cola = deque()
+        self.hilo = None
+        self._detener = threading.Event()
+
+        self.grabados = 0
+        self.descartados = 0
+        self.segmentos = 0
+        self._segmento = None  # estado del segmento abierto (solo lo toca el hilo escritor)
+        os.makedirs(directorio, exist_ok=True)
+
+    # ----- Hot path -----
+    def registrar_depth(self, symbol, message, ts=None):
+        """Encola un mensaje crudo del stream (str o bytes) sin bloquear"""
+        self._encolar((time.time() if ts is None else ts, "depth", symbol, message))
+
+    def registrar_snapshot(self, symbol, snapshot, ts=None):
+        """Encola un snapshot REST (dict); se serializa en el hilo escritor"""
+        self._encolar((time.time() if ts is None else ts, "snapshot", symbol, snapshot))
+
+    def _encolar(self, registro):
+        if len(self.cola) >= self.max_cola:
+            self.descartados += 1
+            return
+        self.cola.append(registro)
+
+    # ----- Ciclo de vida -----
+    def start(self):
+        if self.hilo is None:
+            self.hilo = threading.Thread(target=self._escribir, name="depth-recorder", daemon=True)
+            self.hilo.start()
+            print(f"🎙️ Grabando depth y snapshots en {self.directorio}", flush=True)
+        return self
+
+    def cerrar(self, timeout=10):
+        """Vacía la cola, cierra el segmento abierto y lo agrega al índice"""
+        if self.hilo is None:
+            return
+        self._detener.set()
+        self.hilo.join(timeout)
+        self.hilo = None
+
+    # ----- Hilo escritor -----
+    def _escribir(self):
+        ultimo_flush = time.monotonic()
+        cola = self.cola
+        while True:
+            detener = self._detener.is_set()
+            lote = []
+            while cola and len(lote) < MAX_LOTE:
+                lote.append(cola.popleft())
+            if lote:
+                self._escribir_lote(lote)
+            elif detener:
+                self._cerrar_segmento()
+                return
+            else:
+                time.sleep(self.intervalo_sondeo)
+
+            # Flush periódico: un corte deja como mucho `intervalo_flush` segundos sin grabar
+            if self._segmento is not None and time.monotonic() - ultimo_flush >= self.intervalo_flush:
+                self._segmento["archivo"].flush()
+                ultimo_flush = time.monotonic()
+
+    def _escribir_lote(self, lote):
+        lineas = []
+        for ts, tipo, symbol, payload in lote:
+            if self._segmento is None or self._hay_que_rotar(ts):
+                self._volcar(lineas)
+                lineas = []
+                self._cerrar_segmento()
+                self._abrir_segmento(ts)
+            if tipo == "snapshot":
+                payload = json.dumps(payload, separators=(",", ":"))
+            elif isinstance(payload, (bytes, bytearray)):
+                payload = payload.decode("utf-8")
+            lineas.append(f"{ts:.6f}\t{tipo}\t{symbol}\t{payload}\n")
+            segmento = self._segmento
+            segmento["registros"] += 1
+            segmento["hasta"] = ts
+            segmento["simbolos"].add(symbol)
+        self._volcar(lineas)
+        self.grabados += len(lote)
+
+    def _volcar(self, lineas):
+        if lineas:
+            self._segmento["archivo"].write("".join(lineas).encode("utf-8"))
+
+    def _hay_que_rotar(self, ts):
+        segmento = self._segmento
+        return (ts - segmento["desde"] >= self.max_segundos
+                or segmento["crudo"].tell() >= self.max_bytes)
+
+    def _abrir_segmento(self, ts):
+        nombre = f"{PREFIJO_SEGMENTO}{int(ts * 1000)}{EXTENSION_SEGMENTO}"
+        crudo = open(os.path.join(self.directorio, nombre), "ab")
+        self._segmento = {
+            "nombre": nombre,
+            "crudo": crudo,
+            "archivo": gzip.GzipFile(fileobj=crudo, mode="ab", compresslevel=self.nivel_compresion),
+            "desde": ts,
+            "hasta": ts,
+            "registros": 0,
+            "simbolos": set(),
+        }
+        self.segmentos += 1
+
+    def _cerrar_segmento(self):
+        segmento = self._segmento
+        if segmento is None:
+            return
+        self._segmento = None
+        segmento["archivo"].close()
+        segmento["crudo"].close()
+        entrada = {
+            "archivo": segmento["nombre"],
+            "desde": segmento["desde"],
+            "hasta": segmento["hasta"],
+            "registros": segmento["registros"],
+            "simbolos": sorted(segmento["simbolos"]),
+        }
+        with open(os.path.join(self.directorio, ARCHIVO_INDICE), "a", encoding="utf-8") as indice:
+            indice.write(json.dumps(entrada) + "\n")
+
+    def estadisticas(self):
+        return {
+            "dir": self.directorio,
+            "recorded": self.grabados,
+            "dropped": self.descartados,
+            "queued": len(self.cola),
+            "segments": self.segmentos,
+        }
+
+
+# ===== LECTURA =====
+def segmentos_de(directorio, desde=None, hasta=None, simbolos=None):
+    """Segmentos que pueden tener registros en [desde, hasta], en orden cronológico.
+
+    Los cerrados se filtran con el índice; los que no están en el índice (el segmento
+    abierto o uno cortado por una caída) se incluyen usando el inicio de su nombre.
+    """
+    indexados = {}
+    ruta_indice = os.path.join(directorio, ARCHIVO_INDICE)
+    if os.path.exists(ruta_indice):
+        with open(ruta_indice, encoding="utf-8") as indice:
+            for linea in indice:
+                if linea.strip():
+                    entrada = json.loads(linea)
+                    indexados[entrada["archivo"]] = entrada
+
+    seleccion = []
+    for ruta in glob.glob(os.path.join(directorio, f"{PREFIJO_SEGMENTO}*{EXTENSION_SEGMENTO}")):
+        nombre = os.path.basename(ruta)
+        inicio = int(nombre[len(PREFIJO_SEGMENTO):-len(EXTENSION_SEGMENTO)]) / 1000
+        entrada = indexados.get(nombre)
+        if entrada is not None:
+            if desde is not None and entrada["hasta"] < desde:
+                continue
+            if simbolos is not None and not set(simbolos) & set(entrada["simbolos"]):
+                continue
+        if hasta is not None and inicio > hasta:
+            continue
+        seleccion.append((inicio, ruta))
+    return [ruta for _, ruta in sorted(seleccion)]
+
+
+def leer_grabacion(directorio, desde=None, hasta=None, simbolos=None):
+    """Registros (ts, tipo, symbol, payload_str) en orden, filtrados por tiempo y símbolos"""
+    simbolos = set(simbolos) if simbolos is not None else None
+    for ruta in segmentos_de(directorio, desde, hasta, simbolos):
+        with gzip.open(ruta, "rt", encoding="utf-8") as archivo:
+            try:
+                for linea in archivo:
+                    ts, tipo, symbol, payload = linea.rstrip("\n").split("\t", 3)
+                    ts = float(ts)
+                    if desde is not None and ts < desde:
+                        continue
+                    if hasta is not None and ts > hasta:
+                        continue
+                    if simbolos is not None and symbol not in simbolos:
+                        continue
+                    yield ts, tipo, symbol, payload
+            except (EOFError, gzip.BadGzipFile):
+                # Segmento abierto o cortado por una caída: se usa lo que llegó a escribirse
+                continue
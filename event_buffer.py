@@ -0,0 +1,66 @@
+import time
+from collections import deque
+
+
+class EventBuffer:
+    """Buffer de depth updates recibidos mientras el libro no está inicializado.
+
+    - `append` es O(1) amortizado: los eventos viejos (más de `max_edad` segundos)
+      salen por la izquierda y cada evento entra y sale una sola vez.
+    - Si se alcanzan `max_eventos` (snapshots que fallan una y otra vez), el buffer
+      se vacía y se cuenta un desborde en vez de crecer sin límite. El snapshot en
+      curso ya no puede enlazarse con el buffer: la inicialización lo descarta y
+      pide otro contra eventos frescos.
+    - `descartar_hasta` aplica el paso 4 del protocolo de Binance (u < lastUpdateId)
+      también en O(1) amortizado.
+    """
+
+    __slots__ = ('eventos', 'max_eventos', 'max_edad', 'desbordes')
+
+    def __init__(self, max_eventos=5000, max_edad=60.0):
+        self.eventos = deque()  # (instante de recepción, data)
+        self.max_eventos = max_eventos
+        self.max_edad = max_edad
+        self.desbordes = 0
+
+    def __len__(self):
+        return len(self.eventos)
+
+    def __iter__(self):
+        for _, data in self.eventos:
+            yield data
+
+    def append(self, data, ahora=None):
+        """Agrega un evento. Devuelve False si hubo desborde y el buffer se reinició"""
+        if ahora is None:
+            ahora = time.monotonic()
+        eventos = self.eventos
+
+        # Descartar eventos más viejos que max_edad
+        limite = ahora - self.max_edad
+        while eventos and eventos[0][0] < limite:
+            eventos.popleft()
+
+        if len(eventos) >= self.max_eventos:
+            eventos.clear()
+            eventos.append((ahora, data))
+            self.desbordes += 1
+            return False
+
+        eventos.append((ahora, data))
+        return True
+
+    def reset(self, data=None):
+        """Vacía el buffer, opcionalmente dejando un primer evento"""
+        self.eventos.clear()
+        if data is not None:
+            self.eventos.append((time.monotonic(), data))
+
+    def descartar_hasta(self, last_update_id):
+        """Elimina los eventos con u < last_update_id"""
+        eventos = self.eventos
+        while eventos and eventos[0][1]['u'] < last_update_id:
+            eventos.popleft()
+
+    def primero(self):
+        return self.eventos[0][1] if self.eventos else None
@@ -0,0 +1,75 @@
+"""Cache en disco de metadatos de exchange (símbolos, tick size, qty step) con TTL.
+
+Los metadatos casi no cambian pero pedirlos en cada arranque cuesta un round-trip
+(exchangeInfo de Binance Futures pesa más de 1 MB). Se guarda solo lo que usan los
+scripts, ya reducido, en un JSON por fuente (`<nombre>.json` en ORDERBOOK_CACHE_DIR o
+en el directorio temporal del sistema). Si el cache venció se vuelve a pedir; si el
+pedido falla y hay un cache vencido se usa ese, para que un reinicio bajo un
+supervisor no dependa de que el exchange responda en ese momento.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+TTL_POR_DEFECTO = 6 * 3600  # segundos
+
+
+def directorio_por_defecto():
+    return os.environ.get("ORDERBOOK_CACHE_DIR") or os.path.join(tempfile.gettempdir(), "orderbook_cache")
+
+
+def nombre_de_cache(prefijo, url):
+    """Un archivo por exchange y URL base (producción y simulador no se mezclan)"""
+    return f"{prefijo}_{hashlib.sha1(url.encode()).hexdigest()[:10]}"
+
+
+def ruta_cache(nombre, directorio=None):
+    return os.path.join(directorio or directorio_por_defecto(), f"{nombre}.json")
+
+
+def leer_cache(nombre, ttl, directorio=None):
+    """(datos, vigente) del cache, o (None, False) si no existe o está dañado"""
+    ruta = ruta_cache(nombre, directorio)
+    try:
+        with open(ruta, encoding="utf-8") as archivo:
+            contenido = json.load(archivo)
+        return contenido["datos"], time.time() - contenido["guardado"] < ttl
+    except (OSError, ValueError, KeyError, TypeError):
+        return None, False
+
+
+def guardar_cache(nombre, datos, directorio=None):
+    """Escritura atómica (archivo temporal + rename): un lector nunca ve un JSON a medias"""
+    ruta = ruta_cache(nombre, directorio)
+    try:
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        temporal = f"{ruta}.{os.getpid()}.tmp"
+        with open(temporal, "w", encoding="utf-8") as archivo:
+            json.dump({"guardado": time.time(), "datos": datos}, archivo, separators=(",", ":"))
+        os.replace(temporal, ruta)
+    except OSError as e:
+        print(f"⚠️ No se pudo guardar el cache {ruta}: {e}")
+
+
+def cargar_cacheado(nombre, obtener, ttl=TTL_POR_DEFECTO, directorio=None):
+    """Datos del cache si no vencieron; si no, `obtener()` y se guardan.
+
+    Con ttl <= 0 siempre se llama a `obtener()`. Si `obtener()` falla se usa el cache
+    vencido (si hay) y si no, la excepción se propaga.
+    """
+    datos, vigente = leer_cache(nombre, ttl, directorio) if ttl > 0 else (None, False)
+    if vigente:
+        return datos
+    try:
+        nuevos = obtener()
+    except Exception as e:
+        if datos is None:
+            datos, _ = leer_cache(nombre, float("inf"), directorio)
+        if datos is None:
+            raise
+        print(f"⚠️ No se pudieron actualizar los metadatos ({e}), usando el cache vencido")
+        return datos
+    guardar_cache(nombre, nuevos, directorio)
+    return nuevos
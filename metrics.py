@@ -0,0 +1,169 @@
+"""Métricas de latencia y throughput en formato de texto de Prometheus, sin dependencias.
+
+Los histogramas tienen límites fijos y solo cuentan: observar un valor es un bisect
+sobre una tupla corta y dos sumas, sin locks. Cada símbolo lo actualiza un único
+hilo (el de su shard), así que no hay carreras en el hot path; en las métricas
+compartidas (rutas de la API) el event loop es el único escritor. En el hot path
+los histogramas se alimentan con una muestra de los mensajes (ver
+METRICAS_MUESTREO en `order book.py`): los percentiles no cambian y el costo por
+mensaje queda en un contador.
+
+Lo que ya se lleva en otra parte (tamaño de los buffers, profundidad de los libros,
+contadores del scheduler o del cache) no se duplica: se lee al armar /metrics.
+"""
+import time
+from bisect import bisect_left
+
+# Límites de los buckets en segundos
+LIMITES_LAG = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LIMITES_PROCESAMIENTO = (2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 5e-3, 0.025, 0.1)
+LIMITES_ESPERA_LOCK = (1e-6, 5e-6, 2.5e-5, 1e-4, 5e-4, 2.5e-3, 0.01, 0.05, 0.25)
+LIMITES_RESYNC = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+LIMITES_API = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+# Tipo de contenido de la exposición de texto de Prometheus
+MEDIA_TYPE_PROMETHEUS = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Histograma:
+    """Histograma acumulable al estilo Prometheus (buckets con `le`)"""
+
+    __slots__ = ('limites', 'cuentas', 'suma')
+
+    def __init__(self, limites):
+        self.limites = limites
+        self.cuentas = [0] * (len(limites) + 1)  # el último es +Inf
+        self.suma = 0.0
+
+    def observar(self, valor):
+        self.cuentas[bisect_left(self.limites, valor)] += 1
+        self.suma += valor
+
+    @property
+    def total(self):
+        return sum(self.cuentas)
+
+
+class MetricasSimbolo:
+    """Métricas del hot path de un símbolo"""
+
+    __slots__ = ('mensajes', 'lag', 'procesamiento', 'espera_lock', 'huecos', 'resync', 'resync_fallidos')
+
+    def __init__(self):
+        self.mensajes = 0
+        self.lag = Histograma(LIMITES_LAG)
+        self.procesamiento = Histograma(LIMITES_PROCESAMIENTO)
+        self.espera_lock = Histograma(LIMITES_ESPERA_LOCK)
+        self.huecos = 0
+        self.resync = Histograma(LIMITES_RESYNC)
+        self.resync_fallidos = 0
+
+    def registrar(self, evento_ms, procesamiento, espera_lock):
+        """Un mensaje muestreado: `evento_ms` es el campo E de Binance (ms desde epoch).
+        `mensajes` lo incrementa quien llama, para todos los mensajes."""
+        self.procesamiento.observar(procesamiento)
+        self.espera_lock.observar(espera_lock)
+        if evento_ms:
+            # Con relojes desfasados el lag puede salir negativo: cae en el primer bucket
+            self.lag.observar(time.time() - evento_ms / 1000)
+
+
+class MetricasAPI:
+    """Latencia y respuestas por ruta (la plantilla, p. ej. /orderbooks/{symbol})"""
+
+    def __init__(self):
+        self.rutas = {}  # ruta -> (Histograma, {status: cantidad})
+
+    def registrar(self, ruta, status, duracion):
+        entrada = self.rutas.get(ruta)
+        if entrada is None:
+            entrada = self.rutas[ruta] = (Histograma(LIMITES_API), {})
+        entrada[0].observar(duracion)
+        entrada[1][status] = entrada[1].get(status, 0) + 1
+
+
+class MiddlewareMetricas:
+    """Middleware ASGI puro (sin BaseHTTPMiddleware) que mide cada request HTTP por ruta"""
+
+    def __init__(self, app, metricas):
+        self.app = app
+        self.metricas = metricas
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        inicio = time.perf_counter()
+        status = [500]
+
+        async def enviar(mensaje):
+            if mensaje["type"] == "http.response.start":
+                status[0] = mensaje["status"]
+            await send(mensaje)
+
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            # El router deja la ruta resuelta en el scope; las rutas inexistentes se agrupan
+            ruta = getattr(scope.get("route"), "path", None) or "sin_ruta"
+            self.metricas.registrar(ruta, status[0], time.perf_counter() - inicio)
+
+
+class TextoPrometheus:
+    """Arma la exposición de texto agrupando las muestras por familia de métricas"""
+
+    def __init__(self):
+        self.familias = {}  # nombre -> (tipo, ayuda, líneas)
+
+    def _lineas(self, nombre, tipo, ayuda):
+        familia = self.familias.get(nombre)
+        if familia is None:
+            familia = self.familias[nombre] = (tipo, ayuda, [])
+        return familia[2]
+
+    def muestra(self, nombre, valor, etiquetas=None, tipo="gauge", ayuda=""):
+        self._lineas(nombre, tipo, ayuda).append(f"{nombre}{_etiquetas(etiquetas)} {_valor(valor)}")
+
+    def contador(self, nombre, valor, etiquetas=None, ayuda=""):
+        self.muestra(nombre, valor, etiquetas, "counter", ayuda)
+
+    def histograma(self, nombre, histograma, etiquetas=None, ayuda=""):
+        lineas = self._lineas(nombre, "histogram", ayuda)
+        etiquetas = etiquetas or {}
+        acumulado = 0
+        for limite, cuenta in zip(histograma.limites, histograma.cuentas):
+            acumulado += cuenta
+            lineas.append(f"{nombre}_bucket{_etiquetas({**etiquetas, 'le': repr(float(limite))})} {acumulado}")
+        acumulado += histograma.cuentas[-1]
+        lineas.append(f"{nombre}_bucket{_etiquetas({**etiquetas, 'le': '+Inf'})} {acumulado}")
+        lineas.append(f"{nombre}_sum{_etiquetas(etiquetas)} {_valor(histograma.suma)}")
+        lineas.append(f"{nombre}_count{_etiquetas(etiquetas)} {acumulado}")
+
+    def render(self):
+        salida = []
+        for nombre, (tipo, ayuda, lineas) in self.familias.items():
+            if ayuda:
+                salida.append(f"# HELP {nombre} {ayuda}")
+            salida.append(f"# TYPE {nombre} {tipo}")
+            salida.extend(lineas)
+        return "\n".join(salida) + "\n"
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _etiquetas(etiquetas):
+    if not etiquetas:
+        return ""
+    return "{" + ",".join(f'{clave}="{_escapar(valor)}"' for clave, valor in etiquetas.items()) + "}"
+
+
+def _valor(valor):
+    if valor is None:
+        return "NaN"
+    if isinstance(valor, bool):
+        return "1" if valor else "0"
+    if isinstance(valor, float):
+        return repr(valor)
+    return str(valor)
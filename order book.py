@@ -1,16 +1,35 @@
-import websocket
+import argparse
 import json
-import requests
 import threading
 import asyncio
 import time
-from fastapi import FastAPI
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, Response
 import uvicorn
-from binance.client import Client
-from collections import OrderedDict
+import requests
 import sys
 import io
+import os
+import atexit
+import math
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict, deque
+from typing import Optional
+from orderbook_structure import MUESTRA_MEMORIA, BookSide, escala_desde_precio, escala_desde_tick_size
+from orderbook_blocks import BlockAggregator
+from response_cache import ResponseCache
+from event_buffer import EventBuffer
+from snapshot_scheduler import BINANCE_REST_URL, PRIORIDAD_VERIFICACION, PresupuestoAgotado, SnapshotScheduler
+from orderbook_wire import MEDIA_TYPE_BINARIO, codificar_binario
+from orderbook_shm import SharedBookWriter, directorio_por_defecto, verificar_plataforma
+from depth_recorder import DepthRecorder
+from exchange_cache import TTL_POR_DEFECTO, cargar_cacheado, nombre_de_cache
+from depth_decoder import DECODIFICADOR, clasificar_stream, decodificar_mensaje
+from metrics import MEDIA_TYPE_PROMETHEUS, MetricasAPI, MetricasSimbolo, MiddlewareMetricas, TextoPrometheus
+from price_feed import STREAM_BOOK_TICKER, PrecioSimbolo, streams_precio_desde_config
+from ws_shards import BINANCE_WS_URL, ShardedStreamManager
+from async_ingestion import AsyncShardedStreamManager
+from worker_pool import PoolWorkers, crear_app_frontal
 
 # Configurar encoding UTF-8 para Windows
 if sys.platform == 'win32':
@@ -18,19 +37,39 @@ if sys.platform == 'win32':
     sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
 
 # ===== CONFIGURACIÓN BINANCE =====
-api_key = ''
-api_secret = ''
-client = Client(api_key=api_key, api_secret=api_secret)
+# REST y WebSocket de Binance Futures; se pueden apuntar al simulador local (simulator.py)
+BINANCE_REST_URL = os.environ.get("BINANCE_REST_URL", BINANCE_REST_URL).rstrip("/")
+BINANCE_WS_URL = os.environ.get("BINANCE_WS_URL", BINANCE_WS_URL).rstrip("/")
+
+# Tick size (PRICE_FILTER) de cada símbolo, se completa al validar
+tick_sizes = {}
+
+# Segundos que vale el cache en disco de exchangeInfo (ORDERBOOK_CACHE_TTL=0 lo desactiva)
+EXCHANGE_CACHE_TTL = float(os.environ.get("ORDERBOOK_CACHE_TTL", TTL_POR_DEFECTO))
 
 # ===== FUNCIÓN PARA VALIDAR SÍMBOLOS =====
+def descargar_tick_sizes_binance():
+    """{symbol: tickSize} de los símbolos en TRADING según /fapi/v1/exchangeInfo"""
+    print("🔍 Conectando con Binance Futures para validar símbolos...")
+    respuesta = requests.get(f"{BINANCE_REST_URL}/fapi/v1/exchangeInfo", timeout=10)
+    respuesta.raise_for_status()
+    ticks = {}
+    for s in respuesta.json()['symbols']:
+        if s['status'] != 'TRADING':
+            continue
+        ticks[s['symbol']] = next((f.get('tickSize') for f in s.get('filters', [])
+                                   if f.get('filterType') == 'PRICE_FILTER'), None)
+    return ticks
+
 def validar_simbolos_binance(simbolos_input):
-    """Valida que los símbolos existan en Binance Futures"""
+    """Valida que los símbolos existan en Binance Futures (exchangeInfo cacheado en disco)"""
     try:
-        print("🔍 Conectando con Binance Futures para validar símbolos...")
-        # Obtener todos los símbolos disponibles en Binance Futures
-        exchange_info = client.futures_exchange_info()
-        simbolos_validos = {s['symbol'] for s in exchange_info['symbols'] if s['status'] == 'TRADING'}
-        
+        simbolos_validos = cargar_cacheado(nombre_de_cache("binance_futures", BINANCE_REST_URL),
+                                           descargar_tick_sizes_binance, EXCHANGE_CACHE_TTL)
+
+        # Guardar el tick size para indexar los precios del libro en ticks enteros
+        tick_sizes.update(simbolos_validos)
+
         simbolos_validados = []
         simbolos_invalidos = []
         
@@ -50,87 +89,251 @@ def validar_simbolos_binance(simbolos_input):
         return [], []
 
 # ===== SELECCIÓN DE SÍMBOLOS =====
-print("\n" + "="*80)
-print("🔷 CONFIGURACIÓN DE SÍMBOLOS PARA ORDER BOOK")
-print("="*80)
-print("Ingresa los símbolos separados por comas (ejemplo: BTC,ETH,SOL,BNB)")
-print("Nota: Se agregará automáticamente 'USDT' si no lo incluyes")
-print("-"*80)
-
-while True:
-    simbolos_input = input("\n➡️  Símbolos: ").strip().upper()
-    
-    if not simbolos_input:
-        print("❌ Debes ingresar al menos un símbolo. Intenta nuevamente.")
-        continue
-    
-    # Separar por comas y limpiar espacios
-    simbolos_lista = [s.strip() for s in simbolos_input.split(',') if s.strip()]
-    
-    if not simbolos_lista:
-        print("❌ No se detectaron símbolos válidos. Intenta nuevamente.")
-        continue
-    
-    print(f"\n🔍 Validando {len(simbolos_lista)} símbolo(s) en Binance Futures...")
-    simbolos_validados, simbolos_invalidos = validar_simbolos_binance(simbolos_lista)
-    
+def simbolos_configurados(argumento=None):
+    """Símbolos de --simbolos, de ORDERBOOK_SIMBOLOS o de `simbolos_orderbook` en config.py
+    (en ese orden), o None si no hay ninguno configurado"""
+    valor = argumento or os.environ.get("ORDERBOOK_SIMBOLOS")
+    if not valor:
+        try:
+            import config
+            valor = getattr(config, "simbolos_orderbook", None)
+        except ImportError:
+            valor = None
+    if not valor:
+        return None
+    if isinstance(valor, str):
+        valor = valor.split(",")
+    return [s.strip().upper() for s in valor if s.strip()]
+
+def validar_simbolos_configurados(simbolos):
+    """Valida sin preguntar por consola: descarta los inválidos y sale si no queda ninguno"""
+    print(f"\n🔍 Validando {len(simbolos)} símbolo(s) configurados en Binance Futures...")
+    simbolos_validados, simbolos_invalidos = validar_simbolos_binance(simbolos)
     if simbolos_invalidos:
-        print(f"\n⚠️  Símbolos NO encontrados en Binance Futures:")
-        for s in simbolos_invalidos:
-            print(f"   ❌ {s}")
-    
-    if simbolos_validados:
-        print(f"\n✅ Símbolos validados ({len(simbolos_validados)}):")
-        for s in simbolos_validados:
-            print(f"   ✓ {s}")
-        
-        confirmar = input(f"\n¿Deseas continuar con estos {len(simbolos_validados)} símbolo(s)? (s/n): ").strip().lower()
-        if confirmar in ['s', 'si', 'yes', 'y', '']:
-            coins = simbolos_validados
-            break
+        print(f"⚠️  Símbolos NO encontrados en Binance Futures (se ignoran): {', '.join(simbolos_invalidos)}")
+    if not simbolos_validados:
+        print("❌ Ninguno de los símbolos configurados es válido")
+        sys.exit(1)
+    return simbolos_validados
+
+def seleccionar_simbolos():
+    """Pide los símbolos por consola hasta obtener una lista validada en Binance Futures"""
+    print("\n" + "="*80)
+    print("🔷 CONFIGURACIÓN DE SÍMBOLOS PARA ORDER BOOK")
+    print("="*80)
+    print("Ingresa los símbolos separados por comas (ejemplo: BTC,ETH,SOL,BNB)")
+    print("Nota: Se agregará automáticamente 'USDT' si no lo incluyes")
+    print("-"*80)
+
+    while True:
+        simbolos_input = input("\n➡️  Símbolos: ").strip().upper()
+
+        if not simbolos_input:
+            print("❌ Debes ingresar al menos un símbolo. Intenta nuevamente.")
+            continue
+
+        # Separar por comas y limpiar espacios
+        simbolos_lista = [s.strip() for s in simbolos_input.split(',') if s.strip()]
+
+        if not simbolos_lista:
+            print("❌ No se detectaron símbolos válidos. Intenta nuevamente.")
+            continue
+
+        print(f"\n🔍 Validando {len(simbolos_lista)} símbolo(s) en Binance Futures...")
+        simbolos_validados, simbolos_invalidos = validar_simbolos_binance(simbolos_lista)
+
+        if simbolos_invalidos:
+            print(f"\n⚠️  Símbolos NO encontrados en Binance Futures:")
+            for s in simbolos_invalidos:
+                print(f"   ❌ {s}")
+
+        if simbolos_validados:
+            print(f"\n✅ Símbolos validados ({len(simbolos_validados)}):")
+            for s in simbolos_validados:
+                print(f"   ✓ {s}")
+
+            confirmar = input(f"\n¿Deseas continuar con estos {len(simbolos_validados)} símbolo(s)? (s/n): ").strip().lower()
+            if confirmar in ['s', 'si', 'yes', 'y', '']:
+                return simbolos_validados
+            else:
+                print("\n🔄 Volviendo a solicitar símbolos...")
         else:
-            print("\n🔄 Volviendo a solicitar símbolos...")
-    else:
-        print("\n❌ No se encontraron símbolos válidos. Intenta nuevamente.")
+            print("\n❌ No se encontraron símbolos válidos. Intenta nuevamente.")
 
-print("\n" + "="*80)
-print(f"🎯 SÍMBOLOS SELECCIONADOS: {', '.join(coins)}")
-print("="*80 + "\n")
+# Estructura mejorada para los libros de órdenes (se completa en configurar_simbolos)
+coins = []
+order_books = {}
 
-# Estructura mejorada para los libros de órdenes
-order_books = {
-    symbol: {
-        "bids": OrderedDict(),
-        "asks": OrderedDict(),
+def nuevo_order_book(symbol):
+    """Crea el estado vacío del libro de un símbolo"""
+    escala = escala_desde_tick_size(tick_sizes.get(symbol))
+    return {
+        "bids": BookSide(es_bid=True, escala=escala),
+        "asks": BookSide(es_bid=False, escala=escala),
         "lastUpdateId": None,
-        "buffer": [],
+        "buffer": EventBuffer(BUFFER_MAX_EVENTOS, BUFFER_MAX_EDAD),
         "initialized": False,
         "last_u": None,
-        "retry_count": 0,  # Para retry exponencial
-        "first_event_after_snapshot": True  # Bandera para el primer evento
-    } for symbol in coins
-}
-order_book_lock = threading.Lock()
+        # Máquina de estados del resync (protegida por resync_lock) e inicio del resync en curso
+        "resync": "inactivo",
+        "resync_inicio": None,
+        "first_event_after_snapshot": True,  # Bandera para el primer evento
+        # Bloques agrupados mantenidos incrementalmente: ticks_por_bloque -> BlockAggregator (LRU)
+        "agregadores": OrderedDict(),
+        # Últimas actualizaciones aplicadas como (last_u anterior, u, b, a) para /diff
+        "historial": deque(maxlen=DIFF_HISTORIAL),
+        # Tick más profundo de cada lado (bids, asks) que cubrió el último snapshot: más allá los
+        # diffs solo traen lo que cambió, así que el libro puede no tener todos los niveles.
+        # La poda la acerca al top hasta el último nivel conservado
+        "cobertura": (None, None),
+        # Límites de poda (máx. niveles por lado, banda alrededor del mid) o None si no se poda
+        "poda": limites_de_poda(symbol),
+        # Niveles conservados por lado en la última poda desde el snapshot (0 = lado sin podar)
+        "conservados_poda": [0, 0],
+        "niveles_podados": [0, 0],  # Total podado por lado (bids, asks)
+        "resyncs_poda": 0,  # Resyncs porque el precio llegó a la zona podada
+        # Resultados de la verificación contra snapshots REST y niveles distintos encontrados
+        "verificaciones": {"ok": 0, "divergente": 0, "omitida": 0},
+        "niveles_divergentes": 0,
+        # Último trade y mejor bid/ask de bookTicker/aggTrade (se leen sin lock)
+        "precio": PrecioSimbolo(),
+        # Histogramas y contadores del símbolo para /metrics (None si están desactivadas)
+        "metricas": MetricasSimbolo() if METRICAS else None,
+        # Lock propio del símbolo: un libro muy activo no bloquea al resto ni a la API
+        "lock": threading.Lock(),
+    }
+
+def configurar_simbolos(simbolos):
+    """Define los símbolos monitoreados y crea sus libros"""
+    coins[:] = simbolos
+    order_books.clear()
+    order_books.update({symbol: nuevo_order_book(symbol) for symbol in coins})
+    for symbol, limit in SNAPSHOT_LIMITES.items():
+        snapshot_scheduler.configurar_limite(symbol, limit)
+
+    print("\n" + "="*80)
+    print(f"🎯 SÍMBOLOS SELECCIONADOS: {', '.join(coins)}")
+    print("="*80 + "\n")
+    print(f"📊 Monedas de futuros monitoreadas: {len(coins)} símbolos")
+
+# Puerto e interfaz de la API local (ORDERBOOK_PUERTO / ORDERBOOK_HOST o --puerto / --host);
+# con --uds la API escucha en un socket Unix (así la consulta el proceso frontal en modo multiproceso)
+API_PUERTO = int(os.environ.get("ORDERBOOK_PUERTO", "8000"))
+API_HOST = os.environ.get("ORDERBOOK_HOST", "0.0.0.0")
+API_UDS = None
+
+# Procesos worker entre los que se reparten los símbolos (ORDERBOOK_WORKERS o --workers; 1 = un solo proceso)
+WORKERS = int(os.environ.get("ORDERBOOK_WORKERS", "1"))
+WORKER_ID = None  # Número de worker cuando este proceso es uno de ellos (--worker)
 
-print(f"📊 Monedas de futuros monitoreadas: {len(coins)} símbolos")
+# Streams por conexión WebSocket (Binance Futures admite hasta 200)
+STREAMS_POR_CONEXION = 50
+
+# Streams de precio suscritos junto al depth en las mismas conexiones, para /price/{symbol}
+# (ORDERBOOK_STREAMS_PRECIO="bookTicker" o "" para no suscribir ninguno)
+STREAMS_PRECIO = streams_precio_desde_config(os.environ.get("ORDERBOOK_STREAMS_PRECIO", "bookTicker,aggTrade"))
+SUFIJOS_STREAMS = ("depth@100ms",) + STREAMS_PRECIO
+
+# Máximo de agrupaciones de bloques mantenidas por símbolo (se descarta la menos usada)
+MAX_AGRUPACIONES = 8
+
+# Streaming por WebSocket: modos, intervalo mínimo entre envíos y timeout para clientes lentos
+MODOS_STREAM = ("top", "depth", "blocks", "price")
+STREAM_INTERVALO_MIN_MS = 50
+STREAM_TIMEOUT_ENVIO = 5
+
+# Límites del buffer de eventos previo al snapshot (cantidad y antigüedad en segundos)
+BUFFER_MAX_EVENTOS = 5000
+BUFFER_MAX_EDAD = 60
+
+# Actualizaciones aplicadas que se guardan por símbolo para /orderbooks/{symbol}/diff
+DIFF_HISTORIAL = 2000
+
+def valores_por_simbolo(valor, tipo):
+    """"BTCUSDT=1000,DOGEUSDT=100" -> {"BTCUSDT": 1000, "DOGEUSDT": 100}"""
+    return {
+        symbol.strip().upper(): tipo(dato)
+        for symbol, dato in (par.split("=", 1) for par in valor.split(",") if "=" in par)
+    }
+
+# Poda de los niveles lejanos del mid durante los updates (0 = sin límite): máximo de niveles por
+# lado y banda de precio en % alrededor del mid, con valores por símbolo
+# (ORDERBOOK_MAX_NIVELES_SIMBOLOS="BTCUSDT=20000,DOGEUSDT=500", ORDERBOOK_BANDA_PCT_SIMBOLOS="BTCUSDT=5")
+PODA_MAX_NIVELES = int(os.environ.get("ORDERBOOK_MAX_NIVELES", "0"))
+PODA_BANDA_PCT = float(os.environ.get("ORDERBOOK_BANDA_PCT", "0"))
+PODA_MAX_NIVELES_SIMBOLOS = valores_por_simbolo(os.environ.get("ORDERBOOK_MAX_NIVELES_SIMBOLOS", ""), int)
+PODA_BANDA_PCT_SIMBOLOS = valores_por_simbolo(os.environ.get("ORDERBOOK_BANDA_PCT_SIMBOLOS", ""), float)
+# Un lado se poda recién cuando pasa el límite en esta fracción (se poda de a lotes, no en cada update)
+PODA_HOLGURA = 0.1
+# Niveles conocidos mínimos en un lado podado antes de resincronizar (el top que se garantiza)
+PODA_MIN_NIVELES = 100
+
+# Snapshots REST: hilos del pool, profundidad por defecto y por símbolo
+# (ORDERBOOK_SNAPSHOT_LIMITS="BTCUSDT=1000,DOGEUSDT=100") y fracción del límite de peso usada
+SNAPSHOT_TRABAJADORES = int(os.environ.get("ORDERBOOK_SNAPSHOT_WORKERS", "8"))
+SNAPSHOT_LIMIT = int(os.environ.get("ORDERBOOK_SNAPSHOT_LIMIT", "1000"))
+SNAPSHOT_LIMITES = valores_por_simbolo(os.environ.get("ORDERBOOK_SNAPSHOT_LIMITS", ""), int)
+SNAPSHOT_MARGEN_PESO = 0.8
+
+# Verificación de consistencia en segundo plano: cada VERIFICACION_INTERVALO segundos se pide el
+# snapshot de un símbolo (rotando entre los inicializados) con la prioridad más baja y se compara
+# con el libro; si no coincide se resincroniza (0 = desactivada)
+VERIFICACION_INTERVALO = float(os.environ.get("ORDERBOOK_VERIFICACION_INTERVALO", "30"))
+VERIFICACION_FRACCION_PESO = 0.5  # Parte del presupuesto de peso que pueden usar las verificaciones
+VERIFICACION_ESPERA = 5  # Segundos que se espera a que el libro llegue al lastUpdateId del snapshot
+VERIFICACION_POLL = 0.05
+
+snapshot_scheduler = SnapshotScheduler(
+    url_base=BINANCE_REST_URL,
+    trabajadores=SNAPSHOT_TRABAJADORES,
+    margen=SNAPSHOT_MARGEN_PESO,
+    limite_por_defecto=SNAPSHOT_LIMIT,
+    fraccion_verificacion=VERIFICACION_FRACCION_PESO,
+)
+
+# Exportación de los top-N niveles a memoria compartida para procesos locales (0 = desactivada)
+SHM_NIVELES = int(os.environ.get("ORDERBOOK_SHM_NIVELES", "0"))
+SHM_DIR = os.environ.get("ORDERBOOK_SHM_DIR") or directorio_por_defecto()
+SHM_INTERVALO = 0.002  # Cada cuánto el hilo escritor revisa qué libros cambiaron
+
+# Grabación de mensajes crudos y snapshots para reproducir incidentes (sin directorio = desactivada)
+GRABACION_DIR = os.environ.get("ORDERBOOK_GRABACION_DIR")
+recorder = DepthRecorder(GRABACION_DIR) if GRABACION_DIR else None
+
+# Métricas de latencia/throughput para /metrics (ORDERBOOK_METRICAS=0 las desactiva)
+METRICAS = os.environ.get("ORDERBOOK_METRICAS", "1") != "0"
+# Los histogramas del hot path se alimentan con 1 de cada N mensajes (el contador cuenta todos)
+METRICAS_MUESTREO = max(1, int(os.environ.get("ORDERBOOK_METRICAS_MUESTREO", "8")))
+metricas_api = MetricasAPI()
+
+# Cache de respuestas serializadas de /orderbooks (presupuesto de memoria total)
+RESPONSE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+response_cache = ResponseCache(RESPONSE_CACHE_MAX_BYTES)
+ws_manager = None
+
+# Modo de ingesta: "threads" (por defecto) o "async" (todo en el event loop de la API)
+MODO_ASYNC = os.environ.get("ORDERBOOK_MODO", "").lower() == "async" or "--async" in sys.argv
+ingestion_loop = None  # Event loop de ingesta cuando MODO_ASYNC está activo
+tareas_ingesta = set()  # Referencias a las tareas async para que no las recolecte el GC
 
 # ===== FUNCIONES DE ORDEN BOOK =====
 def get_order_book_snapshot(symbol):
-    url = f"https://fapi.binance.com/fapi/v1/depth?symbol={symbol}&limit=1000"
-    response = requests.get(url)
-    return response.json()
+    """Snapshot REST vía el planificador (conexiones reutilizadas y presupuesto de peso)"""
+    return snapshot_scheduler.obtener(symbol)
 
 def process_buffer(symbol):
     """Procesa el buffer de eventos después de cargar el snapshot"""
-    with order_book_lock:
-        book = order_books[symbol]
+    book = order_books[symbol]
+    with book['lock']:
         lastUpdateId = book['lastUpdateId']
 
+        buffer = book['buffer']
+
         # Paso 4: Descartar eventos donde u < lastUpdateId
-        book['buffer'] = [e for e in book['buffer'] if e['u'] >= lastUpdateId]
+        buffer.descartar_hasta(lastUpdateId)
 
         # Paso 5: El primer evento debe tener U <= lastUpdateId AND u >= lastUpdateId
-        if not book['buffer']:
+        if not buffer:
             # Buffer vacío es normal en monedas de bajo volumen
             # Simplemente marcamos como inicializado y esperamos el siguiente evento
             book['initialized'] = True
@@ -138,16 +341,26 @@ def process_buffer(symbol):
             print(f"✅ Order book inicializado (esperando eventos): {symbol}")
             return True
 
-        first_event = book['buffer'][0]
+        first_event = buffer.primero()
         if not (first_event['U'] <= lastUpdateId <= first_event['u']):
             print(f"⚠️ Secuencia incorrecta para {symbol}. U={first_event['U']}, u={first_event['u']}, lastUpdateId={lastUpdateId}")
             return False
 
+        # Los eventos del buffer deben estar encadenados (pu == u anterior) antes de aplicar nada
+        prev_u = None
+        for event in buffer:
+            if prev_u is not None and event['pu'] != prev_u:
+                print(f"⚠️ Hueco dentro del buffer de {symbol}. Esperado pu={prev_u}, recibido pu={event['pu']}")
+                return False
+            prev_u = event['u']
+
         # Procesar todos los eventos del buffer
-        for event in book['buffer']:
+        for event in buffer:
             apply_order_book_update(symbol, event)
 
-        book['buffer'] = []
+        buffer.reset()
+        # El evento que cubría lastUpdateId ya se aplicó: lo siguiente se valida por pu == last_u
+        book['first_event_after_snapshot'] = False
         book['initialized'] = True
         print(f"✅ Order book inicializado correctamente: {symbol}")
         return True
@@ -156,244 +369,829 @@ def apply_order_book_update(symbol, data):
     """Aplica una actualización al order book"""
     book = order_books[symbol]
 
-    # Actualizar bids
-    for price, qty in data['b']:
-        price_str = price
-        qty_float = float(qty)
-        if qty_float == 0:
-            book['bids'].pop(price_str, None)
-        else:
-            book['bids'][price_str] = qty
-
-    # Actualizar asks
-    for price, qty in data['a']:
-        price_str = price
-        qty_float = float(qty)
-        if qty_float == 0:
-            book['asks'].pop(price_str, None)
-        else:
-            book['asks'][price_str] = qty
+    # Bloques agrupados que hay que mantener al día con cada nivel que cambia
+    agregadores = tuple(book['agregadores'].values())
+
+    # Aplicar bids y asks en bloque (qty == 0 elimina el nivel)
+    if agregadores:
+        for es_bid, lado, niveles in ((True, book['bids'], data['b']), (False, book['asks'], data['a'])):
+            cambios = []
+            lado.apply(niveles, cambios)
+            for tick, anterior, nueva in cambios:
+                for agregador in agregadores:
+                    agregador.actualizar(es_bid, tick, anterior, nueva)
+    else:
+        book['bids'].apply(data['b'])
+        book['asks'].apply(data['a'])
+
+    b, a = data['b'], data['a']
+    if book['poda'] is not None:
+        podados = podar_libro(book, agregadores)
+        if podados is not None:
+            # Los clientes de /diff borran los niveles podados como cualquier otro qty "0"
+            b = b + podados[0]
+            a = a + podados[1]
+
+    # Guardar la actualización para /diff (solo referencias, sin copiar niveles)
+    book['historial'].append((book['last_u'], data['u'], b, a))
 
     # Actualizar last_u para verificación de continuidad
     book['last_u'] = data['u']
 
+    # Las respuestas cacheadas del símbolo dejaron de ser válidas
+    response_cache.invalidar(symbol)
+
+def limites_de_poda(symbol):
+    """(máx. niveles por lado o None, banda como fracción del mid o None), o None si no se poda"""
+    max_niveles = PODA_MAX_NIVELES_SIMBOLOS.get(symbol, PODA_MAX_NIVELES)
+    banda_pct = PODA_BANDA_PCT_SIMBOLOS.get(symbol, PODA_BANDA_PCT)
+    if max_niveles <= 0 and banda_pct <= 0:
+        return None
+    return (max_niveles if max_niveles > 0 else None, banda_pct / 100 if banda_pct > 0 else None)
+
+def podar_libro(book, agregadores):
+    """Elimina los niveles lejanos del mid según book['poda']. Requiere book['lock'].
+
+    Un lado se poda cuando pasa su límite (niveles o banda) en más de PODA_HOLGURA y
+    queda justo en el límite, así el corte se reparte entre muchos updates. Los
+    agregadores de bloques reciben los niveles eliminados y la cobertura del lado se
+    corre hasta el último nivel conservado. Devuelve los eliminados como
+    ([[precio, "0"], ...] de bids, de asks) para el historial de /diff, o None.
+    """
+    max_niveles, banda = book['poda']
+    bids, asks = book['bids'], book['asks']
+    limites = (None, None)
+    if banda is not None and bids.ticks and asks.ticks:
+        mid = (bids.ticks[-1] + asks.ticks[0]) / 2
+        ancho = mid * banda
+        limites = (math.ceil(mid - ancho), math.floor(mid + ancho))
+        holgura = ancho * PODA_HOLGURA
+
+    podados = None
+    cobertura = list(book['cobertura'])
+    for i, (es_bid, lado) in enumerate(((True, bids), (False, asks))):
+        ticks = lado.ticks
+        if not ticks:
+            continue
+        excedido = max_niveles is not None and len(ticks) > max_niveles + max(1, int(max_niveles * PODA_HOLGURA))
+        tick_limite = limites[i]
+        if tick_limite is not None and not excedido:
+            excedido = ticks[0] < tick_limite - holgura if es_bid else ticks[-1] > tick_limite + holgura
+        if not excedido:
+            continue
+        eliminados = lado.podar(max_niveles, tick_limite)
+        if not eliminados:
+            continue
+
+        for tick, _, qty in eliminados:
+            for agregador in agregadores:
+                agregador.actualizar(es_bid, tick, qty, 0.0)
+        if podados is None:
+            podados = ([], [])
+        podados[i].extend([precio, "0"] for _, precio, _ in eliminados)
+        book['niveles_podados'][i] += len(eliminados)
+        book['conservados_poda'][i] = len(ticks)
+        if ticks:
+            conservado = ticks[0] if es_bid else ticks[-1]
+            if cobertura[i] is None:
+                cobertura[i] = conservado
+            else:
+                cobertura[i] = max(cobertura[i], conservado) if es_bid else min(cobertura[i], conservado)
+    book['cobertura'] = tuple(cobertura)
+    return podados
+
+def profundidad_agotada(book):
+    """True si un lado podado se quedó con pocos niveles dentro de su cobertura: lo que siga
+    hacia el top estaría en la zona podada, donde faltan los niveles que no cambiaron.
+
+    Más allá de la cobertura de un snapshot (limit=1000) pasa lo mismo con o sin poda y el
+    libro se completa con los diffs, como siempre; lo que se vigila es solo lo que descartó
+    la poda y un libro sin podar todavía tendría.
+    """
+    cobertura_bids, cobertura_asks = book['cobertura']
+    conservados_bids, conservados_asks = book['conservados_poda']
+    if conservados_bids:
+        ticks = book['bids'].ticks
+        conocidos = len(ticks) - bisect_left(ticks, cobertura_bids)
+        if conocidos < min(PODA_MIN_NIVELES, max(1, conservados_bids // 2)):
+            return True
+    if conservados_asks:
+        conocidos = bisect_right(book['asks'].ticks, cobertura_asks)
+        if conocidos < min(PODA_MIN_NIVELES, max(1, conservados_asks // 2)):
+            return True
+    return False
+
+def contar_hueco(book):
+    if book['metricas'] is not None:
+        book['metricas'].huecos += 1
+
+def procesar_evento(symbol, book, data):
+    """Buffer o verificación de continuidad (U/u/pu) y apply de un depth update. Requiere book['lock']"""
+    # Si no está inicializado, agregar al buffer (O(1), acotado en cantidad y antigüedad)
+    if not book['initialized']:
+        if not book['buffer'].append(data):
+            print(f"⚠️ Buffer de {symbol} desbordado ({BUFFER_MAX_EVENTOS} eventos), "
+                  f"reiniciando resync con eventos nuevos (desbordes: {book['buffer'].desbordes})")
+            # Si hay un resync en curso, initialize_order_book ve el desborde y pide otro snapshot;
+            # si no (reintentos agotados), se lanza uno nuevo
+            programar_resync(symbol)
+        return
+
+    # Paso 6: Verificar continuidad (pu debe ser igual al u anterior)
+    # Excepción: El primer evento después del snapshot puede tener pu < lastUpdateId
+    if book['first_event_after_snapshot']:
+        # Primer evento: validar que U <= lastUpdateId <= u (según docs Binance)
+        if data['U'] <= book['lastUpdateId'] <= data['u']:
+            # Evento válido, procesar y desactivar bandera
+            book['first_event_after_snapshot'] = False
+            apply_order_book_update(symbol, data)
+            return
+        elif data['u'] < book['lastUpdateId']:
+            # Evento antiguo, ignorar
+            return
+        else:
+            # Evento no cubre el lastUpdateId, puede ser discontinuidad
+            print(f"⚠️ Primer evento no cubre lastUpdateId en {symbol}. U={data['U']}, u={data['u']}, lastUpdateId={book['lastUpdateId']}")
+            book['initialized'] = False
+            book['buffer'].reset(data)
+            contar_hueco(book)
+            programar_resync(symbol)
+            return
+
+    # Validación normal de continuidad para eventos subsecuentes
+    if data['pu'] != book['last_u']:
+        print(f"⚠️ Discontinuidad detectada en {symbol}. Esperado pu={book['last_u']}, recibido pu={data['pu']}")
+        # Reiniciar el proceso
+        book['initialized'] = False
+        book['first_event_after_snapshot'] = True
+        book['buffer'].reset(data)
+        contar_hueco(book)
+        programar_resync(symbol)
+        return
+
+    # Aplicar la actualización
+    apply_order_book_update(symbol, data)
+
+    conservados_bids, conservados_asks = book['conservados_poda']
+    if (conservados_bids or conservados_asks) and profundidad_agotada(book):
+        print(f"⚠️ El precio de {symbol} llegó a la zona podada del libro, resincronizando")
+        book['initialized'] = False
+        book['first_event_after_snapshot'] = True
+        book['buffer'].reset()
+        book['resyncs_poda'] += 1
+        programar_resync(symbol)
+
 def on_message_combined(ws, message):
     """Maneja mensajes de streams combinados"""
     try:
-        parsed = json.loads(message)
-
-        # Extraer símbolo del stream name: "btcusdt@depth@100ms" -> "BTCUSDT"
-        if 'stream' not in parsed:
+        inicio = time.perf_counter()
+        # Solo se decodifica lo que usa el libro (msgspec/orjson si están instalados)
+        stream_name, data = decodificar_mensaje(message)
+        if stream_name is None:
             return
 
-        stream_name = parsed['stream']
-        data = parsed['data']
-        symbol = stream_name.split('@')[0].upper()
+        # Extraer símbolo y tipo del stream name: "btcusdt@depth@100ms" -> ("BTCUSDT", "depth")
+        symbol, tipo = clasificar_stream(stream_name)
 
-        with order_book_lock:
-            if symbol not in order_books:
-                return
-
-            book = order_books[symbol]
+        book = order_books.get(symbol)
+        if book is None:
+            return
 
-            # Si no está inicializado, agregar al buffer (optimizado: consolidar eventos)
-            if not book['initialized']:
-                # Optimización: Si ya existe un evento que cubre este rango, eliminarlo
-                # Según Binance: "Por el mismo precio, la última actualización cubre la anterior"
-                book['buffer'] = [e for e in book['buffer'] if not (e['u'] < data['U'])]
-                book['buffer'].append(data)
-                return
+        # bookTicker / aggTrade: solo reemplazan el estado de precio, sin lock del libro
+        if tipo != "depth":
+            book['precio'].aplicar(tipo, data)
+            return
 
-            # Paso 6: Verificar continuidad (pu debe ser igual al u anterior)
-            # Excepción: El primer evento después del snapshot puede tener pu < lastUpdateId
-            if book['first_event_after_snapshot']:
-                # Primer evento: validar que U <= lastUpdateId <= u (según docs Binance)
-                if data['U'] <= book['lastUpdateId'] <= data['u']:
-                    # Evento válido, procesar y desactivar bandera
-                    book['first_event_after_snapshot'] = False
-                    apply_order_book_update(symbol, data)
-                    return
-                elif data['u'] < book['lastUpdateId']:
-                    # Evento antiguo, ignorar
-                    return
-                else:
-                    # Evento no cubre el lastUpdateId, puede ser discontinuidad
-                    print(f"⚠️ Primer evento no cubre lastUpdateId en {symbol}. U={data['U']}, u={data['u']}, lastUpdateId={book['lastUpdateId']}")
-                    book['initialized'] = False
-                    book['buffer'] = [data]
-                    threading.Thread(target=reinitialize_symbol, args=(symbol,), daemon=True).start()
-                    return
-
-            # Validación normal de continuidad para eventos subsecuentes
-            if data['pu'] != book['last_u']:
-                print(f"⚠️ Discontinuidad detectada en {symbol}. Esperado pu={book['last_u']}, recibido pu={data['pu']}")
-                # Reiniciar el proceso
-                book['initialized'] = False
-                book['first_event_after_snapshot'] = True
-                book['buffer'] = [data]
-                threading.Thread(target=reinitialize_symbol, args=(symbol,), daemon=True).start()
-                return
+        # Grabar el mensaje crudo (solo encola: la escritura es de otro hilo)
+        if recorder is not None:
+            recorder.registrar_depth(symbol, message)
+
+        # Solo se bloquea el libro de este símbolo
+        metricas = book['metricas']
+        if metricas is not None:
+            metricas.mensajes += 1
+        if metricas is None or metricas.mensajes % METRICAS_MUESTREO:
+            with book['lock']:
+                procesar_evento(symbol, book, data)
+            return
 
-            # Aplicar la actualización
-            apply_order_book_update(symbol, data)
+        # Mensaje muestreado: tiempo de procesamiento, espera del lock y lag respecto de E
+        antes_lock = time.perf_counter()
+        with book['lock']:
+            en_lock = time.perf_counter()
+            procesar_evento(symbol, book, data)
+        metricas.registrar(data.get('E'), time.perf_counter() - inicio, en_lock - antes_lock)
 
     except Exception as e:
         print(f"💥 Error procesando mensaje: {e}")
 
+def crear_tarea_ingesta(coro):
+    """Agenda una corutina en el loop de ingesta (seguro desde cualquier hilo)"""
+    def crear():
+        tarea = ingestion_loop.create_task(coro)
+        tareas_ingesta.add(tarea)
+        tarea.add_done_callback(tareas_ingesta.discard)
+    ingestion_loop.call_soon_threadsafe(crear)
+
+# ===== RESYNC POR SÍMBOLO =====
+# Estados: inactivo -> esperando_eventos -> snapshot -> inactivo
+#                          ^                   |
+#                          +---- reintento <---+ (tras RESYNC_MAX_REINTENTOS: fallido)
+# Como mucho hay un resync en curso por símbolo: los huecos detectados mientras tanto
+# solo dejan el libro sin inicializar y el resync en curso vuelve a empezar al terminar.
+RESYNC_ACTIVOS = ("esperando_eventos", "snapshot", "reintento")
+RESYNC_MAX_REINTENTOS = 10
+RESYNC_DELAY_BASE = 0.25
+RESYNC_DELAY_MAX = 30
+RESYNC_ESPERA_EVENTOS = 3  # Máximo a esperar el primer evento en el buffer (símbolos de poco volumen)
+RESYNC_POLL = 0.02
+resync_lock = threading.Lock()  # Protege el estado de resync de los libros; se toma después de book['lock']
+resync_duraciones = deque(maxlen=1000)  # Segundos desde el hueco hasta el libro consistente
+resync_contadores = {"completados": 0, "fallidos": 0, "deduplicados": 0}
+# Si no es None, los resyncs se delegan en esta función en vez de pedir snapshots por REST
+# (replay.py los resuelve con los snapshots grabados)
+resync_externo = None
+
+def reservar_resync(symbol):
+    """Pasa el símbolo a resync. False si ya había uno en curso (el pedido se deduplica)"""
+    book = order_books[symbol]
+    with resync_lock:
+        if book['resync_inicio'] is None:
+            book['resync_inicio'] = time.monotonic()
+        if book['resync'] in RESYNC_ACTIVOS:
+            resync_contadores['deduplicados'] += 1
+            return False
+        book['resync'] = "esperando_eventos"
+        return True
+
+def cambiar_estado_resync(symbol, estado):
+    with resync_lock:
+        order_books[symbol]['resync'] = estado
+
+def terminar_resync(symbol):
+    """Cierra el resync si el libro quedó consistente. False si hubo otro hueco mientras tanto"""
+    book = order_books[symbol]
+    # Mismo orden de locks que on_message_combined -> programar_resync: un hueco no puede colarse
+    with book['lock'], resync_lock:
+        if not book['initialized']:
+            book['resync'] = "esperando_eventos"
+            return False
+        duracion = time.monotonic() - book['resync_inicio']
+        resync_duraciones.append(duracion)
+        if book['metricas'] is not None:
+            book['metricas'].resync.observar(duracion)
+        resync_contadores['completados'] += 1
+        book['resync'] = "inactivo"
+        book['resync_inicio'] = None
+    print(f"⏱️ {symbol} consistente tras {duracion * 1000:.0f} ms de resync")
+    return True
+
+def siguiente_reintento(symbol, intento):
+    """Espera antes del próximo intento, o None si se agotaron los reintentos"""
+    if intento >= RESYNC_MAX_REINTENTOS:
+        with resync_lock:
+            order_books[symbol]['resync'] = "fallido"
+            order_books[symbol]['resync_inicio'] = None
+            resync_contadores['fallidos'] += 1
+            if order_books[symbol]['metricas'] is not None:
+                order_books[symbol]['metricas'].resync_fallidos += 1
+        print(f"❌ Máximo de reintentos alcanzado para {symbol}")
+        return None
+    cambiar_estado_resync(symbol, "reintento")
+    delay = min(RESYNC_DELAY_BASE * (2 ** intento), RESYNC_DELAY_MAX)
+    print(f"🔄 Reintentando inicialización de {symbol} en {delay}s (intento {intento + 1}/{RESYNC_MAX_REINTENTOS})...")
+    return delay
+
+def hay_eventos(symbol):
+    """El buffer ya tiene un evento con el que enlazar el snapshot"""
+    return len(order_books[symbol]['buffer']) > 0
+
+def estadisticas_resync():
+    with resync_lock:
+        duraciones = sorted(resync_duraciones)
+        en_curso = sum(1 for b in order_books.values() if b['resync'] in RESYNC_ACTIVOS)
+        contadores = dict(resync_contadores)
+
+    def ms(p):
+        return round(duraciones[int(p * (len(duraciones) - 1))] * 1000, 1) if duraciones else None
+
+    return {
+        "in_flight": en_curso,
+        "completed": contadores['completados'],
+        "failed": contadores['fallidos'],
+        "deduplicated": contadores['deduplicados'],
+        "last_ms": round(resync_duraciones[-1] * 1000, 1) if resync_duraciones else None,
+        "p50_ms": ms(0.5),
+        "p99_ms": ms(0.99),
+        "max_ms": ms(1.0),
+    }
+
+def programar_resync(symbol):
+    """Lanza la reinicialización de un símbolo tras una discontinuidad según el modo de ingesta"""
+    if resync_externo is not None:
+        resync_externo(symbol)
+        return
+    if not reservar_resync(symbol):
+        return
+    if ingestion_loop is not None:
+        crear_tarea_ingesta(reinitialize_symbol_async(symbol))
+    else:
+        threading.Thread(target=reinitialize_symbol, args=(symbol,), daemon=True).start()
+
+def programar_inicializacion(symbol):
+    """Lanza la carga del snapshot de un símbolo según el modo de ingesta"""
+    if resync_externo is not None:
+        resync_externo(symbol)
+        return
+    if not reservar_resync(symbol):
+        return
+    if ingestion_loop is not None:
+        crear_tarea_ingesta(initialize_order_book_async(symbol))
+    else:
+        threading.Thread(target=initialize_order_book, args=(symbol,), daemon=True).start()
+
 def reinitialize_symbol(symbol):
     """Reinicializa el order book de un símbolo"""
     print(f"🔄 Reinicializando {symbol}...")
-    time.sleep(1)  # Esperar un poco antes de reinicializar
     initialize_order_book(symbol)
 
-def initialize_order_book(symbol, retry_count=0):
-    """Inicializa el order book con snapshot y procesa buffer con retry exponencial"""
-    max_retries = 10
-    base_delay = 1
-    max_delay = 60
-
-    try:
-        # Esperar un poco para acumular eventos en el buffer
-        time.sleep(3)
+def cargar_snapshot(symbol, snap):
+    """Carga un snapshot REST en el libro (pasos 2-3 del protocolo de Binance)"""
+    book = order_books[symbol]
+    if recorder is not None:
+        recorder.registrar_snapshot(symbol, snap)
+
+    # Construir los lados fuera del lock: ordenar 1000 niveles no bloquea los mensajes del símbolo
+    bids = BookSide(es_bid=True, escala=book['bids'].escala)
+    asks = BookSide(es_bid=False, escala=book['asks'].escala)
+    bids.load(snap['bids'])
+    asks.load(snap['asks'])
+
+    # Reconstruir los bloques de las agrupaciones activas, también fuera del lock
+    with book['lock']:
+        activos = list(book['agregadores'].items())
+    agregadores = {
+        clave: BlockAggregator(ag.agrupacion, ag.escala, ag.ticks_por_bloque).reconstruir(bids, asks)
+        for clave, ag in activos
+    }
 
-        # Paso 3: Obtener snapshot
-        snap = get_order_book_snapshot(symbol)
+    with book['lock']:
+        book['bids'] = bids
+        book['asks'] = asks
+        for clave, agregador in list(book['agregadores'].items()):
+            # Una agrupación registrada mientras tanto se reconstruye aquí
+            book['agregadores'][clave] = agregadores.get(clave) or agregador.reconstruir(bids, asks)
+        book['lastUpdateId'] = snap['lastUpdateId']
+        book['cobertura'] = (bids.ticks[0] if bids.ticks else None, asks.ticks[-1] if asks.ticks else None)
+        book['conservados_poda'] = [0, 0]
+        # El historial de diffs vuelve a empezar desde el estado del snapshot
+        book['historial'].clear()
+        book['last_u'] = snap['lastUpdateId']
+        response_cache.invalidar(symbol)
+        print(f"📸 Snapshot cargado para {symbol} (lastUpdateId: {snap['lastUpdateId']}, buffer: {len(book['buffer'])} eventos)")
+
+def buffer_desbordado(symbol, desbordes):
+    """True si el buffer se desbordó mientras se pedía el snapshot: los eventos que lo
+    enlazaban se perdieron, así que se descarta y se pide otro contra los eventos nuevos"""
+    if order_books[symbol]['buffer'].desbordes == desbordes:
+        return False
+    print(f"🔄 Buffer de {symbol} desbordado durante el snapshot, pidiendo uno nuevo")
+    return True
+
+def initialize_order_book(symbol):
+    """Resync de un símbolo (pasos 2-5) con reintentos en bucle y backoff exponencial.
+
+    Solo lo ejecuta quien reservó el resync (programar_resync / programar_inicializacion).
+    """
+    intento = 0
+    while True:
+        sincronizado = False
+        try:
+            # Pedir el snapshot en cuanto haya un evento en el buffer con el que enlazarlo
+            limite = time.monotonic() + RESYNC_ESPERA_EVENTOS
+            while not hay_eventos(symbol) and time.monotonic() < limite:
+                time.sleep(RESYNC_POLL)
+
+            # Paso 3: Obtener snapshot
+            cambiar_estado_resync(symbol, "snapshot")
+            desbordes = order_books[symbol]['buffer'].desbordes
+            snap = get_order_book_snapshot(symbol)
+            if buffer_desbordado(symbol, desbordes):
+                intento = 0
+                continue
+            cargar_snapshot(symbol, snap)
+            sincronizado = process_buffer(symbol)
+        except Exception as e:
+            print(f"💥 Error inicializando {symbol}: {e}")
 
-        with order_book_lock:
-            book = order_books[symbol]
+        if sincronizado:
+            if terminar_resync(symbol):
+                return
+            # Otro hueco mientras se sincronizaba: empezar de nuevo sin esperar
+            intento = 0
+            continue
 
-            # Limpiar order book
-            book['bids'].clear()
-            book['asks'].clear()
-
-            # Cargar snapshot
-            for bid in snap['bids']:
-                book['bids'][bid[0]] = bid[1]
-            for ask in snap['asks']:
-                book['asks'][ask[0]] = ask[1]
-
-            book['lastUpdateId'] = snap['lastUpdateId']
-            book['retry_count'] = 0  # Reset en caso de éxito
-            print(f"📸 Snapshot cargado para {symbol} (lastUpdateId: {snap['lastUpdateId']}, buffer: {len(book['buffer'])} eventos)")
-
-        # Procesar buffer
-        if not process_buffer(symbol):
-            # Si falla, reintentar con backoff exponencial
-            if retry_count < max_retries:
-                delay = min(base_delay * (2 ** retry_count), max_delay)
-                print(f"🔄 Reintentando inicialización de {symbol} en {delay}s (intento {retry_count + 1}/{max_retries})...")
-                time.sleep(delay)
-                initialize_order_book(symbol, retry_count + 1)
+        delay = siguiente_reintento(symbol, intento)
+        if delay is None:
+            return
+        time.sleep(delay)
+        intento += 1
+
+def comparar_con_snapshot(symbol, snap, max_diferencias=20):
+    """Compara el libro con un snapshot REST alineándolo con el historial de diffs.
+
+    Si el libro ya avanzó más allá de snap['lastUpdateId'], los precios tocados por las
+    actualizaciones posteriores (incluida la que contiene a lastUpdateId) no se comparan.
+    Solo se compara el rango de precios que cubren a la vez el snapshot y el último
+    snapshot cargado en el libro (book['cobertura']). El "status" es "ok",
+    "divergente", "no_inicializado", "adelantado" (el snapshot es más nuevo que el libro:
+    comparar más tarde) o "sin_historial" (el historial ya no llega hasta lastUpdateId).
+
+    Con el lock tomado solo se recorre el historial hasta lastUpdateId y se copian los dos
+    lados (copias de C, sin recorrer niveles); el parseo y la comparación van afuera
+    ("lock_ms" es el tiempo con el lock tomado).
+    """
+    book = order_books[symbol]
+    snap_u = snap['lastUpdateId']
+
+    # Niveles del snapshot por tick, antes de tomar el lock (la escala no cambia entre snapshots)
+    escalas = []
+    esperados = []
+    for lado, niveles in ((book['bids'], snap['bids']), (book['asks'], snap['asks'])):
+        escala = lado.escala or (escala_desde_precio(niveles[0][0]) if niveles else 1.0)
+        esperado = {}
+        for precio, qty in niveles:
+            qty_float = float(qty)
+            if qty_float:
+                esperado[round(float(precio) * escala)] = (precio, qty_float)
+        escalas.append(escala)
+        esperados.append(esperado)
+
+    with book['lock']:
+        inicio = time.perf_counter()
+        last_u = book['last_u']
+        if not book['initialized'] or last_u is None:
+            return {"status": "no_inicializado", "lastUpdateId": snap_u, "last_u": last_u}
+        if last_u < snap_u:
+            return {"status": "adelantado", "lastUpdateId": snap_u, "last_u": last_u}
+
+        # Precios cambiados después de lastUpdateId, desde lo más reciente hacia atrás
+        tocados_bids, tocados_asks = set(), set()
+        alcanzado = last_u == snap_u
+        for u_anterior, u, b, a in reversed(book['historial']):
+            if alcanzado:
+                break
+            tocados_bids.update(precio for precio, _ in b)
+            tocados_asks.update(precio for precio, _ in a)
+            alcanzado = u_anterior <= snap_u
+        if not alcanzado:
+            return {"status": "sin_historial", "lastUpdateId": snap_u, "last_u": last_u}
+        # Los lados se leen recién acá: cargar_snapshot los reemplaza por objetos nuevos
+        copias = [book['bids'].copy(), book['asks'].copy()]
+        cobertura_bids, cobertura_asks = book['cobertura']
+        lock_ms = (time.perf_counter() - inicio) * 1000
+
+    # Comparar fuera del lock, tick a tick
+    diferencias = []
+    comparados = excluidos = 0
+    for nombre, lado, esperado, tocados, cobertura, escala in (
+            ("bids", copias[0], esperados[0], tocados_bids, cobertura_bids, escalas[0]),
+            ("asks", copias[1], esperados[1], tocados_asks, cobertura_asks, escalas[1])):
+        if not esperado:
+            continue
+        excluir = {round(float(precio) * escala) for precio in tocados}
+        tick_min, tick_max = min(esperado), max(esperado)
+        if cobertura is not None:
+            if lado.es_bid:
+                tick_min = max(tick_min, cobertura)
             else:
-                print(f"❌ Máximo de reintentos alcanzado para {symbol}")
+                tick_max = min(tick_max, cobertura)
+        actual = {tick: lado.niveles[tick] for tick in lado.range_ticks(tick_min, tick_max)}
+        for tick in esperado.keys() | actual.keys():
+            if not tick_min <= tick <= tick_max:
+                continue
+            if tick in excluir:
+                excluidos += 1
+                continue
+            comparados += 1
+            qty_esperada = esperado[tick][1] if tick in esperado else 0.0
+            qty_libro = actual[tick][2] if tick in actual else 0.0
+            if abs(qty_esperada - qty_libro) > 1e-12 * max(1.0, qty_esperada):
+                diferencias.append({
+                    "side": nombre,
+                    "price": esperado[tick][0] if tick in esperado else actual[tick][0],
+                    "book": qty_libro,
+                    "snapshot": qty_esperada,
+                })
 
-    except Exception as e:
-        if retry_count < max_retries:
-            # Retry exponencial: 1s, 2s, 4s, 8s, 16s, 32s, 60s (max)
-            delay = min(base_delay * (2 ** retry_count), max_delay)
+    return {
+        "status": "divergente" if diferencias else "ok",
+        "lastUpdateId": snap_u,
+        "last_u": last_u,
+        "compared": comparados,
+        "excluded": excluidos,
+        "mismatches": len(diferencias),
+        "examples": diferencias[:max_diferencias],
+        "lock_ms": round(lock_ms, 3),
+    }
+
+# ===== INGESTA ASYNC =====
+async def reinitialize_symbol_async(symbol):
+    """Versión asyncio de reinitialize_symbol"""
+    print(f"🔄 Reinicializando {symbol}...")
+    await initialize_order_book_async(symbol)
+
+async def initialize_order_book_async(symbol):
+    """Versión asyncio de initialize_order_book: mismo protocolo y backoff, sin bloquear el loop"""
+    intento = 0
+    while True:
+        sincronizado = False
+        try:
+            limite = time.monotonic() + RESYNC_ESPERA_EVENTOS
+            while not hay_eventos(symbol) and time.monotonic() < limite:
+                await asyncio.sleep(RESYNC_POLL)
+
+            # El GET del snapshot corre en el pool del planificador, no en un hilo propio por símbolo
+            cambiar_estado_resync(symbol, "snapshot")
+            desbordes = order_books[symbol]['buffer'].desbordes
+            snap = await asyncio.wrap_future(snapshot_scheduler.solicitar(symbol))
+            if buffer_desbordado(symbol, desbordes):
+                intento = 0
+                continue
+            cargar_snapshot(symbol, snap)
+            sincronizado = process_buffer(symbol)
+        except Exception as e:
             print(f"💥 Error inicializando {symbol}: {e}")
-            print(f"🔄 Reintentando en {delay}s (intento {retry_count + 1}/{max_retries})...")
-            time.sleep(delay)
-            initialize_order_book(symbol, retry_count + 1)
-        else:
-            print(f"❌ Error crítico en {symbol} después de {max_retries} intentos: {e}")
 
-def start_individual_websockets():
-    """Inicia WebSockets individuales para cada símbolo"""
-    print(f"🚀 Iniciando WebSockets individuales para {len(coins)} símbolos...")
+        if sincronizado:
+            if terminar_resync(symbol):
+                return
+            intento = 0
+            continue
 
-    for symbol in coins:
-        threading.Thread(
-            target=run_individual_websocket,
-            args=(symbol,),
-            daemon=True
-        ).start()
-        time.sleep(0.1)  # Pequeña pausa para evitar sobrecarga al inicio
+        delay = siguiente_reintento(symbol, intento)
+        if delay is None:
+            return
+        await asyncio.sleep(delay)
+        intento += 1
+
+# ===== VERIFICACIÓN EN SEGUNDO PLANO =====
+# El hueco en U/u/pu es el único chequeo del hot path: un nivel mal aplicado o un qty 0 perdido
+# no cortan la secuencia. De a un símbolo por vez se compara el libro con un snapshot REST
+# pedido con la prioridad más baja del planificador (sin quitarle peso a los resyncs).
+verificacion_turno = 0  # Posición de la rotación sobre coins
+verificacion_reintento = None  # Símbolo que no se pudo alinear con su snapshot: va primero la próxima vez
+verificacion_estado = {"last": None, "last_divergence": None, "lock_ms_max": 0.0}
+
+def listo_para_verificar(symbol):
+    book = order_books[symbol]
+    return book['initialized'] and book['resync'] not in RESYNC_ACTIVOS
+
+def elegir_simbolo_a_verificar():
+    """(symbol, es_reintento) a verificar: el que quedó pendiente de reintento o el siguiente
+    de la rotación que esté inicializado y sin resync en curso. (None, False) si no hay"""
+    global verificacion_turno, verificacion_reintento
+    symbol, verificacion_reintento = verificacion_reintento, None
+    if symbol is not None and listo_para_verificar(symbol):
+        return symbol, True
+    for _ in range(len(coins)):
+        symbol = coins[verificacion_turno % len(coins)]
+        verificacion_turno += 1
+        if listo_para_verificar(symbol):
+            return symbol, False
+    return None, False
+
+def registrar_verificacion(symbol, resultado, reintento=False):
+    """Cuenta el resultado de una verificación y resincroniza el libro si divergió"""
+    global verificacion_reintento
+    book = order_books[symbol]
+    estado = resultado['status']
+    if estado == "divergente":
+        print(f"🚨 {symbol} no coincide con el snapshot de verificación (lastUpdateId={resultado['lastUpdateId']}): "
+              f"{resultado['mismatches']} de {resultado['compared']} niveles distintos, "
+              f"ej. {resultado['examples'][:3]}. Resincronizando", flush=True)
+        with book['lock']:
+            if book['initialized']:
+                book['initialized'] = False
+                book['first_event_after_snapshot'] = True
+                book['buffer'].reset()
+                programar_resync(symbol)
+        book['niveles_divergentes'] += resultado['mismatches']
+        verificacion_estado['last_divergence'] = {"symbol": symbol, "time": time.time(), **resultado}
+    elif estado != "ok":
+        estado = "omitida"
+        # El snapshot no se pudo alinear con el libro (o no entró en el presupuesto): se reintenta
+        # ese símbolo en la próxima vuelta, una sola vez
+        if not reintento:
+            verificacion_reintento = symbol
+    book['verificaciones'][estado] += 1
+    if 'lock_ms' in resultado:
+        verificacion_estado['lock_ms_max'] = max(verificacion_estado['lock_ms_max'], resultado['lock_ms'])
+    verificacion_estado['last'] = {
+        "symbol": symbol,
+        "time": time.time(),
+        "status": resultado['status'],
+        "compared": resultado.get('compared'),
+        "mismatches": resultado.get('mismatches'),
+        "lock_ms": resultado.get('lock_ms'),
+    }
+    return resultado
 
-def run_individual_websocket(symbol):
-    """Ejecuta un WebSocket individual para un símbolo específico"""
-    conexion_numero = 0
+def omitir_verificacion(error):
+    motivo = "presupuesto" if isinstance(error, PresupuestoAgotado) else f"error: {error}"
+    return {"status": "omitida", "reason": motivo}
 
+def verificar_simbolo(symbol, reintento=False):
+    """Pide un snapshot de verificación y lo compara con el libro en cuanto last_u lo alcanza"""
+    try:
+        snap = snapshot_scheduler.solicitar(symbol, PRIORIDAD_VERIFICACION).result()
+    except Exception as e:
+        return registrar_verificacion(symbol, omitir_verificacion(e), reintento)
+    if recorder is not None:
+        recorder.registrar_snapshot(symbol, snap)  # replay.py también lo usa para verificar
+    limite = time.monotonic() + VERIFICACION_ESPERA
+    resultado = comparar_con_snapshot(symbol, snap)
+    while resultado['status'] == "adelantado" and time.monotonic() < limite:
+        time.sleep(VERIFICACION_POLL)
+        resultado = comparar_con_snapshot(symbol, snap)
+    return registrar_verificacion(symbol, resultado, reintento)
+
+async def verificar_simbolo_async(symbol, reintento=False):
+    """Versión asyncio de verificar_simbolo: la comparación corre en un hilo, no en el loop"""
+    try:
+        snap = await asyncio.wrap_future(snapshot_scheduler.solicitar(symbol, PRIORIDAD_VERIFICACION))
+    except Exception as e:
+        return registrar_verificacion(symbol, omitir_verificacion(e), reintento)
+    if recorder is not None:
+        recorder.registrar_snapshot(symbol, snap)
+    limite = time.monotonic() + VERIFICACION_ESPERA
+    resultado = await asyncio.to_thread(comparar_con_snapshot, symbol, snap)
+    while resultado['status'] == "adelantado" and time.monotonic() < limite:
+        await asyncio.sleep(VERIFICACION_POLL)
+        resultado = await asyncio.to_thread(comparar_con_snapshot, symbol, snap)
+    return registrar_verificacion(symbol, resultado, reintento)
+
+def verificar_libros():
+    """Hilo verificador (modo hilos): un símbolo cada VERIFICACION_INTERVALO segundos"""
     while True:
-        conexion_numero += 1
+        time.sleep(VERIFICACION_INTERVALO)
+        symbol, reintento = elegir_simbolo_a_verificar()
+        if symbol is None:
+            continue
         try:
-            # Crear stream individual: "btcusdt@depth@100ms"
-            url = f"wss://fstream.binance.com/stream?streams={symbol.lower()}@depth@100ms"
-
-            if conexion_numero == 1:
-                print(f"🔌 [{symbol}] Iniciando WebSocket (conexión #{conexion_numero})...", flush=True)
-            else:
-                print(f"🔄 [{symbol}] Reconectando WebSocket (intento #{conexion_numero})...", flush=True)
-
-            def on_open_handler(_):
-                print(f"✅ [{symbol}] WebSocket conectado exitosamente", flush=True)
-
-            def on_error_handler(_, error):
-                print(f"⚠️ [{symbol}] Error WS: {error}", flush=True)
-
-            def on_close_handler(*args):
-                close_code = args[1] if len(args) > 1 else 'N/A'
-                print(f"❌ [{symbol}] WebSocket desconectado (código: {close_code})", flush=True)
-
-            ws = websocket.WebSocketApp(
-                url,
-                on_open=on_open_handler,
-                on_message=lambda _, msg: on_message_combined(_, msg),
-                on_error=on_error_handler,
-                on_close=on_close_handler,
-            )
-            # Sin ping/pong - Binance maneja keep-alive automáticamente
-            ws.run_forever()
+            verificar_simbolo(symbol, reintento)
         except Exception as e:
-            print(f"💥 [{symbol}] Excepción en WebSocket: {e}")
+            print(f"❌ Error verificando {symbol}: {e}", flush=True)
 
-        # Marcar el símbolo como no inicializado
-        with order_book_lock:
-            order_books[symbol]['initialized'] = False
-            order_books[symbol]['buffer'] = []
-            order_books[symbol]['first_event_after_snapshot'] = True
+async def verificar_libros_async():
+    """Tarea verificadora (modo async)"""
+    while True:
+        await asyncio.sleep(VERIFICACION_INTERVALO)
+        symbol, reintento = elegir_simbolo_a_verificar()
+        if symbol is None:
+            continue
+        try:
+            await verificar_simbolo_async(symbol, reintento)
+        except Exception as e:
+            print(f"❌ Error verificando {symbol}: {e}", flush=True)
 
-        print(f"⏳ [{symbol}] Esperando 5 segundos antes de reconectar...", flush=True)
-        time.sleep(5)
+def iniciar_verificacion():
+    if VERIFICACION_INTERVALO <= 0:
+        return
+    if ingestion_loop is not None:
+        crear_tarea_ingesta(verificar_libros_async())
+    else:
+        threading.Thread(target=verificar_libros, name="verificador", daemon=True).start()
+
+def estadisticas_verificacion():
+    totales = {"ok": 0, "divergente": 0, "omitida": 0}
+    niveles = 0
+    for book in order_books.values():
+        for estado, n in book['verificaciones'].items():
+            totales[estado] += n
+        niveles += book['niveles_divergentes']
+    return {
+        "interval_s": VERIFICACION_INTERVALO or None,
+        "ok": totales['ok'],
+        "divergent": totales['divergente'],
+        "skipped": totales['omitida'],
+        "mismatched_levels": niveles,
+        "lock_ms_max": round(verificacion_estado['lock_ms_max'], 3),
+        "last": verificacion_estado['last'],
+        "last_divergence": verificacion_estado['last_divergence'],
+    }
 
-        # Esperar a que el WebSocket se reconecte y acumule eventos
-        print(f"📡 [{symbol}] Acumulando eventos del buffer...", flush=True)
-        time.sleep(3)
+# ===== MEMORIA COMPARTIDA =====
+def publicar_shm():
+    """Hilo escritor de orderbook_shm: publica los top-N de cada libro que cambió.
 
-        # Reinicializar el símbolo después de reconectar
-        print(f"🔄 [{symbol}] Solicitando snapshot y reinicializando...", flush=True)
-        threading.Thread(target=initialize_order_book, args=(symbol,), daemon=True).start()
+    Copia los niveles con el lock del símbolo tomado apenas unos microsegundos; los
+    lectores (SharedBookReader) nunca tocan ese lock.
+    """
+    escritores = {symbol: SharedBookWriter(symbol, SHM_NIVELES, SHM_DIR) for symbol in coins}
+    print(f"🧠 Memoria compartida: top {SHM_NIVELES} niveles de {len(escritores)} símbolos en {SHM_DIR}", flush=True)
+    publicado = {}  # symbol -> (initialized, last_u) de la última versión escrita
+    while True:
+        for symbol, escritor in escritores.items():
+            book = order_books[symbol]
+            # Lectura sin lock solo para saber si hay algo nuevo que copiar
+            if publicado.get(symbol) == (book['initialized'], book['last_u']):
+                continue
+            with book['lock']:
+                estado = (book['initialized'], book['last_u'])
+                bids = book['bids'].level_arrays(SHM_NIVELES)
+                asks = book['asks'].level_arrays(SHM_NIVELES)
+            escritor.publicar(estado[1], bids, asks, inicializado=estado[0])
+            publicado[symbol] = estado
+        time.sleep(SHM_INTERVALO)
+
+def iniciar_shm():
+    if SHM_NIVELES > 0:
+        try:
+            verificar_plataforma()
+        except RuntimeError as e:
+            print(f"❌ ORDERBOOK_SHM_NIVELES={SHM_NIVELES}: {e}")
+            sys.exit(1)
+        threading.Thread(target=publicar_shm, name="shm-writer", daemon=True).start()
+
+def iniciar_grabacion():
+    """Arranca el hilo del recorder y cierra el segmento abierto al salir"""
+    if recorder is not None:
+        recorder.start()
+        atexit.register(recorder.cerrar)
+
+def on_shard_down(symbols):
+    """Marca como no inicializados solo los símbolos del shard que se cayó"""
+    for symbol in symbols:
+        book = order_books[symbol]
+        with book['lock']:
+            book['initialized'] = False
+            book['buffer'].reset()
+            book['first_event_after_snapshot'] = True
+        book['precio'].invalidar()
+        # El tiempo de resync cuenta desde la caída, no desde la reconexión
+        with resync_lock:
+            if book['resync_inicio'] is None:
+                book['resync_inicio'] = time.monotonic()
+
+def on_symbols_resubscribed(symbols):
+    """Reinicializa los símbolos que volvieron a estar suscritos (reconexión o migración)"""
+    print(f"🔄 Solicitando snapshot y reinicializando {len(symbols)} símbolo(s): {', '.join(symbols)}", flush=True)
+    for symbol in symbols:
+        programar_inicializacion(symbol)
+
+def start_websockets():
+    """Inicia las conexiones WebSocket combinadas (varios símbolos por conexión)"""
+    global ws_manager
+    ws_manager = ShardedStreamManager(
+        coins,
+        on_message=on_message_combined,
+        on_shard_down=on_shard_down,
+        on_resubscribed=on_symbols_resubscribed,
+        streams_por_conexion=STREAMS_POR_CONEXION,
+        sufijos=SUFIJOS_STREAMS,
+        url_base=BINANCE_WS_URL,
+    )
+    ws_manager.start()
 
 # ===== API LOCAL (FastAPI) =====
+ENDPOINTS = {
+    "orderbook": "/orderbooks/{symbol}?depth=N&range_pct=X&side=bid|ask",
+    "blocks": "/orderbooks/{symbol}/blocks?grouping=...&top=10",
+    "diff": "/orderbooks/{symbol}/diff?since=<last_u>",
+    "price": "/price/{symbol}",
+    "stream": "ws://.../ws/orderbooks/{symbol}?mode=top|depth|blocks|price&interval_ms=250",
+    "symbols": "/symbols",
+    "health": "/health",
+    "metrics": "/metrics"
+}
+
 app = FastAPI()
+if METRICAS:
+    app.add_middleware(MiddlewareMetricas, metricas=metricas_api)
 
 @app.get("/")
 def root():
     """Endpoint raíz con información del sistema"""
-    with order_book_lock:
-        initialized = [s for s, b in order_books.items() if b['initialized']]
-        pending = [s for s, b in order_books.items() if not b['initialized']]
-    
+    # Leer la bandera 'initialized' es atómico: no hace falta bloquear los libros
+    initialized = [s for s, b in order_books.items() if b['initialized']]
+    pending = [s for s, b in order_books.items() if not b['initialized']]
+
     return {
         "status": "running",
         "total_symbols": len(coins),
         "initialized": len(initialized),
         "pending": len(pending),
         "symbols": coins,
-        "endpoints": {
-            "orderbook": "/orderbooks/{symbol}",
-            "symbols": "/symbols",
-            "health": "/health"
-        }
+        "endpoints": ENDPOINTS
     }
 
 @app.get("/health")
 def health_check():
     """Endpoint de salud del sistema"""
-    with order_book_lock:
-        initialized_count = sum(1 for b in order_books.values() if b['initialized'])
-        total = len(coins)
-        percentage = (initialized_count / total * 100) if total > 0 else 0
+    initialized_count = sum(1 for b in order_books.values() if b['initialized'])
+    total = len(coins)
+    percentage = (initialized_count / total * 100) if total > 0 else 0
     
     status = "healthy" if initialized_count == total else "partial" if initialized_count > 0 else "unhealthy"
     
@@ -401,45 +1199,437 @@ def health_check():
         "status": status,
         "initialized": initialized_count,
         "total": total,
-        "percentage": round(percentage, 2)
+        "percentage": round(percentage, 2),
+        "json_decoder": DECODIFICADOR,
+        "shm": {"levels": SHM_NIVELES, "dir": SHM_DIR} if SHM_NIVELES > 0 else None,
+        "recorder": recorder.estadisticas() if recorder is not None else None,
+        "response_cache": response_cache.estadisticas(),
+        "books": estadisticas_libros(),
+        "snapshots": snapshot_scheduler.estadisticas(),
+        "resync": estadisticas_resync(),
+        "verification": estadisticas_verificacion()
     }
 
-@app.get("/orderbooks/{symbol}")
-def get_orderbook(symbol: str):
-    symbol = symbol.upper()
+def construir_orderbook(symbol, depth=None, range_pct=None, side=None, binario=False):
+    """Arma la respuesta de /orderbooks/{symbol}. Devuelve (status_code, payload).
+
+    Con binario=True los lados salen como columnas (precios, qtys) de floats para
+    codificar_binario en vez de diccionarios de strings.
+    """
     if symbol not in order_books:
-        return JSONResponse(
-            {"error": f"Símbolo {symbol} no monitoreado", "available_symbols": coins}, 
-            status_code=404
-        )
+        return 404, {"error": f"Símbolo {symbol} no monitoreado", "available_symbols": coins}
+    if side is not None and side not in ("bid", "ask"):
+        return 400, {"error": "El parámetro side debe ser 'bid' o 'ask'"}
+    if (depth is not None and depth < 1) or (range_pct is not None and range_pct <= 0):
+        return 400, {"error": "depth debe ser >= 1 y range_pct > 0"}
+
+    incluir_bids = side in (None, "bid")
+    incluir_asks = side in (None, "ask")
+    parcial = depth is not None or range_pct is not None or side is not None
+    tick_min = tick_max = None
+
+    def extraer(lado):
+        if binario:
+            return lado.level_arrays(depth, tick_min, tick_max)
+        return lado.levels(depth, tick_min, tick_max)
 
-    with order_book_lock:
-        book = order_books[symbol]
+    book = order_books[symbol]
+    with book['lock']:
         if not book['initialized']:
-            return JSONResponse(
-                {"error": f"Order book de {symbol} aún no inicializado", "status": "initializing"}, 
-                status_code=503
-            )
+            return 503, {"error": f"Order book de {symbol} aún no inicializado", "status": "initializing"}
 
-        # Convertir a diccionarios para compatibilidad con el bot de análisis
-        bids_dict = {price: qty for price, qty in book['bids'].items()}
-        asks_dict = {price: qty for price, qty in book['asks'].items()}
+        lastUpdateId = book['lastUpdateId']
+        last_u = book['last_u']
+
+        if parcial:
+            # Porción pedida tomada directamente del índice ordenado: el lock dura O(log n + k)
+            if range_pct is not None:
+                mejores = [t for t in (book['bids'].best_tick(), book['asks'].best_tick()) if t is not None]
+                if mejores:
+                    mid = sum(mejores) / len(mejores)
+                    tick_min = mid * (1 - range_pct / 100)
+                    tick_max = mid * (1 + range_pct / 100)
+            niveles_bids = extraer(book['bids']) if incluir_bids else None
+            niveles_asks = extraer(book['asks']) if incluir_asks else None
+        else:
+            # Bajo el lock solo se copian la lista de ticks y el dict de niveles (copias en C)
+            bids_copia = book['bids'].copy()
+            asks_copia = book['asks'].copy()
 
-        return JSONResponse({
+    if not parcial:
+        niveles_bids = extraer(bids_copia)
+        niveles_asks = extraer(asks_copia)
+
+    if binario:
+        vacio = ([], [])
+        return 200, {
             "symbol": symbol,
-            "bids": bids_dict,
-            "asks": asks_dict,
-            "lastUpdateId": book['lastUpdateId'],
-            "last_u": book['last_u'],
-            "bid_depth": len(bids_dict),
-            "ask_depth": len(asks_dict)
-        })
+            "lastUpdateId": lastUpdateId,
+            "last_u": last_u,
+            "bids": niveles_bids if niveles_bids is not None else vacio,
+            "asks": niveles_asks if niveles_asks is not None else vacio,
+        }
+
+    respuesta = {"symbol": symbol}
+
+    # Convertir a diccionarios para compatibilidad con el bot de análisis
+    # (ordenados del mejor al peor precio: bids descendente, asks ascendente)
+    if niveles_bids is not None:
+        respuesta["bids"] = dict(niveles_bids)
+    if niveles_asks is not None:
+        respuesta["asks"] = dict(niveles_asks)
+
+    respuesta["lastUpdateId"] = lastUpdateId
+    respuesta["last_u"] = last_u
+    if "bids" in respuesta:
+        respuesta["bid_depth"] = len(respuesta["bids"])
+    if "asks" in respuesta:
+        respuesta["ask_depth"] = len(respuesta["asks"])
+    return 200, respuesta
+
+def construir_bloques(symbol, grouping, top=10):
+    """Arma la respuesta de /orderbooks/{symbol}/blocks. Devuelve (status_code, payload)"""
+    if symbol not in order_books:
+        return 404, {"error": f"Símbolo {symbol} no monitoreado", "available_symbols": coins}
+    if top < 1:
+        return 400, {"error": "El parámetro top debe ser >= 1"}
+
+    book = order_books[symbol]
+    with book['lock']:
+        if not book['initialized']:
+            return 503, {"error": f"Order book de {symbol} aún no inicializado", "status": "initializing"}
+
+        escala = book['bids'].escala or book['asks'].escala
+        ticks_por_bloque = BlockAggregator.ticks_para(grouping, escala)
+        if ticks_por_bloque is None:
+            return 400, {"error": f"La agrupación {grouping} debe ser un múltiplo del tick size de {symbol}"}
+
+        agregadores = book['agregadores']
+        agregador = agregadores.get(ticks_por_bloque)
+        if agregador is None:
+            # Primera consulta con esta agrupación: construir una vez y mantener incrementalmente
+            agregador = BlockAggregator(grouping, escala, ticks_por_bloque).reconstruir(book['bids'], book['asks'])
+            agregadores[ticks_por_bloque] = agregador
+            while len(agregadores) > MAX_AGRUPACIONES:
+                agregadores.popitem(last=False)
+        else:
+            agregadores.move_to_end(ticks_por_bloque)
+
+        bloques_long, bloques_short = agregador.top(top)
+        last_u = book['last_u']
+
+    return 200, {
+        "symbol": symbol,
+        "grouping": grouping,
+        "top": top,
+        "last_u": last_u,
+        "long": bloques_long,
+        "short": bloques_short
+    }
+
+def construir_diff(symbol, since):
+    """Niveles que cambiaron desde last_u == since. Devuelve (status_code, payload).
+
+    Si `since` ya salió del historial (o no corresponde a una versión servida), se
+    devuelve el libro completo con type="snapshot". En los diffs, qty "0" indica que
+    el nivel se eliminó.
+    """
+    if symbol not in order_books:
+        return 404, {"error": f"Símbolo {symbol} no monitoreado", "available_symbols": coins}
+
+    book = order_books[symbol]
+    with book['lock']:
+        if not book['initialized']:
+            return 503, {"error": f"Order book de {symbol} aún no inicializado", "status": "initializing"}
+        last_u = book['last_u']
+
+        # Recorrer el historial desde lo más reciente hasta encontrar la versión del cliente
+        pendientes = []
+        encontrado = since == last_u
+        for entrada in reversed(book['historial']):
+            if encontrado:
+                break
+            pendientes.append(entrada)
+            if entrada[0] == since:
+                encontrado = True
+
+    if not encontrado:
+        status_code, payload = construir_orderbook(symbol)
+        if status_code == 200:
+            payload["type"] = "snapshot"
+            payload["since"] = since
+        return status_code, payload
+
+    # Fusionar fuera del lock: la última actualización de cada precio gana
+    bids, asks = {}, {}
+    for _, _, b, a in reversed(pendientes):
+        bids.update(b)
+        asks.update(a)
+
+    return 200, {
+        "type": "diff",
+        "symbol": symbol,
+        "since": since,
+        "last_u": last_u,
+        "bids": bids,
+        "asks": asks,
+        "updates": len(pendientes)
+    }
+
+def construir_top_of_book(symbol):
+    """Mejor bid/ask actual. Devuelve (status_code, payload)"""
+    book = order_books[symbol]
+    with book['lock']:
+        if not book['initialized']:
+            return 503, {"error": f"Order book de {symbol} aún no inicializado", "status": "initializing"}
+        mejor_bid = book['bids'].best()
+        mejor_ask = book['asks'].best()
+        last_u = book['last_u']
+    return 200, {"symbol": symbol, "bid": mejor_bid, "ask": mejor_ask, "last_u": last_u}
+
+def construir_precio(symbol):
+    """Último trade, mejor bid/ask y mid. Devuelve (status_code, payload).
+
+    Sale del estado de bookTicker/aggTrade sin tocar el lock del libro; si todavía no
+    llegó ningún bookTicker (o no está suscrito) el mejor bid/ask sale del libro de depth.
+    """
+    if symbol not in order_books:
+        return 404, {"error": f"Símbolo {symbol} no monitoreado", "available_symbols": coins}
+    book = order_books[symbol]
+    precio = book['precio']
+    tope, trade = precio.tope, precio.trade
+    ahora = time.time()
+    recibidos = []
+
+    if tope is not None:
+        _, bid, bid_qty, ask, ask_qty, event_time, recibido = tope
+        fuente = STREAM_BOOK_TICKER
+        recibidos.append(recibido)
+    else:
+        with book['lock']:
+            inicializado = book['initialized']
+            mejor_bid = book['bids'].best() if inicializado else None
+            mejor_ask = book['asks'].best() if inicializado else None
+        if mejor_bid is None or mejor_ask is None:
+            bid = bid_qty = ask = ask_qty = event_time = None
+            fuente = None
+        else:
+            (bid, bid_qty), (ask, ask_qty) = mejor_bid, mejor_ask
+            event_time = None
+            fuente = "depth"
+
+    if trade is not None:
+        _, ultimo, ultimo_qty, comprador_maker, trade_time, recibido = trade
+        recibidos.append(recibido)
+    else:
+        ultimo = ultimo_qty = comprador_maker = trade_time = None
+
+    if fuente is None and ultimo is None:
+        return 503, {"error": f"Sin precio para {symbol} todavía", "status": "initializing"}
+
+    def numero(valor):
+        return float(valor) if valor is not None else None
+
+    mid = spread = None
+    if fuente is not None:
+        # Redondeo a los decimales de los precios recibidos (el mid puede caer en medio tick)
+        decimales = max(len(bid.partition('.')[2]), len(ask.partition('.')[2]))
+        bid, ask = float(bid), float(ask)
+        mid = round((bid + ask) / 2, decimales + 1)
+        spread = round(ask - bid, decimales)
+    return 200, {
+        "symbol": symbol,
+        # Mismo significado que /fapi/v1/ticker/price: último trade (o el mid si aún no hubo)
+        "price": numero(ultimo) if ultimo is not None else mid,
+        "last": numero(ultimo),
+        "last_qty": numero(ultimo_qty),
+        "last_buyer_maker": comprador_maker,
+        "trade_time": trade_time,
+        "bid": bid,
+        "bid_qty": numero(bid_qty),
+        "ask": ask,
+        "ask_qty": numero(ask_qty),
+        "mid": mid,
+        "spread": spread,
+        "event_time": event_time,
+        "source": fuente,
+        "age_ms": round((ahora - max(recibidos)) * 1000, 1) if recibidos else None,
+    }
+
+def version_precio(book):
+    """Versión de lo que devuelve construir_precio (para no reenviar precios sin cambios)"""
+    precio = book['precio']
+    return precio.version if precio.tope is not None else (precio.version, book['last_u'])
+
+def serializar_json(payload):
+    """Mismo formato que JSONResponse, para poder cachear los bytes"""
+    return json.dumps(payload, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+@app.get("/orderbooks/{symbol}")
+def get_orderbook(request: Request, symbol: str, depth: Optional[int] = None, range_pct: Optional[float] = None,
+                  side: Optional[str] = None, format: Optional[str] = None):
+    """Order book completo, o solo una parte con depth=N, range_pct=X (% desde el mid) y side=bid|ask.
+
+    Con format=bin o `Accept: application/x-orderbook-f64` responde en el formato
+    binario columnar de orderbook_wire.py en vez de JSON.
+    """
+    symbol = symbol.upper()
+    snapshot_scheduler.marcar_lectura(symbol)
+    binario = format == "bin" or MEDIA_TYPE_BINARIO in request.headers.get("accept", "")
+    media_type = MEDIA_TYPE_BINARIO if binario else "application/json"
+    variante = f"depth={depth}&range_pct={range_pct}&side={side}&bin={binario}"
+
+    # Respuesta condicional / cacheada mientras el libro no cambie (last_u se lee sin lock)
+    book = order_books.get(symbol)
+    if book is not None and book['initialized']:
+        version = book['last_u']
+        etag = ResponseCache.etag(symbol, variante, version)
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers={"ETag": etag})
+        body = response_cache.get(symbol, variante, version)
+        if body is not None:
+            return Response(body, media_type=media_type, headers={"ETag": etag})
+
+    status_code, payload = construir_orderbook(symbol, depth, range_pct, side, binario)
+    if status_code != 200:
+        return JSONResponse(payload, status_code=status_code)
+
+    if binario:
+        meta = {"symbol": symbol, "lastUpdateId": payload["lastUpdateId"], "last_u": payload["last_u"]}
+        body = codificar_binario(meta, payload["bids"], payload["asks"])
+    else:
+        body = serializar_json(payload)
+
+    # La versión real es la del libro en el momento de copiarlo
+    response_cache.put(symbol, variante, payload["last_u"], body)
+    etag = ResponseCache.etag(symbol, variante, payload["last_u"])
+    return Response(body, media_type=media_type, headers={"ETag": etag})
+
+@app.get("/price/{symbol}")
+def get_price(symbol: str):
+    """Último trade, mejor bid/ask y mid desde los streams bookTicker/aggTrade"""
+    status_code, payload = construir_precio(symbol.upper())
+    return JSONResponse(payload, status_code=status_code)
+
+@app.get("/orderbooks/{symbol}/diff")
+def get_orderbook_diff(symbol: str, since: int):
+    """Cambios desde la versión `since` (last_u) o libro completo si ya no está en el historial"""
+    symbol = symbol.upper()
+    snapshot_scheduler.marcar_lectura(symbol)
+    status_code, payload = construir_diff(symbol, since)
+    return JSONResponse(payload, status_code=status_code)
+
+@app.get("/orderbooks/{symbol}/blocks")
+def get_orderbook_blocks(symbol: str, grouping: float, top: int = 10):
+    """Top N bloques por volumen con precio promedio ponderado, mantenidos en el servidor"""
+    symbol = symbol.upper()
+    snapshot_scheduler.marcar_lectura(symbol)
+    status_code, payload = construir_bloques(symbol, grouping, top)
+    return JSONResponse(payload, status_code=status_code)
+
+# ===== STREAMING (WebSocket) =====
+def _config_stream(config, mensaje):
+    """Actualiza la configuración de una suscripción con un mensaje JSON del cliente"""
+    try:
+        cambios = json.loads(mensaje)
+    except ValueError:
+        return
+    if not isinstance(cambios, dict):
+        return
+    if cambios.get("mode") in MODOS_STREAM:
+        config["mode"] = cambios["mode"]
+    for clave, tipo in (("depth", int), ("top", int), ("grouping", float), ("interval_ms", int)):
+        if clave in cambios:
+            try:
+                config[clave] = tipo(cambios[clave])
+            except (TypeError, ValueError):
+                pass
+    config["interval_ms"] = max(STREAM_INTERVALO_MIN_MS, config["interval_ms"])
+
+def _payload_stream(symbol, config):
+    """Construye el mensaje a enviar según el modo de la suscripción"""
+    mode = config["mode"]
+    if mode == "top":
+        status_code, payload = construir_top_of_book(symbol)
+    elif mode == "price":
+        status_code, payload = construir_precio(symbol)
+    elif mode == "depth":
+        status_code, payload = construir_orderbook(symbol, depth=max(1, config["depth"]))
+    else:
+        if config.get("grouping") is None:
+            return {"type": "error", "error": "El modo blocks requiere grouping"}
+        status_code, payload = construir_bloques(symbol, config["grouping"], max(1, config["top"]))
+    payload["type"] = mode if status_code == 200 else "error"
+    return payload
+
+@app.websocket("/ws/orderbooks/{symbol}")
+async def stream_orderbook(websocket: WebSocket, symbol: str, mode: str = "top", depth: int = 20,
+                           top: int = 10, grouping: Optional[float] = None, interval_ms: int = 250):
+    """Suscripción push a un símbolo: snapshot inicial y luego actualizaciones limitadas por interval_ms.
+
+    Cada cliente elige su modo (top | depth | blocks | price, ver MODOS_STREAM; price es
+    el último trade, el mejor bid/ask y el mid de /price) y su ritmo, y puede cambiarlos
+    enviando un JSON como {"mode": "blocks", "grouping": 10, "interval_ms": 500}.
+    Backpressure: nunca se encolan mensajes; en cada intervalo se envía solo el estado
+    más reciente (si cambió last_u) y un cliente que no consume en STREAM_TIMEOUT_ENVIO
+    segundos se desconecta.
+    """
+    symbol = symbol.upper()
+    if symbol not in order_books:
+        await websocket.close(code=4404)
+        return
+    await websocket.accept()
+
+    config = {"mode": mode if mode in MODOS_STREAM else "top", "depth": depth, "top": top,
+              "grouping": grouping, "interval_ms": max(STREAM_INTERVALO_MIN_MS, interval_ms)}
+    cerrado = asyncio.Event()
+
+    async def recibir_config():
+        try:
+            while True:
+                _config_stream(config, await websocket.receive_text())
+        except (WebSocketDisconnect, RuntimeError):
+            pass
+        finally:
+            cerrado.set()
+
+    receptor = asyncio.create_task(recibir_config())
+    try:
+        # Snapshot inicial completo
+        status_code, inicial = construir_orderbook(symbol)
+        inicial["type"] = "snapshot" if status_code == 200 else "error"
+        await asyncio.wait_for(websocket.send_text(json.dumps(inicial)), STREAM_TIMEOUT_ENVIO)
+
+        ultimo_enviado = (inicial.get("last_u"), None)
+        while not cerrado.is_set():
+            try:
+                await asyncio.wait_for(cerrado.wait(), config["interval_ms"] / 1000)
+                break
+            except asyncio.TimeoutError:
+                pass
+            snapshot_scheduler.marcar_lectura(symbol)
+
+            # Solo se serializa si el libro (o el precio) o la configuración cambiaron desde el último envío
+            book = order_books[symbol]
+            actual = version_precio(book) if config["mode"] == "price" else book['last_u']
+            version = (actual, tuple(sorted(config.items())))
+            if version == ultimo_enviado:
+                continue
+            mensaje = json.dumps(_payload_stream(symbol, config))
+            await asyncio.wait_for(websocket.send_text(mensaje), STREAM_TIMEOUT_ENVIO)
+            ultimo_enviado = version
+    except asyncio.TimeoutError:
+        print(f"🐢 Cliente lento en stream de {symbol}, desconectando", flush=True)
+        await websocket.close(code=1013)
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        receptor.cancel()
 
 @app.get("/symbols")
 def get_symbols():
-    with order_book_lock:
-        initialized = [s for s, b in order_books.items() if b['initialized']]
-        pending = [s for s, b in order_books.items() if not b['initialized']]
+    initialized = [s for s, b in order_books.items() if b['initialized']]
+    pending = [s for s, b in order_books.items() if not b['initialized']]
 
     return {
         "total": len(order_books),
@@ -450,75 +1640,346 @@ def get_symbols():
         "pending_count": len(pending)
     }
 
-# ===== MAIN =====
-async def main():
-    # Iniciar WebSockets individuales (1 conexión por símbolo)
-    print("🚀 Iniciando WebSockets individuales...")
-    start_individual_websockets()
+def memoria_libro(book):
+    """Bytes aproximados de un libro por parte: los dos lados, los bloques agregados y el
+    historial de /diff (que retiene las listas de niveles de los mensajes). Se lee sin lock."""
+    historial = book['historial']
+    bytes_historial = sys.getsizeof(historial)
+    n = len(historial)
+    if n:
+        medidos = 0
+        bytes_entradas = 0
+        for i in range(0, n, max(1, n // MUESTRA_MEMORIA)):
+            try:
+                entrada = historial[i]
+            except IndexError:  # El historial se vació (snapshot nuevo) mientras se leía
+                break
+            medidos += 1
+            bytes_entradas += sys.getsizeof(entrada) + sys.getsizeof(entrada[1])
+            for niveles in entrada[2:]:
+                bytes_entradas += sys.getsizeof(niveles) + sum(
+                    sys.getsizeof(nivel) + sys.getsizeof(nivel[0]) + sys.getsizeof(nivel[1]) for nivel in niveles)
+        if medidos:
+            bytes_historial += int(bytes_entradas / medidos * n)
+    return {
+        "bids": book['bids'].memoria(),
+        "asks": book['asks'].memoria(),
+        "blocks": sum(agregador.memoria() for agregador in list(book['agregadores'].values())),
+        "history": bytes_historial,
+    }
 
-    # Esperar para que empiecen a llegar eventos y se acumulen en el buffer
-    print("⏳ Esperando acumulación de eventos...")
-    await asyncio.sleep(5)
+# Memoria por símbolo del último resumen periódico: medirla recorre todos los libros, así que
+# /health y /metrics sirven este valor en vez de recalcularlo en cada pedido
+memoria_libros = {}  # symbol -> memoria_libro(book)
 
-    # Cargar snapshots e inicializar (pasos 2-5)
-    for symbol in coins:
-        threading.Thread(target=initialize_order_book, args=(symbol,), daemon=True).start()
-        await asyncio.sleep(0.2)  # Escalonar las peticiones
+def actualizar_memoria_libros():
+    """Recalcula memoria_libros (lo llama imprimir_estado)"""
+    for symbol, book in list(order_books.items()):
+        memoria_libros[symbol] = memoria_libro(book)
 
-    # Iniciar la API en otro hilo independiente
-    def start_api():
-        uvicorn.run(app, host="0.0.0.0", port=8000, log_level="info")
+def estadisticas_libros():
+    """Memoria (del último resumen, None antes del primero) y poda de todos los libros"""
+    memorias = list(memoria_libros.values())
+    return {
+        "memory_bytes": sum(sum(memoria.values()) for memoria in memorias) if memorias else None,
+        "levels": sum(len(book['bids']) + len(book['asks']) for book in list(order_books.values())),
+        "pruned_levels": sum(sum(book['niveles_podados']) for book in list(order_books.values())),
+        "prune_resyncs": sum(book['resyncs_poda'] for book in list(order_books.values())),
+        "max_levels": PODA_MAX_NIVELES or None,
+        "band_pct": PODA_BANDA_PCT or None,
+    }
 
-    threading.Thread(target=start_api, daemon=True).start()
+def construir_metricas():
+    """Exposición de texto de Prometheus con las métricas por símbolo y globales"""
+    texto = TextoPrometheus()
+
+    # Sin locks: son lecturas de contadores y longitudes (a lo sumo desfasadas en un mensaje)
+    for symbol, book in list(order_books.items()):
+        etiqueta = {"symbol": symbol}
+        texto.muestra("orderbook_initialized", book['initialized'], etiqueta,
+                      ayuda="1 si el libro está sincronizado")
+        texto.muestra("orderbook_resync_in_progress", book['resync'] in RESYNC_ACTIVOS, etiqueta,
+                      ayuda="1 si hay un resync en curso")
+        texto.muestra("orderbook_buffer_events", len(book['buffer']), etiqueta,
+                      ayuda="Eventos en el buffer previo al snapshot")
+        texto.contador("orderbook_buffer_overflows_total", book['buffer'].desbordes, etiqueta,
+                       ayuda="Veces que el buffer previo al snapshot se desbordó")
+        for i, lado in enumerate(("bids", "asks")):
+            texto.muestra("orderbook_depth_levels", len(book[lado]), {"symbol": symbol, "side": lado},
+                          ayuda="Niveles de precio en el libro")
+            texto.contador("orderbook_pruned_levels_total", book['niveles_podados'][i], {"symbol": symbol, "side": lado},
+                           ayuda="Niveles lejanos del mid eliminados por la poda")
+        texto.contador("orderbook_prune_resyncs_total", book['resyncs_poda'], etiqueta,
+                       ayuda="Resyncs porque el precio llegó a la zona podada")
+        for parte, cantidad in memoria_libros.get(symbol, {}).items():
+            texto.muestra("orderbook_memory_bytes", cantidad, {"symbol": symbol, "part": parte},
+                          ayuda="Memoria aproximada del libro por parte (bids, asks, blocks, history), del último resumen periódico")
+        for resultado, clave in (("ok", "ok"), ("divergent", "divergente"), ("skipped", "omitida")):
+            texto.contador("orderbook_verifications_total", book['verificaciones'][clave],
+                           {"symbol": symbol, "result": resultado},
+                           ayuda="Verificaciones contra snapshots REST por resultado (divergent = resync)")
+        texto.contador("orderbook_verification_mismatched_levels_total", book['niveles_divergentes'], etiqueta,
+                       ayuda="Niveles distintos del snapshot encontrados por la verificación")
+        metricas = book['metricas']
+        if metricas is None:
+            continue
+        texto.contador("orderbook_messages_total", metricas.mensajes, etiqueta,
+                       ayuda="Mensajes de depth procesados")
+        texto.histograma("orderbook_event_lag_seconds", metricas.lag, etiqueta,
+                         ayuda="Recepción local menos el event time E de Binance (mensajes muestreados)")
+        texto.histograma("orderbook_processing_seconds", metricas.procesamiento, etiqueta,
+                         ayuda="Tiempo de on_message_combined (decode, verificación y apply; mensajes muestreados)")
+        texto.histograma("orderbook_lock_wait_seconds", metricas.espera_lock, etiqueta,
+                         ayuda="Espera del lock del libro (mensajes muestreados)")
+        texto.contador("orderbook_gaps_total", metricas.huecos, etiqueta,
+                       ayuda="Discontinuidades de secuencia (U/u/pu) detectadas")
+        texto.contador("orderbook_price_messages_total", book['precio'].mensajes, etiqueta,
+                       ayuda="Mensajes de bookTicker/aggTrade procesados")
+        texto.histograma("orderbook_resync_duration_seconds", metricas.resync, etiqueta,
+                         ayuda="Desde el hueco hasta el libro consistente")
+        texto.contador("orderbook_resync_failed_total", metricas.resync_fallidos, etiqueta,
+                       ayuda="Resyncs que agotaron los reintentos")
+
+    with resync_lock:
+        contadores = dict(resync_contadores)
+    for resultado, clave in (("completed", "completados"), ("failed", "fallidos"), ("deduplicated", "deduplicados")):
+        texto.contador("orderbook_resyncs_total", contadores[clave], {"result": resultado},
+                       ayuda="Resyncs de todos los símbolos por resultado")
+
+    snapshots = snapshot_scheduler.estadisticas()
+    texto.muestra("orderbook_snapshot_weight_used", snapshots['weight_used_1m'],
+                  ayuda="Peso REST usado en el último minuto (X-MBX-USED-WEIGHT-1M)")
+    texto.muestra("orderbook_snapshot_weight_budget", snapshots['weight_budget_1m'],
+                  ayuda="Presupuesto de peso REST por minuto")
+    texto.muestra("orderbook_snapshot_pending", snapshots['pending'], ayuda="Snapshots en cola")
+    texto.muestra("orderbook_snapshot_in_flight", snapshots['in_flight'], ayuda="Snapshots en curso")
+    for resultado, clave in (("completed", "completed"), ("error", "errors"), ("rate_limited", "rate_limited")):
+        texto.contador("orderbook_snapshots_total", snapshots[clave], {"result": resultado},
+                       ayuda="Snapshots REST por resultado")
+    texto.contador("orderbook_verification_budget_skips_total", snapshots['verifications_skipped'],
+                   ayuda="Snapshots de verificación no pedidos por falta de presupuesto de peso")
+    texto.muestra("orderbook_verification_lock_seconds_max", round(verificacion_estado['lock_ms_max'] / 1000, 6),
+                  ayuda="Máximo tiempo con el lock de un libro tomado por la verificación")
+
+    cache = response_cache.estadisticas()
+    texto.muestra("orderbook_response_cache_bytes", cache['bytes'], ayuda="Memoria usada por el cache de respuestas")
+    for resultado, clave in (("hit", "hits"), ("miss", "misses"), ("eviction", "evictions")):
+        texto.contador("orderbook_response_cache_total", cache[clave], {"result": resultado},
+                       ayuda="Accesos al cache de respuestas por resultado")
+
+    if recorder is not None:
+        grabacion = recorder.estadisticas()
+        texto.contador("orderbook_recorder_records_total", grabacion['recorded'], ayuda="Registros grabados")
+        texto.contador("orderbook_recorder_dropped_total", grabacion['dropped'],
+                       ayuda="Registros descartados por cola llena")
+        texto.muestra("orderbook_recorder_queue", grabacion['queued'], ayuda="Registros esperando al escritor")
+
+    for ruta, (histograma, por_status) in list(metricas_api.rutas.items()):
+        texto.histograma("orderbook_api_request_duration_seconds", histograma, {"route": ruta},
+                         ayuda="Latencia de la API por ruta")
+        for status, cantidad in list(por_status.items()):
+            texto.contador("orderbook_api_requests_total", cantidad, {"route": ruta, "status": status},
+                           ayuda="Requests de la API por ruta y status")
+
+    return texto.render()
+
+@app.get("/metrics")
+def get_metrics():
+    """Métricas en formato de texto de Prometheus"""
+    return Response(content=construir_metricas(), media_type=MEDIA_TYPE_PROMETHEUS)
 
+# ===== MAIN =====
+def url_api():
+    return f"unix:{API_UDS}" if API_UDS else f"http://localhost:{API_PUERTO}"
+
+def imprimir_endpoints():
+    if WORKER_ID is not None:
+        # Los endpoints los anuncia el proceso frontal
+        print(f"🧩 Worker #{WORKER_ID}: {len(coins)} símbolos, API en {url_api()}", flush=True)
+        return
     print("\n" + "="*80)
-    print("🚀 API de OrderBooks corriendo en http://localhost:8000")
+    print(f"🚀 API de OrderBooks corriendo en {url_api()}")
     print("="*80)
     print("📍 Endpoints disponibles:")
     print("   • GET /                          - Información del sistema")
     print("   • GET /health                    - Estado de salud")
     print("   • GET /symbols                   - Lista de símbolos")
-    print("   • GET /orderbooks/{symbol}       - Order book de un símbolo")
+    print("   • GET /orderbooks/{symbol}       - Order book de un símbolo (?depth=N&range_pct=X&side=bid|ask)")
+    print("   • GET /orderbooks/{symbol}/blocks?grouping=X&top=10 - Top bloques agrupados")
+    print("   • GET /orderbooks/{symbol}/diff?since=<last_u> - Cambios desde una versión")
+    print("   • GET /price/{symbol}            - Último trade, mejor bid/ask y mid (bookTicker/aggTrade)")
+    print("   • WS  /ws/orderbooks/{symbol}?mode=top|depth|blocks|price&interval_ms=250 - Stream push")
     print("="*80 + "\n")
 
+def imprimir_estado():
+    """Muestra el resumen periódico del estado de los order books"""
+    # Recopilar estadísticas detalladas
+    initialized_count = sum(1 for b in order_books.values() if b['initialized'])
+    pending_count = len(coins) - initialized_count
+
+    # Contar símbolos con datos
+    symbols_con_datos = []
+    symbols_pendientes = []
+    for symbol, book in order_books.items():
+        if book['initialized']:
+            symbols_con_datos.append(symbol)
+        else:
+            symbols_pendientes.append(symbol)
+
+    # Mostrar resumen de estado claro
+    porcentaje = (initialized_count / len(coins) * 100) if len(coins) > 0 else 0
+
+    print("\n" + "="*80, flush=True)
+    print(f"📊 ESTADO DEL SISTEMA - {time.strftime('%Y-%m-%d %H:%M:%S')}", flush=True)
+    print("="*80, flush=True)
+    print(f"✅ Order books inicializados: {initialized_count}/{len(coins)} ({porcentaje:.1f}%)", flush=True)
+    print(f"⏳ Pendientes de inicializar: {pending_count}", flush=True)
+    actualizar_memoria_libros()
+    libros = estadisticas_libros()
+    print(f"🧠 Memoria de los libros: {libros['memory_bytes'] / 1024 / 1024:.1f} MB en {libros['levels']} niveles "
+          f"({libros['pruned_levels']} podados)", flush=True)
+    verificacion = estadisticas_verificacion()
+    if verificacion['ok'] or verificacion['divergent']:
+        print(f"🔎 Verificaciones contra snapshots: {verificacion['ok']} ok, {verificacion['divergent']} divergentes, "
+              f"{verificacion['skipped']} omitidas", flush=True)
+    resync = estadisticas_resync()
+    if resync['completed'] or resync['in_flight']:
+        print(f"🔁 Resyncs: {resync['completed']} completados, {resync['in_flight']} en curso "
+              f"(p50 {resync['p50_ms']} ms, p99 {resync['p99_ms']} ms)", flush=True)
+
+    if initialized_count == len(coins):
+        print(f"🟢 SISTEMA OPERATIVO AL 100% - Todos los order books funcionando correctamente", flush=True)
+    elif initialized_count > 0:
+        print(f"🟡 SISTEMA PARCIALMENTE OPERATIVO", flush=True)
+        if pending_count <= 5 and pending_count > 0:
+            print(f"   Símbolos pendientes: {', '.join(symbols_pendientes)}", flush=True)
+    else:
+        print(f"🔴 SISTEMA NO OPERATIVO - Ningún order book inicializado", flush=True)
+
+    if WORKER_ID is not None:
+        print(f"🧩 Worker #{WORKER_ID} (pid {os.getpid()})", flush=True)
+    print(f"🌐 API REST: {url_api()}/orderbooks/{{symbol}}", flush=True)
+    print("="*80 + "\n", flush=True)
+
+async def main():
+    # Iniciar WebSockets combinados (varios símbolos por conexión)
+    print("🚀 Iniciando WebSockets combinados...")
+    iniciar_grabacion()
+    start_websockets()
+    iniciar_shm()
+    iniciar_verificacion()
+
+    # Cargar snapshots e inicializar (pasos 2-5): cada símbolo pide su snapshot en cuanto
+    # tiene eventos en el buffer y el planificador limita concurrencia y peso
+    for symbol in coins:
+        programar_inicializacion(symbol)
+
+    # Iniciar la API en otro hilo independiente
+    def start_api():
+        uvicorn.run(app, host=API_HOST, port=API_PUERTO, uds=API_UDS, log_level="info")
+
+    threading.Thread(target=start_api, daemon=True).start()
+
+    imprimir_endpoints()
+
     # Mantener vivo el proceso principal y mostrar estado cada 60 segundos
     while True:
         await asyncio.sleep(60)
+        imprimir_estado()
+
+async def main_async():
+    """Modo async: WebSockets, snapshots, backoff, resync y API comparten un único event loop"""
+    global ingestion_loop, ws_manager
+    ingestion_loop = asyncio.get_running_loop()
+
+    print("🚀 Iniciando ingesta async (WebSockets + API en el mismo event loop)...")
+    ws_manager = AsyncShardedStreamManager(
+        coins,
+        on_message=on_message_combined,
+        on_shard_down=on_shard_down,
+        on_resubscribed=on_symbols_resubscribed,
+        streams_por_conexion=STREAMS_POR_CONEXION,
+        sufijos=SUFIJOS_STREAMS,
+        url_base=BINANCE_WS_URL,
+    )
+    iniciar_grabacion()
+    ws_manager.start()
+    iniciar_shm()
+    iniciar_verificacion()
+
+    # La API corre como tarea del mismo loop en vez de en un hilo propio
+    api = uvicorn.Server(uvicorn.Config(app, host=API_HOST, port=API_PUERTO, uds=API_UDS, log_level="info"))
+    tarea_api = asyncio.create_task(api.serve())
+
+    # Cargar snapshots e inicializar (pasos 2-5): cada símbolo pide su snapshot en cuanto
+    # tiene eventos en el buffer y el planificador limita concurrencia y peso
+    for symbol in coins:
+        programar_inicializacion(symbol)
 
-        # Recopilar estadísticas detalladas
-        with order_book_lock:
-            initialized_count = sum(1 for b in order_books.values() if b['initialized'])
-            pending_count = len(coins) - initialized_count
-
-            # Contar símbolos con datos
-            symbols_con_datos = []
-            symbols_pendientes = []
-            for symbol, book in order_books.items():
-                if book['initialized']:
-                    symbols_con_datos.append(symbol)
-                else:
-                    symbols_pendientes.append(symbol)
-
-        # Mostrar resumen de estado claro
-        porcentaje = (initialized_count / len(coins) * 100) if len(coins) > 0 else 0
-
-        print("\n" + "="*80, flush=True)
-        print(f"📊 ESTADO DEL SISTEMA - {time.strftime('%Y-%m-%d %H:%M:%S')}", flush=True)
-        print("="*80, flush=True)
-        print(f"✅ Order books inicializados: {initialized_count}/{len(coins)} ({porcentaje:.1f}%)", flush=True)
-        print(f"⏳ Pendientes de inicializar: {pending_count}", flush=True)
-
-        if initialized_count == len(coins):
-            print(f"🟢 SISTEMA OPERATIVO AL 100% - Todos los order books funcionando correctamente", flush=True)
-        elif initialized_count > 0:
-            print(f"🟡 SISTEMA PARCIALMENTE OPERATIVO", flush=True)
-            if pending_count <= 5 and pending_count > 0:
-                print(f"   Símbolos pendientes: {', '.join(symbols_pendientes)}", flush=True)
-        else:
-            print(f"🔴 SISTEMA NO OPERATIVO - Ningún order book inicializado", flush=True)
+    imprimir_endpoints()
+
+    # Mostrar estado cada 60 segundos mientras la API siga viva
+    while not tarea_api.done():
+        await asyncio.sleep(60)
+        imprimir_estado()
+
+def ejecutar_frontal(simbolos):
+    """Modo multiproceso: reparte los símbolos entre WORKERS procesos y sirve la API unificada"""
+    pool = PoolWorkers(simbolos, WORKERS, os.path.abspath(__file__), SNAPSHOT_TRABAJADORES, GRABACION_DIR,
+                       argumentos=("--async",) if MODO_ASYNC else (), verificacion_intervalo=VERIFICACION_INTERVALO)
+    pool.iniciar()
+    imprimir_endpoints()
+    try:
+        uvicorn.run(crear_app_frontal(pool, ENDPOINTS, METRICAS), host=API_HOST, port=API_PUERTO,
+                    uds=API_UDS, log_level="info")
+    finally:
+        pool.detener()  # Si uvicorn no llegó a arrancar (p. ej. el puerto estaba ocupado)
+
+def vigilar_frontal():
+    """Un worker termina si desaparece el proceso frontal que lo lanzó (p. ej. por SIGKILL)"""
+    frontal = os.getppid()
+
+    def vigilar():
+        while os.getppid() == frontal:
+            time.sleep(1)
+        print(f"👋 Worker #{WORKER_ID}: el proceso frontal terminó, saliendo", flush=True)
+        os._exit(0)
 
-        print(f"🌐 API REST: http://localhost:8000/orderbooks/{{symbol}}", flush=True)
-        print("="*80 + "\n", flush=True)
+    threading.Thread(target=vigilar, daemon=True).start()
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Order books locales de Binance Futures con API REST/WebSocket")
+    parser.add_argument("--simbolos", help="BTC,ETH,... sin preguntar por consola (o ORDERBOOK_SIMBOLOS)")
+    parser.add_argument("--puerto", type=int, default=API_PUERTO, help="puerto de la API (o ORDERBOOK_PUERTO)")
+    parser.add_argument("--host", default=API_HOST, help="interfaz de la API (o ORDERBOOK_HOST)")
+    parser.add_argument("--uds", help="socket Unix para la API en lugar de host/puerto")
+    parser.add_argument("--workers", type=int, default=WORKERS,
+                        help="procesos entre los que se reparten los símbolos (o ORDERBOOK_WORKERS)")
+    parser.add_argument("--worker", type=int, help=argparse.SUPPRESS)  # Lo pasa el proceso frontal
+    parser.add_argument("--async", action="store_true", help="ingesta async (o ORDERBOOK_MODO=async)")
+    args = parser.parse_args()
+    API_PUERTO = args.puerto
+    API_HOST = args.host
+    API_UDS = args.uds
+    WORKERS = args.workers
+    WORKER_ID = args.worker
+
+    # Arranque desatendido (supervisor, systemd, docker) si los símbolos están configurados
+    simbolos = simbolos_configurados(args.simbolos)
+    if simbolos is not None:
+        simbolos = validar_simbolos_configurados(simbolos)
+    else:
+        try:
+            simbolos = seleccionar_simbolos()
+        except EOFError:
+            print("\n❌ Sin consola para elegir símbolos: usa --simbolos, ORDERBOOK_SIMBOLOS o "
+                  "simbolos_orderbook en config.py")
+            sys.exit(1)
+
+    if WORKER_ID is None and WORKERS > 1:
+        ejecutar_frontal(simbolos)
+    else:
+        if WORKER_ID is not None:
+            vigilar_frontal()
+        configurar_simbolos(simbolos)
+        asyncio.run(main_async() if MODO_ASYNC else main())
@@ -0,0 +1,105 @@
+import heapq
+import sys
+
+# Índices de cada bucket: [qty_total, suma(precio * qty), niveles]
+QTY, PRECIO_QTY, NIVELES = 0, 1, 2
+
+
+class BlockAggregator:
+    """Bloques de precio (agrupación fija) mantenidos de forma incremental.
+
+    Equivale a lo que hace `calcular_bloques` en Auto Runner.py, pero en vez de
+    reagrupar todo el libro en cada consulta se actualiza con cada nivel que
+    cambia: O(niveles cambiados) por depth update. El bucket de un nivel es
+    tick // ticks_por_bloque, igual que agrupar_precio (redondeo hacia abajo).
+    """
+
+    __slots__ = ('agrupacion', 'escala', 'ticks_por_bloque', 'bids', 'asks')
+
+    def __init__(self, agrupacion, escala, ticks_por_bloque):
+        self.agrupacion = agrupacion
+        self.escala = escala
+        self.ticks_por_bloque = ticks_por_bloque
+        self.bids = {}  # bucket -> [qty_total, suma_precio_qty, niveles]
+        self.asks = {}
+
+    @staticmethod
+    def ticks_para(agrupacion, escala):
+        """Ticks por bloque para una agrupación, o None si no es múltiplo del tick size"""
+        if escala is None or agrupacion <= 0:
+            return None
+        ticks = agrupacion * escala
+        redondeado = round(ticks)
+        if redondeado < 1 or abs(ticks - redondeado) > 1e-6 * max(1, ticks):
+            return None
+        return redondeado
+
+    def reconstruir(self, bids_side, asks_side):
+        """Recalcula todos los buckets desde los lados del libro (tras un snapshot)"""
+        for buckets, lado in ((self.bids, bids_side), (self.asks, asks_side)):
+            buckets.clear()
+            tpb = self.ticks_por_bloque
+            escala = self.escala
+            for tick, (_, _, qty) in lado.niveles.items():
+                bucket = buckets.get(tick // tpb)
+                if bucket is None:
+                    buckets[tick // tpb] = [qty, tick / escala * qty, 1]
+                else:
+                    bucket[QTY] += qty
+                    bucket[PRECIO_QTY] += tick / escala * qty
+                    bucket[NIVELES] += 1
+        return self
+
+    def actualizar(self, es_bid, tick, qty_anterior, qty_nueva):
+        """Aplica el cambio de un nivel (qty_nueva == 0 significa nivel eliminado)"""
+        if qty_anterior == qty_nueva:
+            return
+        buckets = self.bids if es_bid else self.asks
+        clave = tick // self.ticks_por_bloque
+        delta = qty_nueva - qty_anterior
+        bucket = buckets.get(clave)
+        if bucket is None:
+            buckets[clave] = [qty_nueva, tick / self.escala * qty_nueva, 1]
+            return
+
+        bucket[QTY] += delta
+        bucket[PRECIO_QTY] += tick / self.escala * delta
+        if qty_anterior == 0:
+            bucket[NIVELES] += 1
+        elif qty_nueva == 0:
+            bucket[NIVELES] -= 1
+            # Contar niveles evita que el error de punto flotante deje buckets "fantasma"
+            if bucket[NIVELES] <= 0:
+                del buckets[clave]
+
+    def memoria(self):
+        """Bytes aproximados de los buckets (todos tienen la misma forma: se mide uno por lado)"""
+        total = 0
+        for buckets in (self.bids, self.asks):
+            total += sys.getsizeof(buckets)
+            try:
+                clave, bucket = next(iter(buckets.items()))
+            except (StopIteration, RuntimeError):  # Vacío, o cambió mientras se leía sin lock
+                continue
+            total += len(buckets) * (sys.getsizeof(clave) + sys.getsizeof(bucket)
+                                     + sum(sys.getsizeof(valor) for valor in bucket))
+        return total
+
+    def _top_lado(self, buckets, n):
+        bloques = []
+        for clave, (qty, precio_qty, _) in heapq.nlargest(n, buckets.items(), key=lambda kv: kv[1][QTY]):
+            if qty > 0:
+                bloques.append({
+                    'precio': precio_qty / qty,  # Precio promedio ponderado por volumen
+                    'volumen': qty,
+                    'rango': clave * self.ticks_por_bloque / self.escala,
+                })
+        return bloques
+
+    def top(self, n=10):
+        """Top n bloques por volumen: LONG (bids, precio descendente) y SHORT (asks, ascendente)"""
+        bloques_long = self._top_lado(self.bids, n)
+        bloques_short = self._top_lado(self.asks, n)
+        bloques_long.sort(key=lambda x: x['precio'], reverse=True)
+        bloques_short.sort(key=lambda x: x['precio'])
+        return bloques_long, bloques_short
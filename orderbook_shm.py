@@ -0,0 +1,280 @@
+"""Exportación de los top-N niveles de cada libro a memoria compartida.
+
+Cada símbolo tiene su propia región: un archivo mapeado en memoria
+(`orderbook_<SYMBOL>.shm`, en /dev/shm si existe). `order book.py` escribe y
+cualquier proceso local lo lee sin HTTP ni JSON, sin tocar el lock del libro.
+
+Layout (little-endian, todo alineado a 8 bytes):
+    header (64 bytes):
+        magic b"OBSH" | u32 versión layout | u64 seq | u32 capacidad | u32 n_bids
+        | u32 n_asks | u32 inicializado | i64 last_u | f64 timestamp | relleno
+    bid_price f8[capacidad] | bid_qty f8[capacidad] | ask_price f8[capacidad] | ask_qty f8[capacidad]
+
+Consistencia tipo seqlock: el escritor pone `seq` impar antes de escribir y par al
+terminar; el lector copia los datos y los descarta si `seq` era impar o cambió
+mientras copiaba. El escritor es un único hilo. Esto depende de que las escrituras
+de 8 bytes alineadas sean atómicas y de que los stores del escritor (seq, datos,
+seq) y los loads del lector se vean en orden, cosa que sólo garantiza x86-64: Python
+no emite barreras de memoria, así que SharedBookWriter y SharedBookReader se niegan
+a arrancar en otras arquitecturas (ARM64 incluida).
+
+Si el escritor arranca con otra capacidad, no reescribe la región en el lugar: arma
+una nueva en un archivo temporal, la pone en su ruta con `os.replace` y marca la
+vieja como retirada (versión VERSION_RETIRADA). Los lectores revisan versión y
+capacidad en cada lectura y vuelven a mapear el archivo cuando cambian.
+"""
+import mmap
+import os
+import platform
+import struct
+import sys
+import tempfile
+import time
+from array import array
+
+MAGIC = b"OBSH"
+VERSION_LAYOUT = 1
+VERSION_RETIRADA = 0  # Región reemplazada por otra (otra capacidad): los lectores deben volver a mapear
+TAMANO_HEADER = 64
+# magic, versión, seq, capacidad, n_bids, n_asks, inicializado, last_u, timestamp
+FORMATO_HEADER = "<4sIQIIIIqd"
+OFFSET_SEQ = 8
+OFFSET_CAPACIDAD = 16
+FORMATO_DATOS = "<IIIqd"  # n_bids, n_asks, inicializado, last_u, timestamp
+OFFSET_DATOS = 20
+O_BINARY = getattr(os, "O_BINARY", 0)
+
+# Arquitecturas con stores y loads ordenados (TSO), donde el seqlock no necesita barreras
+ARQUITECTURAS_SOPORTADAS = ("x86_64", "amd64")
+
+
+def verificar_plataforma():
+    """RuntimeError si en esta arquitectura el seqlock no garantiza copias consistentes"""
+    maquina = platform.machine()
+    if maquina.lower() not in ARQUITECTURAS_SOPORTADAS:
+        raise RuntimeError(f"La memoria compartida de order books requiere x86-64 (esta máquina es "
+                           f"{maquina or 'desconocida'}): sin barreras de memoria un lector podría "
+                           f"aceptar copias mezcladas")
+
+
+def directorio_por_defecto():
+    """/dev/shm (tmpfs, sin disco) si existe; si no, el directorio temporal del sistema"""
+    return "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+
+
+def ruta_region(symbol, directorio=None):
+    return os.path.join(directorio or directorio_por_defecto(), f"orderbook_{symbol.upper()}.shm")
+
+
+def tamano_region(capacidad):
+    return TAMANO_HEADER + 4 * 8 * capacidad
+
+
+def _bytes_f64(valores):
+    columna = array('d', valores)
+    if sys.byteorder == 'big':
+        columna.byteswap()
+    return columna.tobytes()
+
+
+class SharedBookWriter:
+    """Región de un símbolo del lado del escritor (un solo hilo escribe)"""
+
+    def __init__(self, symbol, capacidad=20, directorio=None):
+        verificar_plataforma()
+        self.symbol = symbol.upper()
+        self.capacidad = capacidad
+        self.ruta = ruta_region(self.symbol, directorio)
+        tamano = tamano_region(capacidad)
+
+        fd, mm, seq = _abrir_region(self.ruta)
+        if mm is not None and len(mm) == tamano and struct.unpack_from("<I", mm, OFFSET_CAPACIDAD)[0] == capacidad:
+            # Misma capacidad: se reutiliza el archivo y los lectores que lo tienen mapeado siguen viendo datos nuevos
+            self.fd, self.mm = fd, mm
+        else:
+            # Otra capacidad (o nada compatible): región nueva reemplazando la vieja de una vez
+            temporal = f"{self.ruta}.{os.getpid()}.tmp"
+            self.fd = os.open(temporal, os.O_RDWR | os.O_CREAT | os.O_TRUNC | O_BINARY, 0o644)
+            os.ftruncate(self.fd, tamano)
+            self.mm = mmap.mmap(self.fd, tamano)
+            struct.pack_into(FORMATO_HEADER, self.mm, 0, MAGIC, VERSION_LAYOUT, 0, capacidad, 0, 0, 0, 0, 0.0)
+            os.replace(temporal, self.ruta)
+            if mm is not None:
+                _retirar(mm, seq)
+                mm.close()
+            if fd is not None:
+                os.close(fd)
+            seq = 0
+
+        # Si el proceso anterior murió a mitad de escritura, cerrar esa versión; el header
+        # vacío se escribe como cualquier otra versión (seq impar y después par)
+        self.seq = seq + (seq & 1) + 1
+        struct.pack_into(FORMATO_HEADER, self.mm, 0, MAGIC, VERSION_LAYOUT, self.seq, capacidad, 0, 0, 0, 0, 0.0)
+        self.seq += 1
+        struct.pack_into("<Q", self.mm, OFFSET_SEQ, self.seq)
+
+    def publicar(self, last_u, bids, asks, inicializado=True):
+        """Escribe una versión nueva. `bids`/`asks` son (precios, qtys) del mejor al peor"""
+        capacidad = self.capacidad
+        bid_precios, bid_qtys = bids[0][:capacidad], bids[1][:capacidad]
+        ask_precios, ask_qtys = asks[0][:capacidad], asks[1][:capacidad]
+        mm = self.mm
+        base = TAMANO_HEADER
+        columna = 8 * capacidad
+
+        self.seq += 1  # impar: escritura en curso
+        struct.pack_into("<Q", mm, OFFSET_SEQ, self.seq)
+        struct.pack_into(FORMATO_DATOS, mm, OFFSET_DATOS, len(bid_precios), len(ask_precios),
+                         1 if inicializado else 0, last_u or 0, time.time())
+        for i, valores in enumerate((bid_precios, bid_qtys, ask_precios, ask_qtys)):
+            inicio = base + i * columna
+            mm[inicio:inicio + 8 * len(valores)] = _bytes_f64(valores)
+        self.seq += 1  # par: versión completa
+        struct.pack_into("<Q", mm, OFFSET_SEQ, self.seq)
+
+    def cerrar(self, borrar=False):
+        self.mm.close()
+        os.close(self.fd)
+        if borrar:
+            try:
+                os.remove(self.ruta)
+            except OSError:
+                pass
+
+
+def _abrir_region(ruta):
+    """(fd, mmap, seq) de una región compatible ya existente en `ruta`, o (fd|None, None, 0)"""
+    try:
+        fd = os.open(ruta, os.O_RDWR | O_BINARY)
+    except FileNotFoundError:
+        return None, None, 0
+    if os.fstat(fd).st_size >= TAMANO_HEADER:
+        mm = mmap.mmap(fd, 0)
+        magic, version, seq = struct.unpack_from("<4sIQ", mm, 0)
+        if magic == MAGIC and version == VERSION_LAYOUT:
+            return fd, mm, seq
+        mm.close()
+    return fd, None, 0
+
+
+def _retirar(mm, seq):
+    """Marca una región reemplazada: los lectores la ven como una versión nueva y vuelven a mapear"""
+    seq += (seq & 1) + 1
+    struct.pack_into("<Q", mm, OFFSET_SEQ, seq)
+    struct.pack_into("<I", mm, 4, VERSION_RETIRADA)
+    struct.pack_into("<Q", mm, OFFSET_SEQ, seq + 1)
+
+
+class SharedBookReader:
+    """Lector de la región de un símbolo: mapeo de solo lectura y snapshots consistentes.
+
+        lector = SharedBookReader("BTCUSDT")
+        libro = lector.leer()   # {"seq", "last_u", "timestamp", "initialized", "bids", "asks"}
+        precios, qtys = libro["bids"]
+    """
+
+    def __init__(self, symbol, directorio=None):
+        verificar_plataforma()
+        self.symbol = symbol.upper()
+        self.ruta = ruta_region(self.symbol, directorio)
+        self.mm = None
+        self._mapear()
+        self.reintentos = 0  # Lecturas descartadas por coincidir con una escritura
+        self.remapeos = 0  # Veces que el escritor reemplazó la región (cambio de capacidad)
+
+    def _mapear(self):
+        with open(self.ruta, "rb") as archivo:
+            mm = mmap.mmap(archivo.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _, capacidad = struct.unpack_from("<4sIQI", mm, 0)
+        if magic != MAGIC or version != VERSION_LAYOUT or len(mm) < tamano_region(capacidad):
+            mm.close()
+            raise ValueError(f"{self.ruta} no es una región de order book compatible")
+        if self.mm is not None:
+            self.mm.close()
+        self.mm = mm
+        self.capacidad = capacidad
+
+    def _vigente(self):
+        """Vuelve a mapear el archivo si la región fue retirada o cambió de capacidad"""
+        mm = self.mm
+        if (struct.unpack_from("<I", mm, 4)[0] != VERSION_LAYOUT
+                or struct.unpack_from("<I", mm, OFFSET_CAPACIDAD)[0] != self.capacidad):
+            self._mapear()
+            self.remapeos += 1
+        return self.mm
+
+    def seq(self):
+        """Versión actual (barata: sirve para saber si hay algo nuevo antes de copiar)"""
+        return struct.unpack_from("<Q", self._vigente(), OFFSET_SEQ)[0]
+
+    def leer(self, n=None, timeout=1.0):
+        """Snapshot consistente de los n mejores niveles (todos los publicados si n es None)"""
+        limite = None
+        while True:
+            mm = self._vigente()
+            columna = 8 * self.capacidad
+            (seq,) = struct.unpack_from("<Q", mm, OFFSET_SEQ)
+            if not seq & 1:
+                n_bids, n_asks, inicializado, last_u, timestamp = struct.unpack_from(FORMATO_DATOS, mm, OFFSET_DATOS)
+                if n is not None:
+                    n_bids, n_asks = min(n, n_bids), min(n, n_asks)
+                columnas = []
+                for i, cantidad in enumerate((n_bids, n_bids, n_asks, n_asks)):
+                    inicio = TAMANO_HEADER + i * columna
+                    valores = array('d')
+                    valores.frombytes(mm[inicio:inicio + 8 * cantidad])
+                    if sys.byteorder == 'big':
+                        valores.byteswap()
+                    columnas.append(valores)
+                if struct.unpack_from("<Q", mm, OFFSET_SEQ)[0] == seq:
+                    return {
+                        "seq": seq,
+                        "last_u": last_u,
+                        "timestamp": timestamp,
+                        "initialized": bool(inicializado),
+                        "bids": (columnas[0], columnas[1]),
+                        "asks": (columnas[2], columnas[3]),
+                    }
+            # El escritor estaba a mitad de una versión: reintentar
+            self.reintentos += 1
+            if limite is None:
+                limite = time.monotonic() + timeout
+            elif time.monotonic() > limite:
+                raise TimeoutError(f"No se pudo leer una versión consistente de {self.symbol}")
+
+    def top(self):
+        """(mejor_bid, mejor_ask) como (precio, qty), o None si el lado está vacío"""
+        libro = self.leer(1)
+        bid = (libro["bids"][0][0], libro["bids"][1][0]) if libro["bids"][0] else None
+        ask = (libro["asks"][0][0], libro["asks"][1][0]) if libro["asks"][0] else None
+        return bid, ask
+
+    def esperar_cambio(self, seq_anterior, timeout=1.0, intervalo=0.0005):
+        """Espera (sondeando) a que haya una versión distinta de `seq_anterior`. Devuelve la nueva o None"""
+        limite = time.monotonic() + timeout
+        while time.monotonic() < limite:
+            seq = self.seq()
+            if seq != seq_anterior and not seq & 1:
+                return seq
+            time.sleep(intervalo)
+        return None
+
+    def cerrar(self):
+        self.mm.close()
+
+
+if __name__ == "__main__":
+    # Uso: python orderbook_shm.py BTCUSDT [niveles]
+    symbol = sys.argv[1] if len(sys.argv) > 1 else "BTCUSDT"
+    niveles = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    lector = SharedBookReader(symbol)
+    seq = None
+    while True:
+        seq = lector.esperar_cambio(seq, timeout=5) or seq
+        libro = lector.leer(niveles)
+        edad_ms = (time.time() - libro["timestamp"]) * 1000
+        print(f"📊 {symbol} seq={libro['seq']} last_u={libro['last_u']} ({edad_ms:.1f} ms)"
+              f"{'' if libro['initialized'] else ' ⏳ no inicializado'}")
+        for (pb, qb), (pa, qa) in zip(zip(*libro["bids"]), zip(*libro["asks"])):
+            print(f"   {qb:>14.4f} @ {pb:<14.8g} | {pa:>14.8g} @ {qa:<14.4f}")
+        time.sleep(1)
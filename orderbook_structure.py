@@ -0,0 +1,300 @@
+import sys
+from bisect import bisect_left, bisect_right, insort
+from decimal import Decimal
+
+# Formas en que Binance envía una cantidad cero ("0", "0.000", "0.00000000"...):
+# comparar el string evita convertir a float los niveles que se borran
+CEROS = frozenset(["0", "0."] + ["0." + "0" * n for n in range(1, 19)])
+
+# A partir de cuántas inserciones o borrados en un mismo update conviene reordenar la
+# lista de ticks de una vez en lugar de hacer bisect nivel por nivel
+MIN_LOTE_REORDENAR = 16
+
+# Niveles que se miden para estimar la memoria de un lado (el resto se extrapola)
+MUESTRA_MEMORIA = 32
+
+
+# ===== CONVERSIÓN DE PRECIOS A TICKS =====
+def escala_desde_tick_size(tick_size):
+    """Devuelve cuántos ticks hay por unidad de precio (1 / tickSize), o None si no se conoce"""
+    if not tick_size:
+        return None
+    tick = Decimal(str(tick_size))
+    if tick <= 0:
+        return None
+    return float(Decimal(1) / tick)
+
+
+def escala_desde_precio(precio):
+    """Infiere la escala a partir de los decimales del string de precio (ej: '50000.10' -> 100)"""
+    _, _, decimales = str(precio).partition('.')
+    return float(10 ** len(decimales))
+
+
+# ===== LADO DEL LIBRO =====
+class BookSide:
+    """Un lado del order book (bids o asks) indexado por ticks enteros y ordenado.
+
+    - `ticks` es una lista ordenada de menor a mayor: el mejor bid es el último
+      elemento y el mejor ask el primero, ambos en O(1).
+    - `niveles` mapea tick -> (precio_str, qty_str, qty_float). Se guardan los
+      strings originales de Binance para que la API devuelva exactamente lo mismo.
+    - Actualizar la cantidad de un nivel existente es O(1); insertar o borrar un
+      nivel es una búsqueda binaria O(log n) más el desplazamiento de la lista.
+    """
+
+    __slots__ = ('es_bid', 'escala', 'ticks', 'niveles', '_cache_ticks')
+
+    # Tamaño máximo del cache precio_str -> tick antes de vaciarlo
+    MAX_CACHE_TICKS = 20000
+
+    def __init__(self, es_bid, escala=None):
+        self.es_bid = es_bid
+        self.escala = escala
+        self.ticks = []
+        self.niveles = {}
+        self._cache_ticks = {}
+
+    def __len__(self):
+        return len(self.ticks)
+
+    def to_tick(self, precio):
+        """Convierte un precio (str o float) a tick entero"""
+        tick = self._cache_ticks.get(precio)
+        if tick is not None:
+            return tick
+        if self.escala is None:
+            self.escala = escala_desde_precio(precio)
+        tick = round(float(precio) * self.escala)
+        # Los diffs repiten casi siempre los mismos precios cerca del top: cachear la conversión
+        if len(self._cache_ticks) >= self.MAX_CACHE_TICKS:
+            self._cache_ticks.clear()
+        self._cache_ticks[precio] = tick
+        return tick
+
+    def copy(self):
+        """Copia superficial (lista de ticks y dict de niveles) para leer fuera del lock"""
+        copia = BookSide(self.es_bid, self.escala)
+        copia.ticks = self.ticks.copy()
+        copia.niveles = self.niveles.copy()
+        return copia
+
+    def clear(self):
+        self.ticks.clear()
+        self.niveles.clear()
+
+    def load(self, niveles):
+        """Carga un snapshot REST ([[precio, qty], ...]) reemplazando el contenido actual"""
+        self.clear()
+        for precio, qty in niveles:
+            if qty in CEROS:
+                continue
+            qty_float = float(qty)
+            if qty_float == 0:
+                continue
+            self.niveles[self.to_tick(precio)] = (precio, qty, qty_float)
+        self.ticks = sorted(self.niveles)
+
+    def update(self, precio, qty):
+        """Aplica un nivel de un depth update. Devuelve la cantidad anterior (0.0 si no existía)"""
+        tick = self.to_tick(precio)
+        anterior = self.niveles.get(tick)
+        qty_float = 0.0 if qty in CEROS else float(qty)
+
+        if qty_float == 0:
+            if anterior is None:
+                return 0.0
+            del self.niveles[tick]
+            del self.ticks[bisect_left(self.ticks, tick)]
+            return anterior[2]
+
+        self.niveles[tick] = (precio, qty, qty_float)
+        if anterior is None:
+            insort(self.ticks, tick)
+            return 0.0
+        return anterior[2]
+
+    def apply(self, niveles, cambios=None):
+        """Aplica en bloque los niveles [[precio, qty], ...] de un depth update.
+
+        Equivale a llamar a `update` por cada nivel, pero resuelve todo con variables
+        locales y, si el update trae muchas inserciones o borrados, reordena la lista
+        de ticks una sola vez. Si se pasa `cambios`, se le agrega (tick, qty_anterior,
+        qty_nueva) por cada nivel que cambió, para los agregadores de bloques.
+        """
+        cache = self._cache_ticks
+        libro = self.niveles
+        # Cambios pendientes en `ticks`; un precio que entra y sale en el mismo update se cancela
+        nuevos = set()
+        borrados = set()
+        for precio, qty in niveles:
+            tick = cache.get(precio)
+            if tick is None:
+                tick = self.to_tick(precio)
+            anterior = libro.get(tick)
+            nueva = 0.0 if qty in CEROS else float(qty)
+
+            if nueva == 0:
+                if anterior is None:
+                    continue
+                del libro[tick]
+                if tick in nuevos:
+                    nuevos.discard(tick)
+                else:
+                    borrados.add(tick)
+            else:
+                libro[tick] = (precio, qty, nueva)
+                if anterior is None:
+                    if tick in borrados:
+                        borrados.discard(tick)
+                    else:
+                        nuevos.add(tick)
+            if cambios is not None:
+                cambios.append((tick, 0.0 if anterior is None else anterior[2], nueva))
+
+        ticks = self.ticks
+        if borrados:
+            if len(borrados) < MIN_LOTE_REORDENAR:
+                for tick in borrados:
+                    del ticks[bisect_left(ticks, tick)]
+            else:
+                ticks[:] = [t for t in ticks if t not in borrados]
+        if nuevos:
+            if len(nuevos) < MIN_LOTE_REORDENAR:
+                for tick in nuevos:
+                    insort(ticks, tick)
+            else:
+                # Timsort aprovecha que `ticks` ya está ordenada: O(n + k log k)
+                ticks.extend(nuevos)
+                ticks.sort()
+
+    def podar(self, max_niveles=None, tick_limite=None):
+        """Elimina los niveles lejanos del top: deja como mucho los `max_niveles` mejores y
+        solo los que no pasan de `tick_limite` (el menor bid / el mayor ask que se conserva).
+
+        Devuelve los niveles eliminados como [(tick, precio_str, qty_float)]. Los ticks
+        lejanos están en un extremo de la lista, así que es un bisect y un corte.
+        """
+        ticks = self.ticks
+        if self.es_bid:
+            corte = len(ticks) - max_niveles if max_niveles is not None else 0
+            if tick_limite is not None:
+                corte = max(corte, bisect_left(ticks, tick_limite))
+            if corte <= 0:
+                return []
+            eliminados = ticks[:corte]
+            del ticks[:corte]
+        else:
+            corte = min(max_niveles, len(ticks)) if max_niveles is not None else len(ticks)
+            if tick_limite is not None:
+                corte = min(corte, bisect_right(ticks, tick_limite))
+            if corte >= len(ticks):
+                return []
+            eliminados = ticks[corte:]
+            del ticks[corte:]
+        niveles = self.niveles
+        podados = []
+        for tick in eliminados:
+            precio, _, qty = niveles.pop(tick)
+            podados.append((tick, precio, qty))
+        return podados
+
+    def memoria(self):
+        """Bytes aproximados del lado: contenedores medidos y niveles extrapolados de una muestra"""
+        ticks = self.ticks
+        total = sys.getsizeof(ticks) + sys.getsizeof(self.niveles) + sys.getsizeof(self._cache_ticks)
+        n = len(ticks)
+        if n:
+            medidos = 0
+            bytes_niveles = 0
+            for tick in ticks[::max(1, n // MUESTRA_MEMORIA)]:
+                nivel = self.niveles.get(tick)  # Se lee sin lock: el nivel pudo borrarse
+                if nivel is None:
+                    continue
+                medidos += 1
+                bytes_niveles += (sys.getsizeof(tick) + sys.getsizeof(nivel) + sys.getsizeof(nivel[0])
+                                  + sys.getsizeof(nivel[1]) + sys.getsizeof(nivel[2]))
+            if medidos:
+                por_nivel = bytes_niveles / medidos
+                total += por_nivel * n
+                # Cada entrada del cache precio_str -> tick es otro string de precio y otro int
+                total += por_nivel / 2 * len(self._cache_ticks)
+        return int(total)
+
+    # ----- Consultas -----
+    def best_tick(self):
+        """Tick del mejor precio (mayor bid / menor ask) o None si el lado está vacío"""
+        if not self.ticks:
+            return None
+        return self.ticks[-1] if self.es_bid else self.ticks[0]
+
+    def best(self):
+        """Mejor nivel como (precio_str, qty_str) o None"""
+        tick = self.best_tick()
+        if tick is None:
+            return None
+        precio, qty, _ = self.niveles[tick]
+        return precio, qty
+
+    def _ticks_en_orden(self, ticks):
+        return ticks[::-1] if self.es_bid else ticks
+
+    def top_ticks(self, n):
+        """Los n mejores ticks, del mejor al peor"""
+        if n <= 0:
+            return []
+        if self.es_bid:
+            return self.ticks[:-n - 1:-1]
+        return self.ticks[:n]
+
+    def range_ticks(self, tick_min, tick_max):
+        """Ticks dentro de [tick_min, tick_max], del mejor al peor"""
+        i = bisect_left(self.ticks, tick_min)
+        j = bisect_right(self.ticks, tick_max)
+        return self._ticks_en_orden(self.ticks[i:j])
+
+    def top(self, n):
+        """Los n mejores niveles como lista de (precio_str, qty_str)"""
+        niveles = self.niveles
+        return [niveles[t][:2] for t in self.top_ticks(n)]
+
+    def range(self, precio_min, precio_max):
+        """Niveles con precio en [precio_min, precio_max] como lista de (precio_str, qty_str)"""
+        niveles = self.niveles
+        ticks = self.range_ticks(self.to_tick(precio_min), self.to_tick(precio_max))
+        return [niveles[t][:2] for t in ticks]
+
+    def _seleccion(self, n, tick_min, tick_max):
+        ticks = self.ticks
+        i = 0 if tick_min is None else bisect_left(ticks, tick_min)
+        j = len(ticks) if tick_max is None else bisect_right(ticks, tick_max)
+        if n is not None:
+            if self.es_bid:
+                i = max(i, j - n)
+            else:
+                j = min(j, i + n)
+        return self._ticks_en_orden(ticks[i:j])
+
+    def levels(self, n=None, tick_min=None, tick_max=None):
+        """Niveles (precio_str, qty_str) del mejor al peor, limitados a los n mejores y/o a
+        [tick_min, tick_max]. Sale directamente del índice ordenado: O(log n + k)."""
+        niveles = self.niveles
+        return [niveles[t][:2] for t in self._seleccion(n, tick_min, tick_max)]
+
+    def level_arrays(self, n=None, tick_min=None, tick_max=None):
+        """Igual que levels() pero como columnas (precios, qtys) de floats para el formato binario"""
+        seleccion = self._seleccion(n, tick_min, tick_max)
+        escala = self.escala or 1.0
+        niveles = self.niveles
+        return [t / escala for t in seleccion], [niveles[t][2] for t in seleccion]
+
+    def items(self):
+        """Todos los niveles como (precio_str, qty_str), del mejor al peor"""
+        niveles = self.niveles
+        for tick in self._ticks_en_orden(self.ticks):
+            precio, qty, _ = niveles[tick]
+            yield precio, qty
+
+    def as_dict(self):
+        """Diccionario precio -> qty ordenado del mejor al peor (formato de la API)"""
+        return dict(self.items())
@@ -0,0 +1,85 @@
+"""Formato binario columnar para order books.
+
+Layout (todo little-endian):
+    b"OBK1" | uint32 largo_header | header JSON (utf-8) | relleno hasta múltiplo de 8
+    | bid_price f8[n_bids] | bid_qty f8[n_bids] | ask_price f8[n_asks] | ask_qty f8[n_asks]
+
+Los arrays están alineados a 8 bytes, así que un cliente puede cargarlos con
+`numpy.frombuffer(..., dtype='<f8')` sin parsear elemento por elemento.
+"""
+import json
+import struct
+import sys
+from array import array
+
+MEDIA_TYPE_BINARIO = "application/x-orderbook-f64"
+MAGIC = b"OBK1"
+COLUMNAS = ("bid_price", "bid_qty", "ask_price", "ask_qty")
+
+
+def _bytes_f64(valores):
+    columna = array('d', valores)
+    if sys.byteorder == 'big':
+        columna.byteswap()
+    return columna.tobytes()
+
+
+def codificar_binario(meta, bids, asks):
+    """Codifica un libro. `bids`/`asks` son tuplas (precios, qtys) de floats, del mejor al peor"""
+    header = dict(meta)
+    header.update({"n_bids": len(bids[0]), "n_asks": len(asks[0]), "dtype": "<f8", "columns": list(COLUMNAS)})
+    header_bytes = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    relleno = (-(8 + len(header_bytes))) % 8
+    return b"".join((
+        MAGIC,
+        struct.pack("<I", len(header_bytes) + relleno),
+        header_bytes,
+        b" " * relleno,
+        _bytes_f64(bids[0]), _bytes_f64(bids[1]),
+        _bytes_f64(asks[0]), _bytes_f64(asks[1]),
+    ))
+
+
+def decodificar_binario(buffer, usar_numpy=True):
+    """Decodifica un libro binario. Devuelve (header, columnas) con arrays de NumPy si está disponible"""
+    buffer = memoryview(buffer)
+    if bytes(buffer[:4]) != MAGIC:
+        raise ValueError("No es un order book binario (magic incorrecto)")
+    (largo_header,) = struct.unpack_from("<I", buffer, 4)
+    header = json.loads(bytes(buffer[8:8 + largo_header]))
+    offset = 8 + largo_header
+    tamanos = (header["n_bids"], header["n_bids"], header["n_asks"], header["n_asks"])
+
+    np = None
+    if usar_numpy:
+        try:
+            import numpy as np
+        except ImportError:
+            np = None
+
+    columnas = {}
+    for nombre, n in zip(COLUMNAS, tamanos):
+        if np is not None:
+            columnas[nombre] = np.frombuffer(buffer, dtype="<f8", count=n, offset=offset)
+        else:
+            columna = array('d')
+            columna.frombytes(buffer[offset:offset + 8 * n])
+            if sys.byteorder == 'big':
+                columna.byteswap()
+            columnas[nombre] = columna
+        offset += 8 * n
+    return header, columnas
+
+
+def descargar_orderbook(api_base, symbol, timeout=5, **params):
+    """Cliente: pide /orderbooks/{symbol} en formato binario y lo decodifica"""
+    import requests
+
+    resp = requests.get(
+        f"{api_base}/orderbooks/{symbol}",
+        params=params,
+        headers={"Accept": MEDIA_TYPE_BINARIO},
+        timeout=timeout,
+    )
+    resp.raise_for_status()
+    return decodificar_binario(resp.content)
@@ -0,0 +1,56 @@
+"""Último trade y mejor bid/ask por símbolo desde los streams bookTicker y aggTrade.
+
+Viajan por las mismas conexiones combinadas que el depth (un sufijo más por
+símbolo en ShardedStreamManager). Cada símbolo lo escribe un único hilo, el de su
+shard, y los lectores (API, streaming) no toman locks: el estado de cada stream es
+una tupla que se reemplaza entera, así que nunca se mezcla el bid de un mensaje con
+el ask de otro. Los precios se guardan como llegan (strings) y se convierten recién
+al responder.
+"""
+import time
+
+STREAM_BOOK_TICKER = "bookTicker"
+STREAM_AGG_TRADE = "aggTrade"
+STREAMS_PRECIO = (STREAM_BOOK_TICKER, STREAM_AGG_TRADE)
+
+
+def streams_precio_desde_config(valor):
+    """"bookTicker,aggTrade" -> ("bookTicker", "aggTrade"); ignora nombres desconocidos"""
+    pedidos = {parte.strip().lower() for parte in valor.split(",") if parte.strip()}
+    return tuple(stream for stream in STREAMS_PRECIO if stream.lower() in pedidos)
+
+
+class PrecioSimbolo:
+    """Estado de precio de un símbolo alimentado por bookTicker/aggTrade"""
+
+    __slots__ = ('tope', 'trade', 'version', 'mensajes')
+
+    def __init__(self):
+        self.tope = None   # (u, bid, bid_qty, ask, ask_qty, E, recibido)
+        self.trade = None  # (id agregado, precio, qty, comprador_maker, T, recibido)
+        self.version = 0   # Cambia con cada actualización (para el streaming)
+        self.mensajes = 0
+
+    def aplicar(self, tipo, data):
+        """Aplica un mensaje de bookTicker o aggTrade (`tipo` es el sufijo del stream)"""
+        self.mensajes += 1
+        if tipo == STREAM_BOOK_TICKER:
+            tope = self.tope
+            # Tras mover un símbolo de shard pueden llegar mensajes repetidos o atrasados
+            if tope is not None and data['u'] < tope[0]:
+                return
+            self.tope = (data['u'], data['b'], data['B'], data['a'], data['A'], data['E'], time.time())
+        elif tipo == STREAM_AGG_TRADE:
+            trade = self.trade
+            if trade is not None and data['a'] <= trade[0]:
+                return
+            self.trade = (data['a'], data['p'], data['q'], data['m'], data['T'], time.time())
+        else:
+            return
+        self.version += 1
+
+    def invalidar(self):
+        """Descarta el estado (el shard que lo traía se cayó)"""
+        self.tope = None
+        self.trade = None
+        self.version += 1
@@ -0,0 +1,259 @@
+"""Replay determinista de grabaciones de depth (depth_recorder.py) sin red.
+
+Pasa los registros grabados por la lógica real de `order book.py`: los mensajes de
+depth por on_message_combined (buffer, verificación de U/u/pu y apply) y los
+snapshots por cargar_snapshot + process_buffer cuando el libro espera uno, tal
+como los resolvió el resync en vivo. Los huecos que detecta el replay no piden
+snapshots por REST: el libro queda sin inicializar hasta el siguiente snapshot
+grabado de ese símbolo.
+
+Los snapshots que llegan con el libro ya inicializado (y los de --snapshot-final)
+sirven para verificar el libro con comparar_con_snapshot en cuanto last_u alcanza
+su lastUpdateId.
+
+Velocidad: 1 = tiempo real, N = N veces más rápido, 0 = lo más rápido posible.
+
+Uso:
+    python replay.py DIRECTORIO [--desde T] [--hasta T] [--simbolos BTCUSDT,ETHUSDT]
+                     [--velocidad 0] [--snapshot-final snap.json] [--verbose]
+
+T es un epoch en segundos o una fecha ISO ("2026-10-18T12:00:00", UTC si no tiene zona).
+"""
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+
+from depth_recorder import leer_grabacion
+from script_loader import cargar_order_book
+
+# Estados de comparar_con_snapshot que todavía pueden cambiar al avanzar el replay
+VERIFICACION_PENDIENTE = ("adelantado", "no_inicializado")
+
+
+class Replay:
+    """Reproduce una grabación sobre los libros de `order book.py`"""
+
+    def __init__(self, ob, directorio, desde=None, hasta=None, simbolos=None, velocidad=0.0, verificar=True):
+        self.ob = ob
+        self.directorio = directorio
+        self.desde = desde
+        self.hasta = hasta
+        self.simbolos = simbolos
+        self.velocidad = velocidad
+        self.verificar = verificar
+
+        self.mensajes = 0
+        self.snapshots = 0
+        self.huecos = Counter()
+        self.snapshots_cargados = Counter()
+        self.snapshots_fallidos = Counter()
+        self.pendientes = defaultdict(list)  # symbol -> snapshots esperando a que el libro llegue a su lastUpdateId
+        self.verificaciones = []  # (symbol, resultado de comparar_con_snapshot)
+        self.primer_ts = self.ultimo_ts = None
+        self.duracion = 0.0
+
+    def libro(self, symbol):
+        """Libro del símbolo, creado la primera vez que aparece en la grabación"""
+        ob = self.ob
+        book = ob.order_books.get(symbol)
+        if book is None:
+            ob.coins.append(symbol)
+            book = ob.order_books[symbol] = ob.nuevo_order_book(symbol)
+        return book
+
+    def _hueco(self, symbol):
+        # on_message_combined ya dejó el libro sin inicializar: lo resuelve el próximo snapshot grabado
+        self.huecos[symbol] += 1
+
+    def ejecutar(self):
+        """Reproduce todos los registros del rango. Devuelve estadisticas()"""
+        ob = self.ob
+        on_message = ob.on_message_combined
+        order_books = ob.order_books
+        pendientes = self.pendientes
+        velocidad = self.velocidad
+        # Sin REST ni grabar de nuevo lo que se reproduce
+        resync_anterior, recorder_anterior = ob.resync_externo, ob.recorder
+        ob.resync_externo, ob.recorder = self._hueco, None
+        reloj_inicio = None
+        inicio = time.perf_counter()
+        try:
+            for ts, tipo, symbol, payload in leer_grabacion(self.directorio, self.desde, self.hasta, self.simbolos):
+                if self.primer_ts is None:
+                    self.primer_ts = ts
+                    reloj_inicio = time.monotonic()
+                self.ultimo_ts = ts
+                if velocidad > 0:
+                    espera = (ts - self.primer_ts) / velocidad - (time.monotonic() - reloj_inicio)
+                    if espera > 0:
+                        time.sleep(espera)
+
+                if tipo == "depth":
+                    if symbol not in order_books:
+                        self.libro(symbol)
+                    self.mensajes += 1
+                    on_message(None, payload)
+                    if pendientes.get(symbol):
+                        self._verificar(symbol)
+                elif tipo == "snapshot":
+                    self._snapshot(symbol, json.loads(payload))
+        finally:
+            ob.resync_externo, ob.recorder = resync_anterior, recorder_anterior
+            self.duracion = time.perf_counter() - inicio
+        return self.estadisticas()
+
+    def _snapshot(self, symbol, snap):
+        self.snapshots += 1
+        book = self.libro(symbol)
+        if not book['initialized']:
+            # En vivo este snapshot lo pidió un resync: se carga igual que entonces
+            self.ob.cargar_snapshot(symbol, snap)
+            if self.ob.process_buffer(symbol):
+                self.snapshots_cargados[symbol] += 1
+            else:
+                self.snapshots_fallidos[symbol] += 1
+        elif self.verificar:
+            self.pendientes[symbol].append(snap)
+            self._verificar(symbol)
+
+    def _verificar(self, symbol):
+        pendientes = self.pendientes[symbol]
+        while pendientes:
+            resultado = self.ob.comparar_con_snapshot(symbol, pendientes[0])
+            if resultado["status"] in VERIFICACION_PENDIENTE:
+                return
+            pendientes.pop(0)
+            self.verificaciones.append((symbol, resultado))
+
+    def verificar_final(self, snapshots):
+        """Compara el libro final de cada símbolo con su snapshot ({symbol: snapshot})"""
+        for symbol, snap in snapshots.items():
+            if symbol not in self.ob.order_books:
+                resultado = {"status": "sin_datos", "lastUpdateId": snap['lastUpdateId'], "last_u": None}
+            else:
+                resultado = self.ob.comparar_con_snapshot(symbol, snap)
+            self.verificaciones.append((symbol, resultado))
+
+    def estadisticas(self):
+        ob = self.ob
+        simbolos = {}
+        for symbol in sorted(set(self.huecos) | set(self.snapshots_cargados) | set(self.pendientes)
+                             | {s for s, _ in self.verificaciones} | set(ob.order_books)):
+            book = ob.order_books.get(symbol)
+            simbolos[symbol] = {
+                "initialized": bool(book and book['initialized']),
+                "last_u": book['last_u'] if book else None,
+                "gaps": self.huecos[symbol],
+                "snapshots_loaded": self.snapshots_cargados[symbol],
+                "snapshots_failed": self.snapshots_fallidos[symbol],
+                "buffer_overflows": book['buffer'].desbordes if book else 0,
+                "checks_pending": len(self.pendientes.get(symbol, ())),
+            }
+        estados = Counter(resultado["status"] for _, resultado in self.verificaciones)
+        grabado = (self.ultimo_ts - self.primer_ts) if self.primer_ts is not None else 0.0
+        return {
+            "messages": self.mensajes,
+            "snapshots": self.snapshots,
+            "seconds": round(self.duracion, 3),
+            "recorded_seconds": round(grabado, 3),
+            "messages_per_second": round(self.mensajes / self.duracion) if self.duracion else None,
+            "gaps": sum(self.huecos.values()),
+            "checks": dict(estados),
+            "symbols": simbolos,
+        }
+
+
+def parsear_tiempo(valor):
+    """Epoch en segundos o fecha ISO (UTC si no indica zona)"""
+    if valor is None:
+        return None
+    try:
+        return float(valor)
+    except ValueError:
+        fecha = datetime.fromisoformat(valor)
+        if fecha.tzinfo is None:
+            fecha = fecha.replace(tzinfo=timezone.utc)
+        return fecha.timestamp()
+
+
+def cargar_snapshots_finales(ruta, simbolos):
+    """Un snapshot REST suelto (requiere un solo símbolo) o un JSON {symbol: snapshot}"""
+    with open(ruta, encoding="utf-8") as archivo:
+        contenido = json.load(archivo)
+    if "lastUpdateId" in contenido:
+        if not simbolos or len(simbolos) != 1:
+            raise SystemExit("❌ Un snapshot suelto necesita --simbolos con un único símbolo")
+        return {simbolos[0]: contenido}
+    return {symbol.upper(): snap for symbol, snap in contenido.items()}
+
+
+def imprimir_resultados(resultado, verificaciones):
+    print("=" * 80)
+    print(f"⏪ Replay: {resultado['messages']:,} mensajes y {resultado['snapshots']} snapshots "
+          f"en {resultado['seconds']:.2f}s ({resultado['recorded_seconds']:.1f}s grabados)")
+    if resultado['messages_per_second']:
+        print(f"⚡ {resultado['messages_per_second']:,} mensajes/s")
+    print("=" * 80)
+    for symbol, datos in resultado['symbols'].items():
+        estado = "✅" if datos['initialized'] else "⏳"
+        print(f"{estado} {symbol:<14} last_u={datos['last_u']} | huecos: {datos['gaps']} | "
+              f"snapshots cargados: {datos['snapshots_loaded']} (fallidos: {datos['snapshots_failed']}) | "
+              f"desbordes: {datos['buffer_overflows']}")
+    if verificaciones:
+        print("-" * 80)
+        for symbol, verificacion in verificaciones:
+            icono = {"ok": "✅", "divergente": "❌"}.get(verificacion['status'], "⚠️")
+            detalle = ""
+            if "compared" in verificacion:
+                detalle = (f" | {verificacion['compared']} niveles comparados, "
+                           f"{verificacion['excluded']} excluidos, {verificacion['mismatches']} distintos")
+            print(f"{icono} {symbol} vs snapshot {verificacion['lastUpdateId']}: {verificacion['status']}{detalle}")
+            for diferencia in verificacion.get("examples", [])[:5]:
+                print(f"     {diferencia['side']} {diferencia['price']}: libro {diferencia['book']} "
+                      f"/ snapshot {diferencia['snapshot']}")
+    print("=" * 80)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('directorio', help='directorio de la grabación (ORDERBOOK_GRABACION_DIR)')
+    parser.add_argument('--desde', help='inicio del rango (epoch o ISO)')
+    parser.add_argument('--hasta', help='fin del rango (epoch o ISO)')
+    parser.add_argument('--simbolos', help='símbolos separados por coma (por defecto, todos)')
+    parser.add_argument('--velocidad', type=float, default=0.0,
+                        help='1 = tiempo real, N = N veces más rápido, 0 = sin esperas')
+    parser.add_argument('--snapshot-final', help='snapshot REST (o {symbol: snapshot}) para verificar el libro final')
+    parser.add_argument('--sin-verificar', action='store_true',
+                        help='no comparar el libro con los snapshots grabados intermedios')
+    parser.add_argument('--json', action='store_true', help='imprimir el resultado como JSON')
+    parser.add_argument('--verbose', action='store_true', help='mostrar los mensajes de order book.py')
+    args = parser.parse_args()
+
+    simbolos = [s.strip().upper() for s in args.simbolos.split(",") if s.strip()] if args.simbolos else None
+    finales = cargar_snapshots_finales(args.snapshot_final, simbolos) if args.snapshot_final else {}
+
+    ob = cargar_order_book()
+    replay = Replay(ob, args.directorio, parsear_tiempo(args.desde), parsear_tiempo(args.hasta), simbolos,
+                    args.velocidad, verificar=not args.sin_verificar)
+    with open(os.devnull, "w", encoding="utf-8") as nulo:
+        with contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(nulo):
+            replay.ejecutar()
+            replay.verificar_final(finales)
+    resultado = replay.estadisticas()
+
+    if args.json:
+        resultado["verifications"] = [{"symbol": s, **v} for s, v in replay.verificaciones]
+        print(json.dumps(resultado, indent=2))
+    else:
+        imprimir_resultados(resultado, replay.verificaciones)
+    if any(v['status'] == "divergente" for _, v in replay.verificaciones):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+import threading
+import zlib
+from collections import OrderedDict
+
+
+class ResponseCache:
+    """Cache compartido de respuestas ya serializadas, versionado por last_u.
+
+    Cada entrada es (símbolo, variante) -> (versión, bytes). Una entrada solo sirve
+    si su versión coincide con el last_u actual del libro; las entradas de un símbolo
+    se descartan cuando su libro cambia (`invalidar`) y, si se supera `max_bytes`, se
+    expulsan las menos usadas (LRU).
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entradas = OrderedDict()  # (symbol, variante) -> (version, body)
+        self.por_simbolo = {}  # symbol -> set de claves en cache
+        self.bytes_usados = 0
+        self.hits = 0
+        self.misses = 0
+        self.expulsiones = 0
+
+    @staticmethod
+    def etag(symbol, variante, version):
+        """ETag fuerte derivado de la versión del libro y de la variante pedida"""
+        return f'"{symbol}-{version}-{zlib.crc32(variante.encode()):08x}"'
+
+    def get(self, symbol, variante, version):
+        """Bytes cacheados para esta versión o None"""
+        clave = (symbol, variante)
+        with self.lock:
+            entrada = self.entradas.get(clave)
+            if entrada is None or entrada[0] != version:
+                self.misses += 1
+                if entrada is not None:
+                    self._eliminar(clave)
+                return None
+            self.entradas.move_to_end(clave)
+            self.hits += 1
+            return entrada[1]
+
+    def put(self, symbol, variante, version, body):
+        clave = (symbol, variante)
+        if len(body) > self.max_bytes:
+            return
+        with self.lock:
+            if clave in self.entradas:
+                self._eliminar(clave)
+            self.entradas[clave] = (version, body)
+            self.por_simbolo.setdefault(symbol, set()).add(clave)
+            self.bytes_usados += len(body)
+            # Respetar el presupuesto de memoria expulsando lo menos usado
+            while self.bytes_usados > self.max_bytes and self.entradas:
+                self._eliminar(next(iter(self.entradas)))
+                self.expulsiones += 1
+
+    def invalidar(self, symbol):
+        """Descarta todas las respuestas cacheadas de un símbolo (su libro cambió)"""
+        # Chequeo sin lock: el caso común (nada cacheado) no paga el lock en el hot path
+        if not self.por_simbolo.get(symbol):
+            return
+        with self.lock:
+            for clave in list(self.por_simbolo.get(symbol, ())):
+                self._eliminar(clave)
+
+    def _eliminar(self, clave):
+        version, body = self.entradas.pop(clave)
+        self.bytes_usados -= len(body)
+        claves = self.por_simbolo.get(clave[0])
+        if claves is not None:
+            claves.discard(clave)
+
+    def estadisticas(self):
+        with self.lock:
+            return {
+                "entries": len(self.entradas),
+                "bytes": self.bytes_usados,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.expulsiones,
+            }
@@ -0,0 +1,26 @@
+"""Carga de los scripts del repo como módulos.
+
+`order book.py` y `Auto Runner.py` tienen espacios en el nombre, así que no se
+pueden importar con `import`. replay.py, los benchmarks y los tests los cargan
+desde acá para que todos usen el mismo módulo (y el mismo estado global).
+"""
+import importlib.util
+import os
+import sys
+
+RAIZ = os.path.dirname(os.path.abspath(__file__))
+
+
+def cargar_script(nombre_archivo, nombre_modulo):
+    """Importa uno de los scripts del repo sin ejecutar su __main__ (una sola vez por proceso)"""
+    if nombre_modulo in sys.modules:
+        return sys.modules[nombre_modulo]
+    spec = importlib.util.spec_from_file_location(nombre_modulo, os.path.join(RAIZ, nombre_archivo))
+    modulo = importlib.util.module_from_spec(spec)
+    sys.modules[nombre_modulo] = modulo
+    spec.loader.exec_module(modulo)
+    return modulo
+
+
+def cargar_order_book():
+    return cargar_script('order book.py', 'order_book')
@@ -0,0 +1,596 @@
+"""Simulador local de Binance Futures y Bybit para pruebas de carga y latencia sin producción.
+
+Un solo proceso (FastAPI + uvicorn) sirve:
+  Binance  GET  /fapi/v1/exchangeInfo, /fapi/v1/depth, /fapi/v1/ticker/price
+           WS   /stream?streams=<symbol>@depth@100ms/<symbol>@bookTicker/<symbol>@aggTrade/...
+                (también SUBSCRIBE/UNSUBSCRIBE)
+  Bybit    GET  /v5/market/instruments-info, /v5/market/tickers, /v5/position/list
+           POST /v5/order/create, /v5/position/trading-stop
+  Control  GET  /sim/estado   POST /sim/config, /sim/hueco, /sim/desconectar
+
+Cada símbolo tiene un libro propio con un precio que se mueve al azar. Cada
+`1/tasa` segundos se genera un depth update por símbolo con U/u/pu encadenados,
+se aplica al libro (así /fapi/v1/depth devuelve un snapshot coherente con el
+stream) y se envía a las conexiones suscritas, junto con el bookTicker si cambió el
+mejor nivel y, con probabilidad `prob_trade`, un aggTrade. Las órdenes de mercado de Bybit se
+llenan al mejor precio del libro y los stop loss se ejecutan cuando el precio los cruza.
+
+Fallas inyectables (por CLI o en caliente con POST /sim/config):
+  prob_hueco         probabilidad de no enviar un evento (hueco de secuencia)
+  prob_desconexion   probabilidad por segundo de cortar cada conexión WebSocket
+  latencia_rest_ms   demora de las respuestas REST (+ jitter_ms al azar)
+  latencia_ws_ms     demora de los mensajes del stream (+ jitter_ms al azar)
+  peso_maximo        peso REST por minuto antes de responder 429 (X-MBX-USED-WEIGHT-1M)
+
+Uso:
+    python simulator.py [--simbolos 500] [--tasa 10] [--puerto 9000] [--prob-hueco 0.0001] ...
+
+Para apuntar los scripts al simulador:
+    BINANCE_REST_URL=http://127.0.0.1:9000 BINANCE_WS_URL=ws://127.0.0.1:9000 python "order book.py"
+    BINANCE_REST_URL=http://127.0.0.1:9000 BYBIT_REST_URL=http://127.0.0.1:9000 python "Auto Runner.py"
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from collections import deque
+from contextlib import asynccontextmanager
+from decimal import Decimal
+
+import uvicorn
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse
+
+from snapshot_scheduler import normalizar_limite, peso_depth
+
+# Símbolos con nombre real (precio inicial, tick size); el resto se genera como SIM<n>USDT
+SIMBOLOS_CONOCIDOS = (
+    ("BTCUSDT", 50000.0, "0.1"), ("ETHUSDT", 3000.0, "0.01"), ("SOLUSDT", 150.0, "0.01"),
+    ("BNBUSDT", 600.0, "0.01"), ("XRPUSDT", 0.6, "0.0001"), ("DOGEUSDT", 0.15, "0.00001"),
+    ("ADAUSDT", 0.45, "0.0001"), ("AVAXUSDT", 35.0, "0.001"), ("LINKUSDT", 15.0, "0.001"),
+    ("LTCUSDT", 80.0, "0.01"),
+)
+PASO_CANTIDAD = "0.001"
+VENTANA_PESO = 60.0
+# Tipos de stream servidos ("btcusdt@depth@100ms", "btcusdt@bookTicker", "btcusdt@aggTrade")
+TIPOS_STREAM = ("depth", "bookTicker", "aggTrade")
+
+
+class MercadoSimulado:
+    """Libro de un símbolo con precio en paseo aleatorio y depth updates encadenados"""
+
+    def __init__(self, symbol, mid, tick_size, niveles=1000, seed=None):
+        self.symbol = symbol
+        self.tick_size = tick_size
+        self.decimales = max(0, -Decimal(tick_size).as_tuple().exponent)
+        self.paso = float(tick_size)
+        self.random = random.Random(seed)
+        self.mid_tick = round(mid / self.paso)
+        self.niveles = niveles
+        self.bids = {self.mid_tick - i: self.qty() for i in range(1, niveles + 1)}
+        self.asks = {self.mid_tick + i: self.qty() for i in range(1, niveles + 1)}
+        self.bid_tick, self.ask_tick = self.mid_tick - 1, self.mid_tick + 1
+        self.ultimo_tick = self.mid_tick
+        self.u = self.random.randint(10 ** 9, 2 * 10 ** 9)
+        self.trade_id = self.random.randint(10 ** 8, 2 * 10 ** 8)
+
+    def precio(self, tick):
+        return f"{tick * self.paso:.{self.decimales}f}"
+
+    def qty(self):
+        return f"{self.random.uniform(0.001, 50):.3f}"
+
+    def mejor_bid(self):
+        return self.bid_tick
+
+    def mejor_ask(self):
+        return self.ask_tick
+
+    def ultimo_precio(self):
+        return self.precio(self.ultimo_tick)
+
+    def _actualizar_mejores(self, cambios_bids, cambios_asks):
+        """Mejor bid/ask incremental: solo se recorre el lado si se borró su mejor nivel"""
+        bid_tick = max([self.bid_tick] + [t for t, q in cambios_bids.items() if q != "0"])
+        if bid_tick not in self.bids:
+            bid_tick = max(self.bids) if self.bids else self.mid_tick - 1
+        ask_tick = min([self.ask_tick] + [t for t, q in cambios_asks.items() if q != "0"])
+        if ask_tick not in self.asks:
+            ask_tick = min(self.asks) if self.asks else self.mid_tick + 1
+        self.bid_tick, self.ask_tick = bid_tick, ask_tick
+
+    def evento(self, max_niveles=10, prob_movimiento=0.3):
+        """Siguiente depth update (payload 'data' del stream combinado), ya aplicado al libro"""
+        rnd = self.random
+        cambios_bids, cambios_asks = {}, {}
+
+        # El precio se mueve: los niveles que quedan del lado equivocado desaparecen
+        if rnd.random() < prob_movimiento:
+            anterior = self.mid_tick
+            self.mid_tick += rnd.choice((-2, -1, 1, 2))
+            for tick in range(min(anterior, self.mid_tick) - 2, max(anterior, self.mid_tick) + 3):
+                if tick >= self.mid_tick and tick in self.bids:
+                    cambios_bids[tick] = "0"
+                if tick <= self.mid_tick and tick in self.asks:
+                    cambios_asks[tick] = "0"
+
+        for _ in range(rnd.randint(1, max_niveles)):
+            distancia = int(rnd.expovariate(1 / 20)) + 1
+            qty = "0" if rnd.random() < 0.25 else self.qty()
+            if rnd.random() < 0.5:
+                cambios_bids[self.mid_tick - distancia] = qty
+            else:
+                cambios_asks[self.mid_tick + distancia] = qty
+
+        for libro, cambios in ((self.bids, cambios_bids), (self.asks, cambios_asks)):
+            for tick, qty in cambios.items():
+                if qty == "0":
+                    libro.pop(tick, None)
+                else:
+                    libro[tick] = qty
+        self._actualizar_mejores(cambios_bids, cambios_asks)
+
+        pu = self.u
+        self.u += rnd.randint(1, 20)
+        ahora = int(time.time() * 1000)
+        return {
+            "e": "depthUpdate", "E": ahora, "T": ahora, "s": self.symbol,
+            "U": pu + 1, "u": self.u, "pu": pu,
+            "b": [[self.precio(t), q] for t, q in cambios_bids.items()],
+            "a": [[self.precio(t), q] for t, q in cambios_asks.items()],
+        }
+
+    def book_ticker(self):
+        """Payload de <symbol>@bookTicker con el mejor nivel actual"""
+        ahora = int(time.time() * 1000)
+        return {
+            "e": "bookTicker", "u": self.u, "E": ahora, "T": ahora, "s": self.symbol,
+            "b": self.precio(self.bid_tick), "B": self.bids.get(self.bid_tick, "0"),
+            "a": self.precio(self.ask_tick), "A": self.asks.get(self.ask_tick, "0"),
+        }
+
+    def trade(self):
+        """Payload de <symbol>@aggTrade: un trade agresor contra el mejor bid o ask"""
+        vendedor_agresor = self.random.random() < 0.5
+        self.ultimo_tick = self.bid_tick if vendedor_agresor else self.ask_tick
+        self.trade_id += 1
+        ahora = int(time.time() * 1000)
+        return {
+            "e": "aggTrade", "E": ahora, "a": self.trade_id, "s": self.symbol,
+            "p": self.precio(self.ultimo_tick), "q": f"{self.random.uniform(0.001, 2):.3f}",
+            "f": self.trade_id, "l": self.trade_id, "T": ahora, "m": vendedor_agresor,
+        }
+
+    def snapshot(self, limit):
+        """Respuesta de /fapi/v1/depth: el lastUpdateId es el u del último evento aplicado"""
+        ahora = int(time.time() * 1000)
+        bids = sorted(self.bids, reverse=True)[:limit]
+        asks = sorted(self.asks)[:limit]
+        return {
+            "lastUpdateId": self.u, "E": ahora, "T": ahora,
+            "bids": [[self.precio(t), self.bids[t]] for t in bids],
+            "asks": [[self.precio(t), self.asks[t]] for t in asks],
+        }
+
+
+class ConexionSimulada:
+    """Una conexión /stream con su cola de salida (mantiene el orden aunque haya latencia)"""
+
+    def __init__(self, ws):
+        self.ws = ws
+        self.streams = set()  # (tipo, symbol)
+        self.cola = asyncio.Queue()
+
+    def encolar(self, envio, mensaje):
+        self.cola.put_nowait((envio, mensaje))
+
+    async def enviar(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            envio, mensaje = await self.cola.get()
+            if mensaje is None:
+                await self.ws.close(code=1011)
+                return
+            espera = envio - loop.time()
+            if espera > 0:
+                await asyncio.sleep(espera)
+            await self.ws.send_text(mensaje)
+
+
+class Simulador:
+    """Estado del simulador: mercados, conexiones, fallas configuradas y cuentas de Bybit"""
+
+    def __init__(self, simbolos=500, tasa=10.0, niveles=1000, niveles_evento=10, prob_trade=0.5,
+                 prob_hueco=0.0, prob_desconexion=0.0, latencia_rest_ms=0.0, latencia_ws_ms=0.0,
+                 jitter_ms=0.0, peso_maximo=2400, seed=1):
+        self.config = {
+            "tasa": tasa,
+            "niveles_evento": niveles_evento,
+            "prob_trade": prob_trade,
+            "prob_hueco": prob_hueco,
+            "prob_desconexion": prob_desconexion,
+            "latencia_rest_ms": latencia_rest_ms,
+            "latencia_ws_ms": latencia_ws_ms,
+            "jitter_ms": jitter_ms,
+            "peso_maximo": peso_maximo,
+        }
+        self.random = random.Random(seed)
+        self.mercados = {}
+        for i in range(simbolos):
+            if i < len(SIMBOLOS_CONOCIDOS):
+                symbol, mid, tick_size = SIMBOLOS_CONOCIDOS[i]
+            else:
+                symbol = f"SIM{i}USDT"
+                mid = round(self.random.uniform(1, 500), 2)
+                tick_size = "0.01"
+            self.mercados[symbol] = MercadoSimulado(symbol, mid, tick_size, niveles, seed=seed + i)
+
+        self.conexiones = set()
+        self.suscriptores = {tipo: {symbol: set() for symbol in self.mercados} for tipo in TIPOS_STREAM}
+        self.huecos_forzados = set()
+        self.pesos = deque()  # (instante, peso) del último minuto
+        self.posiciones = {}  # symbol -> {"side", "size", "avgPrice", "stopLoss"}
+        self.estadisticas = {
+            "eventos": 0, "enviados": 0, "huecos": 0, "desconexiones": 0, "snapshots": 0,
+            "rechazos_429": 0, "ordenes": 0, "stops_ejecutados": 0,
+        }
+
+    # ----- Fallas -----
+    def demora(self, clave):
+        base = self.config[clave] + self.random.uniform(0, self.config["jitter_ms"])
+        return base / 1000
+
+    def usar_peso(self, peso):
+        """Registra el peso de un request. Devuelve (permitido, peso usado en el último minuto)"""
+        ahora = time.monotonic()
+        while self.pesos and ahora - self.pesos[0][0] > VENTANA_PESO:
+            self.pesos.popleft()
+        usado = sum(p for _, p in self.pesos)
+        if usado + peso > self.config["peso_maximo"]:
+            return False, usado
+        self.pesos.append((ahora, peso))
+        return True, usado + peso
+
+    # ----- Stream -----
+    def _streams_validos(self, streams):
+        for stream in streams:
+            partes = stream.split("@")
+            symbol, tipo = partes[0].upper(), partes[1] if len(partes) > 1 else ""
+            if symbol in self.mercados and tipo in TIPOS_STREAM:
+                yield tipo, symbol
+
+    def suscribir(self, conexion, streams):
+        for tipo, symbol in self._streams_validos(streams):
+            conexion.streams.add((tipo, symbol))
+            self.suscriptores[tipo][symbol].add(conexion)
+
+    def desuscribir(self, conexion, streams=None):
+        pares = list(conexion.streams) if streams is None else list(self._streams_validos(streams))
+        for tipo, symbol in pares:
+            conexion.streams.discard((tipo, symbol))
+            self.suscriptores[tipo][symbol].discard(conexion)
+
+    def publicar(self, conexiones, stream, data, envio):
+        mensaje = json.dumps({"stream": stream, "data": data}, separators=(",", ":"))
+        for conexion in conexiones:
+            conexion.encolar(envio, mensaje)
+        self.estadisticas["enviados"] += len(conexiones)
+
+    def desconectar(self, conexion):
+        self.estadisticas["desconexiones"] += 1
+        self.desuscribir(conexion)
+        self.conexiones.discard(conexion)
+        conexion.encolar(0, None)
+
+    async def generar(self):
+        """Un depth update por símbolo cada 1/tasa segundos, enviado a sus suscriptores, más el
+        bookTicker si cambió el mejor nivel y a veces un aggTrade"""
+        loop = asyncio.get_running_loop()
+        siguiente = loop.time()
+        depth, book_ticker, agg_trade = (self.suscriptores[tipo] for tipo in TIPOS_STREAM)
+        while True:
+            config = self.config
+            intervalo = 1 / config["tasa"]
+            for symbol, mercado in self.mercados.items():
+                tope = (mercado.bid_tick, mercado.bids.get(mercado.bid_tick),
+                        mercado.ask_tick, mercado.asks.get(mercado.ask_tick))
+                data = mercado.evento(config["niveles_evento"])
+                self.estadisticas["eventos"] += 1
+                hay_trade = self.random.random() < config["prob_trade"]
+                trade = mercado.trade() if hay_trade else None
+                self.ejecutar_stops(symbol, mercado)
+
+                envio = loop.time() + self.demora("latencia_ws_ms")
+                nombre = symbol.lower()
+                if depth[symbol]:
+                    if symbol in self.huecos_forzados or self.random.random() < config["prob_hueco"]:
+                        self.huecos_forzados.discard(symbol)
+                        self.estadisticas["huecos"] += 1
+                    else:
+                        self.publicar(depth[symbol], f"{nombre}@depth@100ms", data, envio)
+                if book_ticker[symbol] and tope != (mercado.bid_tick, mercado.bids.get(mercado.bid_tick),
+                                                    mercado.ask_tick, mercado.asks.get(mercado.ask_tick)):
+                    self.publicar(book_ticker[symbol], f"{nombre}@bookTicker", mercado.book_ticker(), envio)
+                if trade is not None and agg_trade[symbol]:
+                    self.publicar(agg_trade[symbol], f"{nombre}@aggTrade", trade, envio)
+
+            if config["prob_desconexion"]:
+                for conexion in list(self.conexiones):
+                    if self.random.random() < config["prob_desconexion"] * intervalo:
+                        self.desconectar(conexion)
+
+            siguiente += intervalo
+            await asyncio.sleep(max(0.0, siguiente - loop.time()))
+
+    # ----- Bybit -----
+    def ejecutar_stops(self, symbol, mercado):
+        posicion = self.posiciones.get(symbol)
+        if posicion is None or not posicion.get("stopLoss"):
+            return
+        stop = float(posicion["stopLoss"])
+        precio = mercado.mid_tick * mercado.paso
+        if (posicion["side"] == "Buy" and precio <= stop) or (posicion["side"] == "Sell" and precio >= stop):
+            del self.posiciones[symbol]
+            self.estadisticas["stops_ejecutados"] += 1
+
+    def llenar_orden(self, symbol, side, qty):
+        """Orden de mercado al mejor precio del lado contrario; actualiza la posición neta"""
+        mercado = self.mercados[symbol]
+        precio = Decimal(mercado.precio(mercado.mejor_ask() if side == "Buy" else mercado.mejor_bid()))
+        posicion = self.posiciones.get(symbol)
+        if posicion is None:
+            self.posiciones[symbol] = {"side": side, "size": qty, "avgPrice": precio, "stopLoss": ""}
+        elif posicion["side"] == side:
+            total = posicion["size"] + qty
+            posicion["avgPrice"] = (posicion["avgPrice"] * posicion["size"] + precio * qty) / total
+            posicion["size"] = total
+        else:
+            restante = posicion["size"] - qty
+            if restante > 0:
+                posicion["size"] = restante
+            elif restante == 0:
+                del self.posiciones[symbol]
+            else:
+                self.posiciones[symbol] = {"side": side, "size": -restante, "avgPrice": precio, "stopLoss": ""}
+        self.estadisticas["ordenes"] += 1
+
+    def posicion_bybit(self, symbol):
+        posicion = self.posiciones.get(symbol)
+        mercado = self.mercados[symbol]
+        if posicion is None:
+            return {"symbol": symbol, "side": "", "size": "0", "avgPrice": "0", "stopLoss": "",
+                    "positionIdx": 0, "markPrice": mercado.ultimo_precio(), "unrealisedPnl": "0"}
+        precio = Decimal(mercado.ultimo_precio())
+        signo = 1 if posicion["side"] == "Buy" else -1
+        return {
+            "symbol": symbol,
+            "side": posicion["side"],
+            "size": str(posicion["size"]),
+            "avgPrice": str(posicion["avgPrice"].quantize(Decimal(mercado.tick_size))),
+            "stopLoss": posicion["stopLoss"],
+            "positionIdx": 0,
+            "markPrice": str(precio),
+            "unrealisedPnl": str(signo * (precio - posicion["avgPrice"]) * posicion["size"]),
+        }
+
+
+def respuesta_bybit(result=None, ret_code=0, ret_msg="OK"):
+    return {"retCode": ret_code, "retMsg": ret_msg, "result": result if result is not None else {},
+            "retExtInfo": {}, "time": int(time.time() * 1000)}
+
+
+def crear_app(sim):
+    @asynccontextmanager
+    async def ciclo_de_vida(app):
+        generador = asyncio.create_task(sim.generar())
+        yield
+        generador.cancel()
+
+    app = FastAPI(lifespan=ciclo_de_vida)
+
+    # ----- Binance REST -----
+    @app.get("/fapi/v1/exchangeInfo")
+    async def exchange_info():
+        await asyncio.sleep(sim.demora("latencia_rest_ms"))
+        return {
+            "timezone": "UTC",
+            "serverTime": int(time.time() * 1000),
+            "symbols": [
+                {
+                    "symbol": symbol, "status": "TRADING", "contractType": "PERPETUAL",
+                    "quoteAsset": "USDT", "pricePrecision": mercado.decimales,
+                    "filters": [{"filterType": "PRICE_FILTER", "tickSize": mercado.tick_size},
+                                {"filterType": "LOT_SIZE", "stepSize": PASO_CANTIDAD}],
+                }
+                for symbol, mercado in sim.mercados.items()
+            ],
+        }
+
+    @app.get("/fapi/v1/depth")
+    async def depth(symbol: str, limit: int = 500):
+        await asyncio.sleep(sim.demora("latencia_rest_ms"))
+        mercado = sim.mercados.get(symbol.upper())
+        if mercado is None:
+            return JSONResponse({"code": -1121, "msg": "Invalid symbol."}, status_code=400)
+        limit = normalizar_limite(limit)
+        permitido, usado = sim.usar_peso(peso_depth(limit))
+        cabeceras = {"X-MBX-USED-WEIGHT-1M": str(usado)}
+        if not permitido:
+            sim.estadisticas["rechazos_429"] += 1
+            return JSONResponse({"code": -1003, "msg": "Too many requests."}, status_code=429,
+                                headers={**cabeceras, "Retry-After": "1"})
+        sim.estadisticas["snapshots"] += 1
+        return JSONResponse(mercado.snapshot(limit), headers=cabeceras)
+
+    @app.get("/fapi/v1/ticker/price")
+    async def ticker_price(symbol: str = None):
+        await asyncio.sleep(sim.demora("latencia_rest_ms"))
+        ahora = int(time.time() * 1000)
+        if symbol is None:
+            return [{"symbol": s, "price": m.ultimo_precio(), "time": ahora} for s, m in sim.mercados.items()]
+        mercado = sim.mercados.get(symbol.upper())
+        if mercado is None:
+            return JSONResponse({"code": -1121, "msg": "Invalid symbol."}, status_code=400)
+        return {"symbol": mercado.symbol, "price": mercado.ultimo_precio(), "time": ahora}
+
+    # ----- Binance WebSocket -----
+    @app.websocket("/stream")
+    async def stream(websocket: WebSocket, streams: str = ""):
+        await websocket.accept()
+        conexion = ConexionSimulada(websocket)
+        sim.conexiones.add(conexion)
+        sim.suscribir(conexion, [s for s in streams.split("/") if s])
+        emisor = asyncio.create_task(conexion.enviar())
+        try:
+            while True:
+                pedido = json.loads(await websocket.receive_text())
+                metodo = pedido.get("method")
+                if metodo == "SUBSCRIBE":
+                    sim.suscribir(conexion, pedido.get("params", []))
+                elif metodo == "UNSUBSCRIBE":
+                    sim.desuscribir(conexion, pedido.get("params", []))
+                conexion.encolar(0, json.dumps({"result": None, "id": pedido.get("id")}))
+        except (WebSocketDisconnect, RuntimeError, json.JSONDecodeError):
+            pass
+        finally:
+            sim.desuscribir(conexion)
+            sim.conexiones.discard(conexion)
+            emisor.cancel()
+
+    # ----- Bybit -----
+    @app.get("/v5/market/instruments-info")
+    async def instruments_info(category: str = "linear", symbol: str = None):
+        await asyncio.sleep(sim.demora("latencia_rest_ms"))
+        simbolos = [symbol.upper()] if symbol else list(sim.mercados)
+        return respuesta_bybit({"category": category, "list": [
+            {"symbol": s, "status": "Trading", "priceFilter": {"tickSize": sim.mercados[s].tick_size},
+             "lotSizeFilter": {"qtyStep": PASO_CANTIDAD, "minOrderQty": PASO_CANTIDAD}}
+            for s in simbolos if s in sim.mercados
+        ]})
+
+    @app.get("/v5/market/tickers")
+    async def tickers(category: str = "linear", symbol: str = None):
+        await asyncio.sleep(sim.demora("latencia_rest_ms"))
+        simbolos = [symbol.upper()] if symbol else list(sim.mercados)
+        lista = []
+        for s in simbolos:
+            mercado = sim.mercados.get(s)
+            if mercado is not None:
+                lista.append({"symbol": s, "lastPrice": mercado.ultimo_precio(),
+                              "bid1Price": mercado.precio(mercado.mejor_bid()),
+                              "ask1Price": mercado.precio(mercado.mejor_ask())})
+        return respuesta_bybit({"category": category, "list": lista})
+
+    @app.get("/v5/position/list")
+    async def position_list(category: str = "linear", symbol: str = None, settleCoin: str = None):
+        await asyncio.sleep(sim.demora("latencia_rest_ms"))
+        if symbol:
+            if symbol.upper() not in sim.mercados:
+                return respuesta_bybit(ret_code=10001, ret_msg="params error: symbol invalid")
+            lista = [sim.posicion_bybit(symbol.upper())]
+        else:
+            lista = [sim.posicion_bybit(s) for s in list(sim.posiciones)]
+        return respuesta_bybit({"category": category, "list": lista})
+
+    @app.post("/v5/order/create")
+    async def order_create(request: Request):
+        await asyncio.sleep(sim.demora("latencia_rest_ms"))
+        orden = await request.json()
+        symbol = str(orden.get("symbol", "")).upper()
+        if symbol not in sim.mercados or orden.get("side") not in ("Buy", "Sell"):
+            return respuesta_bybit(ret_code=10001, ret_msg="params error")
+        if orden.get("orderType") != "Market":
+            return respuesta_bybit(ret_code=10001, ret_msg="only Market orders are simulated")
+        try:
+            qty = Decimal(str(orden.get("qty")))
+        except ArithmeticError:
+            qty = Decimal(0)
+        if qty <= 0:
+            return respuesta_bybit(ret_code=10001, ret_msg="params error: qty")
+        sim.llenar_orden(symbol, orden["side"], qty)
+        return respuesta_bybit({"orderId": str(uuid.uuid4()), "orderLinkId": orden.get("orderLinkId", "")})
+
+    @app.post("/v5/position/trading-stop")
+    async def trading_stop(request: Request):
+        await asyncio.sleep(sim.demora("latencia_rest_ms"))
+        pedido = await request.json()
+        posicion = sim.posiciones.get(str(pedido.get("symbol", "")).upper())
+        if posicion is None:
+            return respuesta_bybit(ret_code=10001, ret_msg="can not set tp/sl/ts for zero position")
+        if "stopLoss" in pedido:
+            posicion["stopLoss"] = str(pedido["stopLoss"])
+        return respuesta_bybit()
+
+    # ----- Control -----
+    @app.get("/sim/estado")
+    async def estado():
+        return {
+            "config": sim.config,
+            "symbols": len(sim.mercados),
+            "connections": len(sim.conexiones),
+            "subscribed_symbols": sum(1 for s in sim.suscriptores["depth"].values() if s),
+            "positions": {s: sim.posicion_bybit(s) for s in list(sim.posiciones)},
+            "stats": sim.estadisticas,
+        }
+
+    @app.post("/sim/config")
+    async def cambiar_config(request: Request):
+        cambios = await request.json()
+        desconocidas = set(cambios) - set(sim.config)
+        if desconocidas:
+            return JSONResponse({"error": f"claves desconocidas: {sorted(desconocidas)}"}, status_code=400)
+        sim.config.update({clave: float(valor) for clave, valor in cambios.items()})
+        return sim.config
+
+    @app.post("/sim/hueco")
+    async def forzar_hueco(symbol: str = None):
+        """El próximo evento de `symbol` (o de todos) no se envía"""
+        simbolos = [symbol.upper()] if symbol else list(sim.mercados)
+        sim.huecos_forzados.update(s for s in simbolos if s in sim.mercados)
+        return {"gaps": len(simbolos)}
+
+    @app.post("/sim/desconectar")
+    async def forzar_desconexion():
+        conexiones = list(sim.conexiones)
+        for conexion in conexiones:
+            sim.desconectar(conexion)
+        return {"disconnected": len(conexiones)}
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--simbolos', type=int, default=500)
+    parser.add_argument('--tasa', type=float, default=10, help='depth updates por segundo y símbolo')
+    parser.add_argument('--niveles', type=int, default=1000, help='niveles iniciales por lado')
+    parser.add_argument('--niveles-evento', type=int, default=10, help='máximo de niveles por depth update')
+    parser.add_argument('--prob-trade', type=float, default=0.5, help='probabilidad de un aggTrade por update')
+    parser.add_argument('--prob-hueco', type=float, default=0.0)
+    parser.add_argument('--prob-desconexion', type=float, default=0.0, help='por segundo y conexión')
+    parser.add_argument('--latencia-rest-ms', type=float, default=0.0)
+    parser.add_argument('--latencia-ws-ms', type=float, default=0.0)
+    parser.add_argument('--jitter-ms', type=float, default=0.0)
+    parser.add_argument('--peso-maximo', type=int, default=2400)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--host', default="127.0.0.1")
+    parser.add_argument('--puerto', type=int, default=9000)
+    args = parser.parse_args()
+
+    sim = Simulador(args.simbolos, args.tasa, args.niveles, args.niveles_evento, args.prob_trade,
+                    args.prob_hueco, args.prob_desconexion, args.latencia_rest_ms, args.latencia_ws_ms, args.jitter_ms,
+                    args.peso_maximo, args.seed)
+    url = f"{args.host}:{args.puerto}"
+    print("=" * 80)
+    print(f"🧪 Simulador Binance/Bybit: {args.simbolos} símbolos a {args.tasa:g} updates/s")
+    print("=" * 80)
+    print(f"   BINANCE_REST_URL=http://{url} BINANCE_WS_URL=ws://{url} BYBIT_REST_URL=http://{url}")
+    print(f"   Estado: http://{url}/sim/estado")
+    print("=" * 80, flush=True)
+    uvicorn.run(crear_app(sim), host=args.host, port=args.puerto, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
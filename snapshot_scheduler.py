@@ -0,0 +1,303 @@
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import Future
+
+import requests
+from requests.adapters import HTTPAdapter
+
+BINANCE_REST_URL = "https://fapi.binance.com"
+
+# Límites de /fapi/v1/depth aceptados por Binance
+LIMITES_DEPTH = (5, 10, 20, 50, 100, 500, 1000)
+
+# Prioridades de la cola: los símbolos que alguien está leyendo van primero y las
+# verificaciones de consistencia al final
+PRIORIDAD_LECTURA = 0
+PRIORIDAD_NORMAL = 1
+PRIORIDAD_VERIFICACION = 2
+
+
+class PresupuestoAgotado(Exception):
+    """Un pedido de PRIORIDAD_VERIFICACION no entra en su parte del presupuesto de peso"""
+
+
+def peso_depth(limit):
+    """Peso de /fapi/v1/depth según el límite pedido (tabla de Binance Futures)"""
+    if limit <= 50:
+        return 2
+    if limit <= 100:
+        return 5
+    if limit <= 500:
+        return 10
+    return 20
+
+
+def normalizar_limite(limit):
+    """Menor límite válido de Binance que cubre `limit`"""
+    for valido in LIMITES_DEPTH:
+        if limit <= valido:
+            return valido
+    return LIMITES_DEPTH[-1]
+
+
+class SnapshotScheduler:
+    """Planificador central de snapshots REST para el arranque y los resyncs.
+
+    - Un pool fijo de `trabajadores` hilos comparte una `requests.Session` con
+      conexiones keep-alive, en vez de un hilo y una conexión nueva por símbolo.
+    - Lleva la cuenta del peso usado en la ventana de un minuto: estima el peso de
+      cada pedido y lo corrige con el header `X-MBX-USED-WEIGHT-1M` de cada
+      respuesta. Si el próximo pedido superaría `presupuesto` espera a la próxima
+      ventana; un 429/418 bloquea todos los pedidos durante `Retry-After` y el
+      pedido vuelve a la cola.
+    - La cola es un heap por prioridad: los símbolos leídos en los últimos
+      `ventana_lectura` segundos (`marcar_lectura`) se piden antes que el resto.
+    - Los pedidos de PRIORIDAD_VERIFICACION van detrás de todo y no esperan: si
+      no entran en `fraccion_verificacion` del presupuesto (o hay un bloqueo por
+      429) el Future falla con PresupuestoAgotado, así nunca ocupan un trabajador
+      ni el peso que necesita un resync.
+    - Un símbolo pendiente no se encola dos veces: `solicitar` devuelve el mismo
+      Future, que sirve tanto para hilos (`.result()`) como para asyncio
+      (`asyncio.wrap_future`).
+    """
+
+    def __init__(self, url_base=BINANCE_REST_URL, trabajadores=8, peso_maximo=2400, margen=0.8,
+                 limite_por_defecto=1000, timeout=10, ventana_lectura=60, fraccion_verificacion=0.5):
+        self.url_base = url_base.rstrip('/')
+        self.trabajadores = trabajadores
+        self.presupuesto = int(peso_maximo * margen)
+        self.presupuesto_verificacion = int(self.presupuesto * fraccion_verificacion)
+        self.limite_por_defecto = normalizar_limite(limite_por_defecto)
+        self.timeout = timeout
+        self.ventana_lectura = ventana_lectura
+        self.limites = {}  # symbol -> límite de depth propio
+
+        self.session = requests.Session()
+        adaptador = HTTPAdapter(pool_connections=1, pool_maxsize=trabajadores)
+        self.session.mount("https://", adaptador)
+        self.session.mount("http://", adaptador)
+
+        self.cond = threading.Condition()
+        self.cola = []  # heap de (prioridad, secuencia, symbol)
+        self.pendientes = {}  # symbol -> (prioridad, Future)
+        self.ultima_lectura = {}  # symbol -> time.monotonic() de la última lectura por la API
+        self.secuencia = itertools.count()
+        self.hilos = []
+
+        # Presupuesto de peso de la ventana actual (minuto de reloj, como Binance)
+        self.ventana = None
+        self.peso_usado = 0
+        self.peso_en_vuelo = 0
+        self.bloqueado_hasta = 0.0
+
+        self.en_vuelo = 0
+        self.completados = 0
+        self.errores = 0
+        self.rechazos = 0  # respuestas 429/418
+        self.esperas_presupuesto = 0
+        self.verificaciones_omitidas = 0  # Verificaciones que no entraron en el presupuesto
+
+    # ----- Configuración -----
+    def configurar_limite(self, symbol, limit):
+        """Profundidad del snapshot de un símbolo (None vuelve al límite por defecto)"""
+        if limit is None:
+            self.limites.pop(symbol, None)
+        else:
+            self.limites[symbol] = normalizar_limite(limit)
+
+    def limite_de(self, symbol):
+        return self.limites.get(symbol, self.limite_por_defecto)
+
+    # ----- Cola -----
+    def marcar_lectura(self, symbol):
+        """Registra que la API leyó el símbolo; si su snapshot está pendiente, lo adelanta"""
+        self.ultima_lectura[symbol] = time.monotonic()
+        pendiente = self.pendientes.get(symbol)
+        if pendiente is not None and pendiente[0] == PRIORIDAD_NORMAL:
+            with self.cond:
+                pendiente = self.pendientes.get(symbol)
+                if pendiente is not None and pendiente[0] == PRIORIDAD_NORMAL:
+                    self._encolar(symbol, PRIORIDAD_LECTURA, pendiente[1])
+
+    def prioridad_de(self, symbol):
+        ultima = self.ultima_lectura.get(symbol)
+        if ultima is not None and time.monotonic() - ultima <= self.ventana_lectura:
+            return PRIORIDAD_LECTURA
+        return PRIORIDAD_NORMAL
+
+    def solicitar(self, symbol, prioridad=None):
+        """Encola el snapshot de un símbolo. Devuelve un Future con el JSON de Binance.
+
+        Sin `prioridad` se usa la que corresponde por lecturas. Si el símbolo ya estaba
+        pendiente se devuelve el mismo Future, adelantado si ahora se pide con más urgencia
+        (un resync que encuentra una verificación en cola no queda detrás de ella).
+        """
+        with self.cond:
+            self._iniciar_trabajadores()
+            if prioridad is None:
+                prioridad = self.prioridad_de(symbol)
+            pendiente = self.pendientes.get(symbol)
+            if pendiente is not None:
+                if prioridad < pendiente[0]:
+                    self._encolar(symbol, prioridad, pendiente[1])
+                return pendiente[1]
+            futuro = Future()
+            self._encolar(symbol, prioridad, futuro)
+            return futuro
+
+    def obtener(self, symbol):
+        """Versión bloqueante de `solicitar` para los hilos de inicialización"""
+        return self.solicitar(symbol).result()
+
+    def _encolar(self, symbol, prioridad, futuro):
+        # Las entradas viejas del heap quedan y se descartan al sacarlas (prioridad distinta)
+        self.pendientes[symbol] = (prioridad, futuro)
+        heapq.heappush(self.cola, (prioridad, next(self.secuencia), symbol))
+        self.cond.notify()
+
+    def _siguiente(self):
+        """Saca el próximo símbolo de la cola (bloquea hasta que haya uno)"""
+        with self.cond:
+            while True:
+                while self.cola:
+                    prioridad, _, symbol = heapq.heappop(self.cola)
+                    pendiente = self.pendientes.get(symbol)
+                    if pendiente is not None and pendiente[0] == prioridad:
+                        del self.pendientes[symbol]
+                        self.en_vuelo += 1
+                        return symbol, prioridad, pendiente[1]
+                self.cond.wait()
+
+    # ----- Presupuesto de peso -----
+    def _reservar_peso(self, peso, prioridad=PRIORIDAD_NORMAL):
+        """Espera hasta que el pedido entre en el presupuesto del minuto y lo reserva.
+
+        Las verificaciones no esperan: si no entran lanzan PresupuestoAgotado.
+        """
+        verificacion = prioridad == PRIORIDAD_VERIFICACION
+        presupuesto = self.presupuesto_verificacion if verificacion else self.presupuesto
+        with self.cond:
+            while True:
+                ahora = time.time()
+                if ahora < self.bloqueado_hasta:
+                    espera = self.bloqueado_hasta - ahora
+                else:
+                    ventana = int(ahora // 60)
+                    if ventana != self.ventana:
+                        self.ventana = ventana
+                        self.peso_usado = 0
+                    if self.peso_usado + self.peso_en_vuelo + peso <= presupuesto:
+                        self.peso_en_vuelo += peso
+                        return
+                    espera = (ventana + 1) * 60 - ahora
+                    if not verificacion:
+                        self.esperas_presupuesto += 1
+                if verificacion:
+                    self.verificaciones_omitidas += 1
+                    raise PresupuestoAgotado(f"peso usado {self.peso_usado}/{presupuesto}")
+                self.cond.wait(espera)
+
+    def _liberar_peso(self, peso, respuesta=None):
+        with self.cond:
+            self.peso_en_vuelo -= peso
+            usado = respuesta.headers.get("X-MBX-USED-WEIGHT-1M") if respuesta is not None else None
+            if usado is not None:
+                # El header es la fuente de verdad (incluye pedidos de otros procesos con la misma IP)
+                self.ventana = int(time.time() // 60)
+                self.peso_usado = int(usado)
+            elif respuesta is not None:
+                self.peso_usado += peso
+            if respuesta is not None and respuesta.status_code in (418, 429):
+                espera = float(respuesta.headers.get("Retry-After", 60))
+                self.bloqueado_hasta = max(self.bloqueado_hasta, time.time() + espera)
+            self.cond.notify_all()
+
+    # ----- Trabajadores -----
+    def _iniciar_trabajadores(self):
+        if self.hilos:
+            return
+        for i in range(self.trabajadores):
+            hilo = threading.Thread(target=self._trabajar, name=f"snapshot-{i + 1}", daemon=True)
+            hilo.start()
+            self.hilos.append(hilo)
+
+    def _trabajar(self):
+        while True:
+            symbol, prioridad, futuro = self._siguiente()
+            try:
+                if not futuro.set_running_or_notify_cancel():
+                    continue
+                limit = self.limite_de(symbol)
+                peso = peso_depth(limit)
+                self._reservar_peso(peso, prioridad)
+                respuesta = None
+                try:
+                    respuesta = self.session.get(
+                        f"{self.url_base}/fapi/v1/depth",
+                        params={"symbol": symbol, "limit": limit},
+                        timeout=self.timeout,
+                    )
+                finally:
+                    self._liberar_peso(peso, respuesta)
+
+                if respuesta.status_code in (418, 429):
+                    # Rate limit: el pedido vuelve a la cola y se reintenta al terminar el bloqueo
+                    self.rechazos += 1
+                    print(f"⚠️ Rate limit de Binance ({respuesta.status_code}) pidiendo snapshot de {symbol}, "
+                          f"pausando snapshots {respuesta.headers.get('Retry-After', 60)}s", flush=True)
+                    with self.cond:
+                        futuro = self._reencolar(symbol, prioridad, futuro)
+                    continue
+
+                respuesta.raise_for_status()
+                futuro.set_result(respuesta.json())
+                self.completados += 1
+            except PresupuestoAgotado as e:
+                futuro.set_exception(e)
+            except Exception as e:
+                self.errores += 1
+                if not futuro.done():
+                    futuro.set_exception(e)
+            finally:
+                with self.cond:
+                    self.en_vuelo -= 1
+
+    def _reencolar(self, symbol, prioridad, futuro):
+        """Vuelve a encolar un pedido en curso; si mientras tanto se pidió otro, los une"""
+        pendiente = self.pendientes.get(symbol)
+        if pendiente is not None:
+            pendiente[1].add_done_callback(lambda f: _copiar_resultado(f, futuro))
+            return pendiente[1]
+        proximo = Future()
+        proximo.add_done_callback(lambda f: _copiar_resultado(f, futuro))
+        if prioridad != PRIORIDAD_VERIFICACION:
+            prioridad = self.prioridad_de(symbol)
+        self._encolar(symbol, prioridad, proximo)
+        return proximo
+
+    def estadisticas(self):
+        with self.cond:
+            return {
+                "pending": len(self.pendientes),
+                "in_flight": self.en_vuelo,
+                "workers": self.trabajadores,
+                "weight_used_1m": self.peso_usado,
+                "weight_budget_1m": self.presupuesto,
+                "completed": self.completados,
+                "errors": self.errores,
+                "rate_limited": self.rechazos,
+                "budget_waits": self.esperas_presupuesto,
+                "verification_budget_1m": self.presupuesto_verificacion,
+                "verifications_skipped": self.verificaciones_omitidas,
+            }
+
+
+def _copiar_resultado(origen, destino):
+    if destino.done():
+        return
+    if origen.exception() is not None:
+        destino.set_exception(origen.exception())
+    else:
+        destino.set_result(origen.result())
@@ -0,0 +1,146 @@
+"""Tests del buffer previo al snapshot (event_buffer.py) y del reinicio del resync cuando se desborda.
+
+Corren sin red: python -m unittest discover tests
+"""
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import unittest
+from concurrent.futures import Future
+from unittest import mock
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if RAIZ not in sys.path:
+    sys.path.insert(0, RAIZ)
+
+from event_buffer import EventBuffer  # noqa: E402
+from script_loader import cargar_order_book  # noqa: E402
+
+SYMBOL = "TESTUSDT"
+
+
+def evento(u, precio="100.0", qty="1.0"):
+    """Depth update de un solo update id (U == u, pu == u - 1)"""
+    return {"e": "depthUpdate", "E": 0, "T": 0, "s": SYMBOL, "U": u, "u": u, "pu": u - 1,
+            "b": [[precio, qty]], "a": []}
+
+
+def snapshot(last_update_id):
+    return {"lastUpdateId": last_update_id, "bids": [["99.0", "2.0"]], "asks": [["101.0", "3.0"]]}
+
+
+class TestEventBuffer(unittest.TestCase):
+    def test_rafaga_mayor_que_max_eventos(self):
+        buffer = EventBuffer(max_eventos=1000, max_edad=60)
+        resultados = [buffer.append(evento(u), ahora=0.0) for u in range(1, 5001)]
+
+        self.assertLessEqual(len(buffer), 1000)
+        self.assertEqual(buffer.desbordes, 4)
+        self.assertEqual(resultados.count(False), 4)
+        # Después del último desborde quedan los eventos más nuevos, en orden
+        self.assertEqual([data['u'] for data in buffer][-1], 5000)
+        self.assertEqual(buffer.primero()['u'], 4001)
+
+    def test_descarta_eventos_viejos(self):
+        buffer = EventBuffer(max_eventos=100, max_edad=10)
+        for u in range(1, 6):
+            buffer.append(evento(u), ahora=float(u))
+        buffer.append(evento(6), ahora=13.5)  # Los recibidos antes de 3.5 tienen más de 10 s
+
+        self.assertEqual([data['u'] for data in buffer], [4, 5, 6])
+        self.assertEqual(buffer.desbordes, 0)
+
+    def test_descartar_hasta(self):
+        buffer = EventBuffer()
+        for u in range(1, 11):
+            buffer.append(evento(u))
+        buffer.descartar_hasta(7)
+
+        self.assertEqual(buffer.primero()['u'], 7)
+        self.assertEqual(len(buffer), 4)
+        buffer.descartar_hasta(100)
+        self.assertIsNone(buffer.primero())
+
+
+class TestDesbordeDuranteResync(unittest.TestCase):
+    """Un desborde con un snapshot en vuelo descarta ese snapshot y pide otro"""
+
+    MAX_EVENTOS = 50
+
+    def setUp(self):
+        self.ob = cargar_order_book()
+        self.ob.tick_sizes[SYMBOL] = "0.1"
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.ob.configurar_simbolos([SYMBOL])
+        self.book = self.ob.order_books[SYMBOL]
+        self.book['buffer'].max_eventos = self.MAX_EVENTOS
+        self.u = 0
+        self.pedidos = []  # lastUpdateId de cada snapshot entregado
+        self.recibir(1)
+
+    def recibir(self, cantidad):
+        for _ in range(cantidad):
+            self.u += 1
+            with self.book['lock']:
+                self.ob.procesar_evento(SYMBOL, self.book, evento(self.u))
+
+    def siguiente_snapshot(self):
+        """Primer pedido: el buffer se desborda mientras el snapshot está en vuelo"""
+        if not self.pedidos:
+            last_update_id = self.u
+            self.recibir(self.MAX_EVENTOS + 10)
+        else:
+            last_update_id = self.u - 2  # Queda dentro del buffer: se puede enlazar
+        self.pedidos.append(last_update_id)
+        return snapshot(last_update_id)
+
+    def verificar_resync(self, salida):
+        self.assertEqual(len(self.pedidos), 2)
+        self.assertEqual(self.book['buffer'].desbordes, 1)
+        self.assertIn("desbordado durante el snapshot", salida)
+        # Se cargó el segundo snapshot, no el que quedó sin eventos para enlazarse
+        self.assertEqual(self.book['lastUpdateId'], self.pedidos[1])
+        self.assertTrue(self.book['initialized'])
+        self.assertEqual(self.book['last_u'], self.u)
+        self.assertEqual(self.book['resync'], "inactivo")
+
+    def test_initialize_order_book(self):
+        self.assertTrue(self.ob.reservar_resync(SYMBOL))
+        salida = io.StringIO()
+        with mock.patch.object(self.ob, "get_order_book_snapshot", lambda symbol: self.siguiente_snapshot()), \
+                contextlib.redirect_stdout(salida):
+            self.ob.initialize_order_book(SYMBOL)
+        self.verificar_resync(salida.getvalue())
+
+    def test_initialize_order_book_async(self):
+        test = self
+
+        class Planificador:
+            def solicitar(self, symbol, prioridad=None):
+                futuro = Future()
+                futuro.set_result(test.siguiente_snapshot())
+                return futuro
+
+        self.assertTrue(self.ob.reservar_resync(SYMBOL))
+        salida = io.StringIO()
+        with mock.patch.object(self.ob, "snapshot_scheduler", Planificador()), contextlib.redirect_stdout(salida):
+            asyncio.run(self.ob.initialize_order_book_async(SYMBOL))
+        self.verificar_resync(salida.getvalue())
+
+    def test_desborde_sin_resync_en_curso_programa_uno(self):
+        # Reintentos agotados: el libro espera sin resync y el buffer se llena
+        self.book['resync'] = "fallido"
+        programados = []
+        with mock.patch.object(self.ob, "resync_externo", programados.append), \
+                contextlib.redirect_stdout(io.StringIO()):
+            self.recibir(self.MAX_EVENTOS)
+
+        self.assertEqual(programados, [SYMBOL])
+        self.assertEqual(self.book['buffer'].desbordes, 1)
+        self.assertEqual(self.book['buffer'].primero()['u'], self.u)
+
+
+if __name__ == "__main__":
+    unittest.main()
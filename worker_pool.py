@@ -0,0 +1,509 @@
+"""Modo multiproceso: reparte los símbolos entre N procesos worker de `order book.py`.
+
+Cada worker es un `order book.py` completo con su parte de los símbolos (sus
+conexiones WebSocket, libros, snapshots y resyncs), así el parseo y la aplicación
+de los diffs de un worker no compiten por el GIL con los de los demás. La API de
+cada worker escucha en un socket Unix (en Windows, en un puerto TCP de 127.0.0.1) y
+el proceso frontal, el único que escucha en el puerto público, reenvía cada pedido
+de un símbolo al worker dueño con un cliente HTTP/1.1 mínimo con keep-alive: la
+respuesta (JSON, binaria o 304 con ETag) pasa tal cual, sin volver a serializarla.
+/health, /symbols y /metrics se arman juntando las respuestas de todos los workers.
+
+El frontal relanza los workers que se caen (con espera creciente si se caen apenas
+arrancan) y cada worker termina solo si el frontal desaparece.
+"""
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, Response
+
+from metrics import MEDIA_TYPE_PROMETHEUS, MetricasAPI, MiddlewareMetricas, TextoPrometheus
+
+try:
+    import websockets
+except ImportError:  # Dependencia opcional, solo necesaria para reenviar el streaming
+    websockets = None
+
+# Sockets Unix para la API de los workers (más rápidos que TCP local); en Windows, TCP en 127.0.0.1
+USA_UDS = hasattr(socket, "AF_UNIX") and sys.platform != "win32"
+
+# Cabeceras del cliente que se pasan al worker y de la respuesta que se devuelven
+CABECERAS_PEDIDO = ("accept", "if-none-match")
+CABECERAS_RESPUESTA = ("content-type", "etag")
+
+# Conexiones keep-alive guardadas por worker y timeout de cada pedido (s)
+CONEXIONES_POR_WORKER = 64
+TIMEOUT_PEDIDO = 10
+
+# Relanzamiento de workers caídos: espera inicial, máxima y tiempo vivo para considerarlo estable (s)
+REINICIO_ESPERA_BASE = 0.5
+REINICIO_ESPERA_MAX = 30
+REINICIO_ESTABLE = 10
+
+
+def repartir_simbolos(simbolos, n):
+    """Reparto round-robin: los primeros símbolos (suelen ser los de más volumen) quedan en workers distintos"""
+    return [grupo for grupo in (simbolos[i::n] for i in range(n)) if grupo]
+
+
+class ClienteLocal:
+    """Cliente HTTP/1.1 mínimo (solo GET) con conexiones keep-alive hacia la API de un worker"""
+
+    def __init__(self, uds=None, puerto=None, max_conexiones=CONEXIONES_POR_WORKER):
+        self.uds = uds
+        self.puerto = puerto
+        self.max_conexiones = max_conexiones
+        self.libres = []  # (reader, writer) listos para reutilizar
+
+    async def _abrir(self):
+        if self.uds is not None:
+            return await asyncio.open_unix_connection(self.uds)
+        return await asyncio.open_connection("127.0.0.1", self.puerto)
+
+    async def get(self, ruta, cabeceras=None):
+        """(status, cabeceras en minúsculas, cuerpo) de un GET a la API del worker"""
+        while self.libres:
+            conexion = self.libres.pop()
+            try:
+                return await self._pedir(conexion, ruta, cabeceras)
+            except (OSError, asyncio.IncompleteReadError, ValueError):
+                # Conexión keep-alive que el worker cerró (o el worker se reinició): se prueba otra
+                conexion[1].close()
+        return await self._pedir(await self._abrir(), ruta, cabeceras)
+
+    async def _pedir(self, conexion, ruta, cabeceras):
+        reader, writer = conexion
+        try:
+            pedido = [f"GET {ruta} HTTP/1.1", "Host: worker"]
+            pedido.extend(f"{nombre}: {valor}" for nombre, valor in (cabeceras or {}).items())
+            writer.write(("\r\n".join(pedido) + "\r\n\r\n").encode("latin-1"))
+            await writer.drain()
+
+            inicio = await reader.readuntil(b"\r\n\r\n")
+            lineas = inicio.decode("latin-1").split("\r\n")
+            status = int(lineas[0].split(" ", 2)[1])
+            respuesta = {}
+            for linea in lineas[1:]:
+                if linea:
+                    nombre, _, valor = linea.partition(":")
+                    respuesta[nombre.strip().lower()] = valor.strip()
+            largo = respuesta.get("content-length")
+            if largo is None and status not in (204, 304):
+                raise ValueError("respuesta sin Content-Length")
+            cuerpo = await reader.readexactly(int(largo)) if largo else b""
+        except BaseException:
+            writer.close()
+            raise
+
+        if respuesta.get("connection", "").lower() == "close" or len(self.libres) >= self.max_conexiones:
+            writer.close()
+        else:
+            self.libres.append(conexion)
+        return status, respuesta, cuerpo
+
+    def cerrar(self):
+        for _, writer in self.libres:
+            writer.close()
+        self.libres.clear()
+
+
+class Worker:
+    """Un proceso `order book.py` con su parte de los símbolos"""
+
+    def __init__(self, worker_id, simbolos, script, entorno, argumentos=()):
+        self.worker_id = worker_id
+        self.simbolos = simbolos
+        self.script = script
+        self.entorno = entorno
+        self.argumentos_extra = list(argumentos)
+        if USA_UDS:
+            self.uds = os.path.join(tempfile.gettempdir(), f"orderbook_{os.getpid()}_w{worker_id}.sock")
+            self.puerto = None
+        else:
+            self.uds = None
+            with socket.socket() as s:
+                s.bind(("127.0.0.1", 0))
+                self.puerto = s.getsockname()[1]
+        self.cliente = ClienteLocal(self.uds, self.puerto)
+        self.proceso = None
+        self.iniciado = None
+        self.reinicios = 0
+        self.fallos_seguidos = 0
+        self.proximo_inicio = None  # Relanzamiento programado tras una caída
+
+    def argumentos(self):
+        args = [sys.executable, self.script, "--simbolos", ",".join(self.simbolos),
+                "--worker", str(self.worker_id), *self.argumentos_extra]
+        if self.uds is not None:
+            return args + ["--uds", self.uds]
+        return args + ["--host", "127.0.0.1", "--puerto", str(self.puerto)]
+
+    def iniciar(self):
+        if self.uds is not None and os.path.exists(self.uds):
+            os.remove(self.uds)
+        self.cliente.cerrar()
+        self.proceso = subprocess.Popen(self.argumentos(), env=self.entorno, stdin=subprocess.DEVNULL)
+        self.iniciado = time.monotonic()
+
+    def vivo(self):
+        return self.proceso is not None and self.proceso.poll() is None
+
+    def terminar(self):
+        """Pide al proceso que termine sin esperarlo"""
+        self.cliente.cerrar()
+        if self.vivo():
+            self.proceso.terminate()
+
+    def esperar(self, timeout=10):
+        if self.proceso is not None:
+            try:
+                self.proceso.wait(timeout)
+            except subprocess.TimeoutExpired:
+                self.proceso.kill()
+                self.proceso.wait()
+        if self.uds is not None and os.path.exists(self.uds):
+            os.remove(self.uds)
+
+    def estado(self):
+        return {
+            "worker": self.worker_id,
+            "pid": self.proceso.pid if self.proceso is not None else None,
+            "alive": self.vivo(),
+            "restarts": self.reinicios,
+            "symbols": len(self.simbolos),
+            "address": self.uds if self.uds is not None else f"127.0.0.1:{self.puerto}",
+        }
+
+
+class PoolWorkers:
+    """Lanza, vigila y consulta los workers; sabe qué worker es dueño de cada símbolo.
+
+    Cada worker recibe una parte de los hilos de snapshot para que entre todos no
+    superen los del modo de un solo proceso, y verifica sus libros con un intervalo
+    N veces mayor (en total se piden los mismos snapshots de verificación). El peso
+    REST no se reparte: el límite de Binance es por IP y cada SnapshotScheduler ya
+    toma el peso usado por todo el equipo de la cabecera X-MBX-USED-WEIGHT-1M.
+    """
+
+    def __init__(self, simbolos, n, script, snapshot_trabajadores=8, grabacion_dir=None, argumentos=(),
+                 verificacion_intervalo=0):
+        self.simbolos = list(simbolos)
+        grupos = repartir_simbolos(self.simbolos, max(1, n))
+        self.workers = [
+            Worker(i, grupo, script,
+                   self._entorno(i, len(grupos), snapshot_trabajadores, grabacion_dir, verificacion_intervalo),
+                   argumentos)
+            for i, grupo in enumerate(grupos, 1)
+        ]
+        self.dueno = {symbol: worker for worker in self.workers for symbol in worker.simbolos}
+
+    @staticmethod
+    def _entorno(worker_id, n, snapshot_trabajadores, grabacion_dir, verificacion_intervalo):
+        entorno = {**os.environ, "ORDERBOOK_WORKERS": "1",
+                   "ORDERBOOK_SNAPSHOT_WORKERS": str(max(1, snapshot_trabajadores // n)),
+                   # Entre todos los workers se verifica al mismo ritmo que un solo proceso
+                   "ORDERBOOK_VERIFICACION_INTERVALO": str(verificacion_intervalo * n)}
+        if grabacion_dir:
+            # Cada worker graba en su propio subdirectorio (replay.py lee uno por vez)
+            entorno["ORDERBOOK_GRABACION_DIR"] = os.path.join(grabacion_dir, f"worker{worker_id}")
+        return entorno
+
+    def iniciar(self):
+        print(f"🧩 Lanzando {len(self.workers)} worker(s) para {len(self.simbolos)} símbolos...", flush=True)
+        for worker in self.workers:
+            worker.iniciar()
+            print(f"   • Worker #{worker.worker_id} (pid {worker.proceso.pid}): {len(worker.simbolos)} símbolos",
+                  flush=True)
+
+    def detener(self):
+        """Termina todos los workers a la vez y los espera (se puede llamar más de una vez)"""
+        for worker in self.workers:
+            worker.terminar()
+        for worker in self.workers:
+            worker.esperar()
+
+    def worker_de(self, symbol):
+        return self.dueno.get(symbol)
+
+    async def supervisar(self, intervalo=1.0):
+        """Relanza los workers caídos, con espera creciente si se caen apenas arrancan"""
+        while True:
+            await asyncio.sleep(intervalo)
+            ahora = time.monotonic()
+            for worker in self.workers:
+                if worker.vivo():
+                    continue
+                if worker.proximo_inicio is None:
+                    estable = ahora - worker.iniciado >= REINICIO_ESTABLE
+                    worker.fallos_seguidos = 1 if estable else worker.fallos_seguidos + 1
+                    espera = min(REINICIO_ESPERA_MAX, REINICIO_ESPERA_BASE * 2 ** (worker.fallos_seguidos - 1))
+                    print(f"💥 Worker #{worker.worker_id} terminó (código {worker.proceso.returncode}), "
+                          f"relanzando en {espera:.1f}s", flush=True)
+                    worker.proximo_inicio = ahora + espera
+                elif ahora >= worker.proximo_inicio:
+                    worker.proximo_inicio = None
+                    worker.reinicios += 1
+                    worker.iniciar()
+
+    async def consultar_todos(self, ruta):
+        """[(worker, status, cuerpo)] de todos los workers; status None si el worker no respondió"""
+        async def consultar(worker):
+            try:
+                status, _, cuerpo = await asyncio.wait_for(worker.cliente.get(ruta), TIMEOUT_PEDIDO)
+                return worker, status, cuerpo
+            except (OSError, ValueError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+                return worker, None, None
+        return await asyncio.gather(*(consultar(worker) for worker in self.workers))
+
+
+# ===== FUSIÓN DE RESPUESTAS =====
+def _json_o_none(status, cuerpo):
+    if status != 200:
+        return None
+    try:
+        return json.loads(cuerpo)
+    except ValueError:
+        return None
+
+
+def fusionar_health(pool, respuestas):
+    """/health de todos los workers en uno: totales sumados y el detalle por worker"""
+    initialized = 0
+    workers = []
+    for worker, status, cuerpo in respuestas:
+        datos = _json_o_none(status, cuerpo)
+        detalle = worker.estado()
+        if datos is None:
+            detalle["status"] = "unreachable"
+        else:
+            initialized += datos["initialized"]
+            detalle.update(status=datos["status"], initialized=datos["initialized"],
+                           snapshots=datos.get("snapshots"), resync=datos.get("resync"),
+                           response_cache=datos.get("response_cache"), recorder=datos.get("recorder"),
+                           books=datos.get("books"), verification=datos.get("verification"))
+        workers.append(detalle)
+
+    total = len(pool.simbolos)
+    percentage = (initialized / total * 100) if total > 0 else 0
+    status = "healthy" if initialized == total else "partial" if initialized > 0 else "unhealthy"
+    return {
+        "status": status,
+        "initialized": initialized,
+        "total": total,
+        "percentage": round(percentage, 2),
+        "workers": workers,
+    }
+
+
+def fusionar_symbols(pool, respuestas):
+    """/symbols de todos los workers, en el orden configurado (los de un worker caído, pendientes)"""
+    listos = set()
+    for _, status, cuerpo in respuestas:
+        datos = _json_o_none(status, cuerpo)
+        if datos is not None:
+            listos.update(datos["initialized"])
+    initialized = [s for s in pool.simbolos if s in listos]
+    pending = [s for s in pool.simbolos if s not in listos]
+    return {
+        "total": len(pool.simbolos),
+        "symbols": pool.simbolos,
+        "initialized": initialized,
+        "pending": pending,
+        "initialized_count": len(initialized),
+        "pending_count": len(pending),
+        "workers": {str(worker.worker_id): worker.simbolos for worker in pool.workers},
+    }
+
+
+def _con_etiqueta(linea, etiqueta):
+    """'nombre{a="b"} 1' -> 'nombre{worker="1",a="b"} 1' (también sin etiquetas previas)"""
+    espacio = linea.find(" ")
+    llave = linea.find("{", 0, espacio)
+    if llave >= 0:
+        return f"{linea[:llave + 1]}{etiqueta},{linea[llave + 1:]}"
+    return f"{linea[:espacio]}{{{etiqueta}}}{linea[espacio:]}"
+
+
+def fusionar_metricas(fuentes):
+    """Junta exposiciones de texto de Prometheus por familia.
+
+    `fuentes` es [(worker, texto)]: a cada muestra se le agrega la etiqueta
+    worker="<worker>" (None = sin etiqueta extra, para las métricas del propio frontal).
+    """
+    familias = {}  # nombre -> {"HELP": ..., "TYPE": ..., "lineas": [...]}
+    for worker, texto in fuentes:
+        etiqueta = None if worker is None else f'worker="{worker}"'
+        familia = None
+        for linea in texto.splitlines():
+            if linea.startswith("# HELP ") or linea.startswith("# TYPE "):
+                _, clave, nombre, resto = (linea.split(" ", 3) + [""])[:4]
+                familia = familias.setdefault(nombre, {"HELP": "", "TYPE": "", "lineas": []})
+                familia[clave] = familia[clave] or resto
+            elif linea and not linea.startswith("#") and familia is not None:
+                familia["lineas"].append(linea if etiqueta is None else _con_etiqueta(linea, etiqueta))
+
+    salida = []
+    for nombre, familia in familias.items():
+        if familia["HELP"]:
+            salida.append(f"# HELP {nombre} {familia['HELP']}")
+        if familia["TYPE"]:
+            salida.append(f"# TYPE {nombre} {familia['TYPE']}")
+        salida.extend(familia["lineas"])
+    return "\n".join(salida) + "\n"
+
+
+# ===== API FRONTAL =====
+def crear_app_frontal(pool, endpoints, metricas=True):
+    """App FastAPI del proceso frontal: reenvía cada símbolo a su worker y fusiona el resto"""
+    metricas_api = MetricasAPI()
+
+    @asynccontextmanager
+    async def ciclo_de_vida(app):
+        supervisor = asyncio.create_task(pool.supervisar())
+        yield
+        supervisor.cancel()
+        # Acá y no al volver de uvicorn.run: tras un SIGTERM uvicorn vuelve a lanzar la señal al salir
+        print("🛑 Deteniendo workers...", flush=True)
+        await asyncio.to_thread(pool.detener)
+
+    app = FastAPI(lifespan=ciclo_de_vida)
+    if metricas:
+        app.add_middleware(MiddlewareMetricas, metricas=metricas_api)
+
+    def no_monitoreado(symbol):
+        return JSONResponse(status_code=404, content={
+            "error": f"Símbolo {symbol} no monitoreado",
+            "available_symbols": pool.simbolos,
+        })
+
+    async def reenviar(request: Request, symbol: str):
+        """Pasa el pedido al worker dueño del símbolo y devuelve su respuesta sin tocarla"""
+        worker = pool.worker_de(symbol.upper())
+        if worker is None:
+            return no_monitoreado(symbol.upper())
+        ruta = request.url.path + (f"?{request.url.query}" if request.url.query else "")
+        cabeceras = {nombre: request.headers[nombre] for nombre in CABECERAS_PEDIDO if nombre in request.headers}
+        try:
+            status, respuesta, cuerpo = await asyncio.wait_for(worker.cliente.get(ruta, cabeceras), TIMEOUT_PEDIDO)
+        except (OSError, ValueError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+            return JSONResponse(status_code=503, content={
+                "error": f"El worker #{worker.worker_id} de {symbol.upper()} no responde",
+                "status": "restarting" if not worker.vivo() else "unreachable",
+            })
+        return Response(content=cuerpo, status_code=status,
+                        headers={nombre: respuesta[nombre] for nombre in CABECERAS_RESPUESTA if nombre in respuesta})
+
+    @app.get("/")
+    async def root():
+        """Endpoint raíz con información del sistema"""
+        return {
+            "status": "running",
+            "workers": len(pool.workers),
+            "total_symbols": len(pool.simbolos),
+            "symbols": pool.simbolos,
+            "endpoints": endpoints,
+        }
+
+    @app.get("/health")
+    async def health_check():
+        return fusionar_health(pool, await pool.consultar_todos("/health"))
+
+    @app.get("/symbols")
+    async def get_symbols():
+        return fusionar_symbols(pool, await pool.consultar_todos("/symbols"))
+
+    @app.get("/metrics")
+    async def get_metrics():
+        """Métricas de todos los workers con la etiqueta worker, más las del frontal"""
+        fuentes = [(worker.worker_id, cuerpo.decode())
+                   for worker, status, cuerpo in await pool.consultar_todos("/metrics") if status == 200]
+
+        texto = TextoPrometheus()
+        for worker in pool.workers:
+            etiqueta = {"worker": worker.worker_id}
+            texto.muestra("orderbook_worker_up", worker.vivo(), etiqueta, ayuda="1 si el proceso worker está vivo")
+            texto.contador("orderbook_worker_restarts_total", worker.reinicios, etiqueta,
+                           ayuda="Veces que se relanzó el worker")
+            texto.muestra("orderbook_worker_symbols", len(worker.simbolos), etiqueta,
+                          ayuda="Símbolos asignados al worker")
+        fuentes.append((None, texto.render()))
+        if metricas:
+            frontal = TextoPrometheus()
+            for ruta, (histograma, por_status) in list(metricas_api.rutas.items()):
+                frontal.histograma("orderbook_api_request_duration_seconds", histograma, {"route": ruta},
+                                   ayuda="Latencia de la API por ruta")
+                for status, cantidad in list(por_status.items()):
+                    frontal.contador("orderbook_api_requests_total", cantidad, {"route": ruta, "status": status},
+                                     ayuda="Requests de la API por ruta y status")
+            fuentes.append(("frontal", frontal.render()))
+        return Response(content=fusionar_metricas(fuentes), media_type=MEDIA_TYPE_PROMETHEUS)
+
+    @app.get("/orderbooks/{symbol}")
+    async def get_orderbook(request: Request, symbol: str):
+        return await reenviar(request, symbol)
+
+    @app.get("/orderbooks/{symbol}/diff")
+    async def get_orderbook_diff(request: Request, symbol: str):
+        return await reenviar(request, symbol)
+
+    @app.get("/orderbooks/{symbol}/blocks")
+    async def get_orderbook_blocks(request: Request, symbol: str):
+        return await reenviar(request, symbol)
+
+    @app.get("/price/{symbol}")
+    async def get_price(request: Request, symbol: str):
+        return await reenviar(request, symbol)
+
+    @app.websocket("/ws/orderbooks/{symbol}")
+    async def stream_orderbook(websocket: WebSocket, symbol: str):
+        """Une el WebSocket del cliente con el del worker dueño y copia los mensajes en ambos sentidos"""
+        worker = pool.worker_de(symbol.upper())
+        if worker is None:
+            await websocket.close(code=4404)
+            return
+        if websockets is None:
+            print("⚠️ Reenviar el streaming requiere el paquete 'websockets' (pip install websockets)", flush=True)
+            await websocket.close(code=1011)
+            return
+
+        ruta = websocket.url.path + (f"?{websocket.url.query}" if websocket.url.query else "")
+        try:
+            if worker.uds is not None:
+                conexion = websockets.unix_connect(worker.uds, f"ws://worker{ruta}")
+            else:
+                conexion = websockets.connect(f"ws://127.0.0.1:{worker.puerto}{ruta}")
+            async with conexion as destino:
+                await websocket.accept()
+
+                async def subir():
+                    while True:
+                        await destino.send(await websocket.receive_text())
+
+                async def bajar():
+                    async for mensaje in destino:
+                        await websocket.send_text(mensaje)
+
+                tareas = [asyncio.create_task(subir()), asyncio.create_task(bajar())]
+                hechas, pendientes = await asyncio.wait(tareas, return_when=asyncio.FIRST_COMPLETED)
+                for tarea in pendientes:
+                    tarea.cancel()
+                for tarea in hechas:
+                    tarea.exception()  # Desconexiones esperadas: solo se marcan como vistas
+                if tareas[1] in hechas:
+                    # El worker cerró (cliente lento, símbolo desconocido, reinicio): se propaga el código
+                    await websocket.close(code=destino.close_code or 1000)
+        except (OSError, websockets.exceptions.WebSocketException, WebSocketDisconnect, RuntimeError):
+            try:
+                await websocket.close(code=1011)
+            except RuntimeError:
+                pass
+
+    return app
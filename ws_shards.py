@@ -0,0 +1,211 @@
+import json
+import threading
+import time
+
+import websocket
+
+BINANCE_WS_URL = "wss://fstream.binance.com"
+
+
+class StreamShard:
+    """Una conexión WebSocket combinada que transporta los streams de varios símbolos"""
+
+    def __init__(self, shard_id, symbols):
+        self.shard_id = shard_id
+        self.symbols = list(symbols)
+        self.ws = None
+        self.connected = False
+        self.conexiones = 0
+        self.thread = None
+
+    def __repr__(self):
+        return f"<Shard #{self.shard_id} {len(self.symbols)} símbolos>"
+
+
+class ShardedStreamManager:
+    """Multiplexa todos los símbolos sobre conexiones `/stream?streams=` de Binance.
+
+    Cada conexión (shard) lleva como máximo `streams_por_conexion` streams. Si un
+    shard se cae solo se invalidan sus propios símbolos (`on_shard_down`); antes de
+    reconectar se intenta mover esos símbolos a otros shards conectados con espacio
+    libre mediante SUBSCRIBE, y el resto se reconecta en el mismo shard. Cuando los
+    símbolos vuelven a estar suscritos se llama a `on_resubscribed` para que se
+    resincronicen solo esos libros.
+    """
+
+    def __init__(self, symbols, on_message, on_shard_down=None, on_resubscribed=None,
+                 streams_por_conexion=50, sufijos=("depth@100ms",), url_base=BINANCE_WS_URL,
+                 backoff_inicial=0.5, backoff_maximo=30):
+        self.on_message = on_message
+        self.on_shard_down = on_shard_down
+        self.on_resubscribed = on_resubscribed
+        self.sufijos = tuple(sufijos)
+        self.url_base = url_base.rstrip('/')
+        self.backoff_inicial = backoff_inicial
+        self.backoff_maximo = backoff_maximo
+        # Capacidad en símbolos: cada símbolo ocupa un stream por sufijo
+        self.symbols_por_conexion = max(1, streams_por_conexion // len(self.sufijos))
+        self.lock = threading.Lock()
+        self.shards = []
+        self._running = False
+        self._next_request_id = 1
+
+        symbols = list(symbols)
+        for i in range(0, len(symbols), self.symbols_por_conexion):
+            self.shards.append(StreamShard(len(self.shards) + 1, symbols[i:i + self.symbols_por_conexion]))
+
+    # ----- Streams -----
+    def streams_de(self, symbols):
+        return [f"{symbol.lower()}@{sufijo}" for symbol in symbols for sufijo in self.sufijos]
+
+    def url_de(self, shard):
+        return f"{self.url_base}/stream?streams={'/'.join(self.streams_de(shard.symbols))}"
+
+    def shard_de(self, symbol):
+        with self.lock:
+            for shard in self.shards:
+                if symbol in shard.symbols:
+                    return shard
+        return None
+
+    # ----- Ciclo de vida -----
+    def start(self):
+        """Lanza un hilo por shard (no por símbolo)"""
+        self._running = True
+        print(f"🚀 Iniciando {len(self.shards)} conexión(es) WebSocket para "
+              f"{sum(len(s.symbols) for s in self.shards)} símbolos "
+              f"(máx. {self.symbols_por_conexion} símbolos por conexión)...", flush=True)
+        for shard in self.shards:
+            shard.thread = threading.Thread(target=self._run_shard, args=(shard,), daemon=True)
+            shard.thread.start()
+
+    def stop(self):
+        self._running = False
+        with self.lock:
+            shards = list(self.shards)
+        for shard in shards:
+            if shard.ws is not None:
+                shard.ws.close()
+
+    def _run_shard(self, shard):
+        backoff = self.backoff_inicial
+
+        while self._running:
+            with self.lock:
+                if not shard.symbols:
+                    # Todos sus símbolos fueron migrados a otros shards
+                    self.shards.remove(shard)
+                    print(f"🧹 [Shard #{shard.shard_id}] Sin símbolos, cerrando", flush=True)
+                    return
+                symbols = list(shard.symbols)
+
+            shard.conexiones += 1
+            reconexion = shard.conexiones > 1
+            etiqueta = f"Shard #{shard.shard_id}"
+            if reconexion:
+                print(f"🔄 [{etiqueta}] Reconectando {len(symbols)} símbolos (intento #{shard.conexiones})...", flush=True)
+            else:
+                print(f"🔌 [{etiqueta}] Conectando {len(symbols)} símbolos...", flush=True)
+
+            def on_open_handler(_):
+                nonlocal backoff
+                backoff = self.backoff_inicial
+                shard.connected = True
+                print(f"✅ [{etiqueta}] WebSocket conectado ({len(symbols)} símbolos)", flush=True)
+                if reconexion and self.on_resubscribed:
+                    self.on_resubscribed(symbols)
+
+            def on_error_handler(_, error):
+                print(f"⚠️ [{etiqueta}] Error WS: {error}", flush=True)
+
+            def on_close_handler(*args):
+                close_code = args[1] if len(args) > 1 else 'N/A'
+                print(f"❌ [{etiqueta}] WebSocket desconectado (código: {close_code})", flush=True)
+
+            try:
+                shard.ws = websocket.WebSocketApp(
+                    self.url_de(shard),
+                    on_open=on_open_handler,
+                    on_message=self.on_message,
+                    on_error=on_error_handler,
+                    on_close=on_close_handler,
+                )
+                # Sin ping/pong - Binance maneja keep-alive automáticamente
+                shard.ws.run_forever()
+            except Exception as e:
+                print(f"💥 [{etiqueta}] Excepción en WebSocket: {e}", flush=True)
+
+            shard.connected = False
+            shard.ws = None
+            if not self._running:
+                return
+
+            # Solo se invalidan los símbolos de este shard
+            with self.lock:
+                caidos = list(shard.symbols)
+            if self.on_shard_down:
+                self.on_shard_down(caidos)
+
+            self._rebalancear(shard)
+
+            print(f"⏳ [{etiqueta}] Esperando {backoff:.1f}s antes de reconectar...", flush=True)
+            time.sleep(backoff)
+            backoff = min(backoff * 2, self.backoff_maximo)
+
+    # ----- Rebalanceo -----
+    def _planificar_migraciones(self, shard_caido):
+        """Reparte los símbolos del shard caído entre shards conectados con capacidad libre"""
+        migraciones = []
+        with self.lock:
+            for destino in self.shards:
+                if destino is shard_caido or not destino.connected or destino.ws is None:
+                    continue
+                libres = self.symbols_por_conexion - len(destino.symbols)
+                if libres <= 0 or not shard_caido.symbols:
+                    continue
+                mover = shard_caido.symbols[:libres]
+                del shard_caido.symbols[:len(mover)]
+                destino.symbols.extend(mover)
+                migraciones.append((destino, mover, self._next_request_id))
+                self._next_request_id += 1
+        return migraciones
+
+    def _mensaje_subscribe(self, symbols, request_id):
+        return json.dumps({"method": "SUBSCRIBE", "params": self.streams_de(symbols), "id": request_id})
+
+    def _migracion_ok(self, shard_caido, destino, mover):
+        print(f"🔀 [Shard #{destino.shard_id}] {len(mover)} símbolo(s) migrados desde "
+              f"Shard #{shard_caido.shard_id}: {', '.join(mover)}", flush=True)
+        if self.on_resubscribed:
+            self.on_resubscribed(mover)
+
+    def _migracion_fallida(self, shard_caido, destino, mover, error):
+        # Si el destino también falló, devolver los símbolos al shard original
+        print(f"⚠️ [Shard #{destino.shard_id}] No se pudo migrar: {error}", flush=True)
+        with self.lock:
+            for symbol in mover:
+                if symbol in destino.symbols:
+                    destino.symbols.remove(symbol)
+            shard_caido.symbols.extend(mover)
+
+    def _rebalancear(self, shard_caido):
+        """Mueve los símbolos del shard caído a shards conectados con capacidad libre"""
+        for destino, mover, request_id in self._planificar_migraciones(shard_caido):
+            try:
+                destino.ws.send(self._mensaje_subscribe(mover, request_id))
+                self._migracion_ok(shard_caido, destino, mover)
+            except Exception as e:
+                self._migracion_fallida(shard_caido, destino, mover, e)
+
+    def estado(self):
+        """Resumen de shards para logs y endpoints"""
+        with self.lock:
+            return [
+                {
+                    "shard": shard.shard_id,
+                    "connected": shard.connected,
+                    "symbols": len(shard.symbols),
+                    "connections": shard.conexiones,
+                }
+                for shard in self.shards
+            ]